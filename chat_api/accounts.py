@@ -0,0 +1,86 @@
+"""
+User account creation.
+
+Usernames are derived from the email's local part and made unique with a
+numeric suffix ('info', 'info1', 'info2', ...). The next free suffix is
+found with one aggregate query over the usernames already taken, however
+many there are, and a registration that loses the race for it to a
+concurrent one retries in a new transaction, which sees the winner's
+username and picks the next.
+"""
+import random
+import re
+import time
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import IntegerField, Max, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Substr
+
+from .login import hash_password
+from .models import UserProfile
+
+USERNAME_ATTEMPTS = 5
+
+
+def taken_usernames(base):
+    """
+    Users named `base` or `base` followed by digits. The range bounds let
+    SQLite probe the username index (':' sorts right after '9'); the regex
+    only filters the rows in that range.
+    """
+    return User.objects.filter(
+        username__gte=base, username__lt=f'{base}:', username__regex=rf'^{re.escape(base)}[0-9]*$'
+    )
+
+
+def next_username_suffix(base):
+    """
+    The suffix to append to `base` for a free username: None when `base`
+    itself is free, otherwise one more than the highest suffix in use.
+    """
+    taken = taken_usernames(base).aggregate(
+        # 'base' alone counts as suffix 0
+        highest=Max(Cast(
+            Coalesce(NullIf(Substr('username', len(base) + 1), Value('')), Value('0')),
+            IntegerField()
+        ))
+    )['highest']
+    return None if taken is None else taken + 1
+
+
+def allocate_username(base):
+    suffix = next_username_suffix(base)
+    return base if suffix is None else f'{base}{suffix}'
+
+
+def create_user(email, password, fullname, language_preference):
+    """
+    Create a user and their profile: one INSERT each, with the password
+    hashed up front in the bounded hashing pool.
+    """
+    name_parts = fullname.split(' ', 1)
+    user = User(
+        email=email,
+        first_name=name_parts[0],
+        last_name=name_parts[1] if len(name_parts) > 1 else '',
+        password=hash_password(password),
+    )
+    base = email.split('@')[0]
+    for attempt in range(USERNAME_ATTEMPTS):
+        # Each attempt is its own transaction, so it picks the suffix from
+        # a fresh snapshot that includes the registrations that beat it.
+        # On SQLite a concurrent commit can also surface as a locked
+        # database rather than a duplicate username.
+        try:
+            with transaction.atomic():
+                user.username = allocate_username(base)
+                user.save(force_insert=True)
+                UserProfile.objects.create(user=user, fullname=fullname, language_preference=language_preference)
+            return user
+        except (IntegrityError, OperationalError):
+            user.pk = None
+            if attempt == USERNAME_ATTEMPTS - 1:
+                raise
+            # Jittered, so the registrations that collided do not collide again
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
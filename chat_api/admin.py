@@ -1,5 +1,9 @@
 from django.contrib import admin
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
 from .models import UserProfile, ChatMessage, Conversation, UserSummary
+from .counters import refresh_conversation_counters
+from . import search
 
 # Register models with custom admin displays
 @admin.register(UserProfile)
@@ -16,12 +20,38 @@ class ChatMessageAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'content')
     date_hierarchy = 'created_at'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Match content through the full-text index instead of LIKE '%...%'
+        match = search.matching_message_ids_sql(search_term) if search.is_available() else None
+        if match is None:
+            return super().get_search_results(request, queryset, search_term)
+        sql, params = match
+        queryset = queryset.filter(
+            Q(pk__in=RawSQL(sql, params)) | Q(user__username__icontains=search_term)
+        )
+        return queryset, False
+
+    def delete_model(self, request, obj):
+        conversation_id = obj.conversation_id
+        super().delete_model(request, obj)
+        if conversation_id:
+            refresh_conversation_counters([conversation_id])
+
+    def delete_queryset(self, request, queryset):
+        conversation_ids = set(
+            queryset.exclude(conversation=None).values_list('conversation_id', flat=True)
+        )
+        super().delete_queryset(request, queryset)
+        refresh_conversation_counters(conversation_ids)
+
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
-    list_display = ('title', 'user', 'language', 'created_at', 'updated_at')
-    list_filter = ('language',)
+    list_display = ('title', 'user', 'language', 'message_count', 'last_message_at', 'created_at', 'updated_at')
+    list_filter = ('language', ('deleted_at', admin.EmptyFieldListFilter))
     search_fields = ('title', 'user__username')
     date_hierarchy = 'created_at'
+    readonly_fields = ('message_count', 'last_message_at', 'last_message_preview', 'last_message_is_user',
+                       'deleted_at')
 
 @admin.register(UserSummary)
 class UserSummaryAdmin(admin.ModelAdmin):
@@ -0,0 +1,462 @@
+"""
+One turn of the AI chat (/api/chat/ai/), shared by the sync and async views.
+
+A turn runs in three steps, so the async view can await the model without
+holding a thread in between:
+
+1. ChatTurn.start() validates the request, creates the conversation if
+   needed, saves the user's message and builds the inference request
+   (model_path, headers, payload);
+2. the view sends it with call() or acall(), which share one upstream
+   call among identical turns in flight (see chat_api.coalesce);
+3. finish() turns the model's answer into a reply, or fail() falls back to
+   a simulated one, and saves it.
+
+Before step 2 the view calls admit(), which raises CircuitOpen while the
+model's circuit breaker is open (see chat_api.circuit); the view then
+goes straight to fail(). finish() and fail() report the call's outcome
+and latency to the breaker.
+
+A streamed turn sends stream_payload with upstream stream() or astream()
+instead, passes each event of the answer through read_event() as it
+arrives, and saves the reply once with finish_stream().
+"""
+import logging
+import random
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import NotFound, ValidationError
+
+from . import coalesce, upstream
+from .circuit import CircuitBreaker, CircuitOpen
+from .counters import record_new_message
+from .models import ChatMessage, Conversation
+from .write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+# Available models with their Hugging Face paths
+AVAILABLE_MODELS = {
+    'lamini-t5': {
+        'path': 'MBZUAI/LaMini-Flan-T5-248M',
+        'params': {
+            'max_length': 100,
+            'temperature': 0.7,
+            'top_p': 0.9,
+            'do_sample': True
+        }
+    },
+    'deepseek': {
+        'path': 'deepseek-ai/deepseek-coder-1.3b-instruct',
+        'params': {
+            'max_length': 100,
+            'temperature': 0.7,
+            'top_p': 0.9,
+            'do_sample': True
+        },
+        # Served by text-generation-inference, which can stream tokens;
+        # the other models answer in one piece
+        'stream': True
+    },
+    'blenderbot-400M': {
+        'path': 'facebook/blenderbot-400M-distill',
+        'params': {
+            'max_length': 100,
+            'temperature': 0.7,
+            'top_p': 0.9,
+            'do_sample': True
+        }
+    }
+}
+
+# Default responses for different languages
+DEFAULT_RESPONSES = {
+    'en': {
+        'greeting': "Hello! I'm an AI assistant. How can I help you today?",
+        'fallback': "I'm sorry, I couldn't generate a proper response. Could you try asking something else?",
+        'understanding': "I'm sorry, I don't understand. Could you rephrase that?",
+        'error': "Sorry, there was an error processing your request. Please try again."
+    },
+    'ar': {
+        'greeting': "مرحبًا! أنا مساعد ذكاء اصطناعي. كيف يمكنني مساعدتك اليوم؟",
+        'fallback': "آسف، لم أتمكن من إنشاء استجابة مناسبة. هل يمكنك تجربة سؤال آخر؟",
+        'understanding': "آسف، لم أفهم. هل يمكنك إعادة صياغة ذلك؟",
+        'error': "عذرًا، حدث خطأ أثناء معالجة طلبك. يرجى المحاولة مرة أخرى."
+    }
+}
+
+# Simulated responses for when the API is down
+SIMULATED_RESPONSES = {
+    'en': {
+        'greeting': [
+            "Hello! How can I assist you today?",
+            "Hi there! What can I help you with?",
+            "Greetings! How may I be of service?"
+        ],
+        'about': [
+            "I'm an AI assistant designed to help answer your questions and provide information.",
+            "I'm a language model trained to assist with various tasks and answer questions.",
+            "I'm your AI assistant, ready to help with information and tasks."
+        ],
+        'general': [
+            "That's an interesting question. Let me think about that...",
+            "I understand what you're asking. Here's what I know about that topic...",
+            "Thanks for your question. I'd be happy to help with that.",
+            "I appreciate your question. Let me provide some information on that.",
+            "That's a good point. Here's my perspective on that matter."
+        ]
+    },
+    'ar': {
+        'greeting': [
+            "مرحبًا! كيف يمكنني مساعدتك اليوم؟",
+            "أهلاً! بماذا يمكنني مساعدتك؟",
+            "تحياتي! كيف يمكنني خدمتك؟"
+        ],
+        'about': [
+            "أنا مساعد ذكاء اصطناعي مصمم للمساعدة في الإجابة على أسئلتك وتقديم المعلومات.",
+            "أنا نموذج لغوي تم تدريبه للمساعدة في مختلف المهام والإجابة على الأسئلة.",
+            "أنا مساعدك الذكي، جاهز للمساعدة في المعلومات والمهام."
+        ],
+        'general': [
+            "هذا سؤال مثير للاهتمام. دعني أفكر في ذلك...",
+            "أفهم ما تسأل عنه. إليك ما أعرفه عن هذا الموضوع...",
+            "شكرًا على سؤالك. يسعدني المساعدة في ذلك.",
+            "أقدر سؤالك. دعني أقدم بعض المعلومات حول ذلك.",
+            "هذه نقطة جيدة. إليك وجهة نظري في هذه المسألة."
+        ]
+    }
+}
+
+# Models often struggle with Arabic greetings; these get predefined replies
+ARABIC_GREETINGS = ['مرحبا', 'السلام عليكم', 'أهلا', 'صباح الخير', 'مساء الخير', 'كيف حالك', 'من أنت']
+
+
+def get_simulated_response(message, lang='en'):
+    """Generate a simulated response when the API is down"""
+    # Check for greetings
+    greeting_words = {
+        'en': ['hello', 'hi', 'hey', 'greetings', 'good morning', 'good afternoon'],
+        'ar': ['مرحبا', 'أهلا', 'السلام عليكم', 'صباح الخير', 'مساء الخير']
+    }
+
+    # Check for questions about identity
+    identity_words = {
+        'en': ['who are you', 'what are you', 'tell me about yourself', 'your name'],
+        'ar': ['من أنت', 'ما أنت', 'أخبرني عن نفسك', 'ما هو اسمك']
+    }
+
+    message_lower = message.lower()
+
+    # Select response category
+    if any(word in message_lower for word in greeting_words.get(lang, greeting_words['en'])):
+        category = 'greeting'
+    elif any(word in message_lower for word in identity_words.get(lang, identity_words['en'])):
+        category = 'about'
+    else:
+        category = 'general'
+
+    # Get responses for the selected language and category
+    responses = SIMULATED_RESPONSES.get(lang, SIMULATED_RESPONSES['en']).get(category, SIMULATED_RESPONSES['en']['general'])
+
+    # Return a random response from the category
+    return random.choice(responses)
+
+
+def create_chat_message(**fields):
+    """Create a message and bump its conversation's counters in the same transaction"""
+    message = ChatMessage.objects.create(**fields)
+    record_new_message(message)
+    return message
+
+
+class ChatTurn:
+    """A user's message to a model and the reply saved for it"""
+
+    def __init__(self, user, message_text, language, model_id, conversation, user_message):
+        self.user = user
+        self.message_text = message_text
+        self.language = language
+        self.model_id = model_id
+        self.conversation = conversation
+        self.user_message = user_message
+        # Speaker markers of the deepseek prompt
+        self.user_prefix = "المستخدم" if language == 'ar' else "User"
+        self.bot_prefix = "الروبوت" if language == 'ar' else "Bot"
+        self.breaker = CircuitBreaker(model_id)
+        # The call admitted by the breaker, until its outcome is recorded
+        self._admitted = False
+        self._probe = None
+        # Whether the response came from another turn's call
+        self._shared = False
+        self._called_at = self._answered_at = None
+        # State of a streamed answer
+        self._tokens = []
+        self._result = None
+
+    @classmethod
+    def start(cls, user, data):
+        """Validate the request data and save the user's message"""
+        message_text = data.get('message', '')
+        conversation_id = data.get('conversation_id', None)
+        language = data.get('language', 'en')
+        model_id = data.get('model', 'lamini-t5')  # Default model
+
+        if not message_text:
+            raise ValidationError({'detail': 'Message text is required.'})
+
+        # Check if model is valid
+        if model_id not in AVAILABLE_MODELS:
+            raise ValidationError({'detail': f'Invalid model. Available models: {", ".join(AVAILABLE_MODELS.keys())}'})
+
+        # Get or create conversation
+        conversation = None
+        if conversation_id:
+            try:
+                conversation = Conversation.objects.get(id=conversation_id, user=user, deleted_at__isnull=True)
+            except Conversation.DoesNotExist:
+                raise NotFound('Conversation not found.')
+
+        def write(conversation):
+            if conversation is None:
+                # Create a new conversation
+                conversation = Conversation.objects.create(
+                    user=user,
+                    title=message_text[:50] + '...' if len(message_text) > 50 else message_text,
+                    language=language
+                )
+
+            # Save user message
+            user_message = create_chat_message(
+                user=user,
+                content=message_text,
+                language=language,
+                is_user_message=True,
+                conversation=conversation  # Associate with conversation
+            )
+            return conversation, user_message
+
+        turn = cls(user, message_text, language, model_id, *run_write(write, conversation))
+        turn.payload = turn._build_payload()
+        return turn
+
+    @property
+    def model_path(self):
+        return f"models/{AVAILABLE_MODELS[self.model_id]['path']}"
+
+    @property
+    def headers(self):
+        api_key = settings.DEEPSEEK_API_KEY if self.model_id == 'deepseek' else settings.HUGGINGFACE_API_KEY
+        headers = {"Content-Type": "application/json"}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        return headers
+
+    @property
+    def stream_payload(self):
+        """The payload, asking the model to stream its answer if it can"""
+        if not AVAILABLE_MODELS[self.model_id].get('stream'):
+            return self.payload
+        return {
+            **self.payload,
+            # Stop where the model would start writing the user's next turn
+            "parameters": {**self.payload['parameters'], "stop": [f"\n{self.user_prefix}:"]},
+            "stream": True
+        }
+
+    def _build_payload(self):
+        params = AVAILABLE_MODELS[self.model_id]['params']
+        if self.model_id != 'deepseek':
+            # For other models, just send the message
+            return {
+                "inputs": self.message_text,
+                "parameters": params
+            }
+
+        # For deepseek, we need to get conversation history
+        # Take last 5 messages to avoid context length issues
+        recent_messages = ChatMessage.objects.filter(
+            user=self.user,
+            conversation=self.conversation
+        ).order_by('-created_at')[:5]
+        recent_messages = sorted(recent_messages, key=lambda x: x.created_at)
+
+        conversation_history = "\n".join([
+            f"{self.user_prefix if msg.is_user_message else self.bot_prefix}: {msg.content}"
+            for msg in recent_messages
+        ])
+        return {
+            "inputs": f"{conversation_history}\n{self.user_prefix}: {self.message_text}\n{self.bot_prefix}:",
+            "parameters": params
+        }
+
+    def admit(self):
+        """Raise CircuitOpen if the model's breaker does not let the call through"""
+        self._probe = self.breaker.admit()
+        self._admitted = True
+        self._called_at = time.monotonic()
+
+    def call(self):
+        """Send the payload to the model and return the response, sharing the call with identical turns"""
+        led, outcome = coalesce.flights.run(
+            self.flight_key,
+            lambda: upstream.huggingface.post(self.model_path, headers=self.headers, json=self.payload)
+        )
+        return self._call_outcome(led, outcome)
+
+    async def acall(self):
+        """call() for async views"""
+        led, outcome = await coalesce.async_flights.run(
+            self.flight_key,
+            lambda: upstream.huggingface.apost(self.model_path, headers=self.headers, json=self.payload)
+        )
+        return self._call_outcome(led, outcome)
+
+    @property
+    def flight_key(self):
+        return coalesce.flight_key(self.model_id, self.payload)
+
+    def _call_outcome(self, led, outcome):
+        self._shared = not led
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def _record(self, ok):
+        # A shared call is counted once, by the turn that made it, unless
+        # this turn is a half-open probe and has to report back
+        if not self._admitted or (self._shared and self._probe is None):
+            return
+        self._admitted = False
+        # A streamed answer is as slow as its first event
+        elapsed = (self._answered_at or time.monotonic()) - self._called_at
+        self.breaker.record(ok, elapsed, self._probe)
+
+    def finish(self, response):
+        """Save the reply extracted from the model's response and return the response data"""
+        if response.status_code != 200:
+            # Return a fallback response instead of an error
+            # This way the chat can continue even if the API is down
+            logger.error(f"Hugging Face API error: {response.status_code} - {response.text[:200]}")
+            return self.fail()
+        try:
+            ai_response = self._extract_reply(response.json())
+        except Exception as e:
+            return self.fail(e)
+        self._record(True)
+        return self._save_reply(ai_response)
+
+    def fail(self, error=None):
+        """Save a simulated reply, for when the model could not be reached"""
+        if isinstance(error, CircuitOpen):
+            logger.info(str(error))
+        elif error is not None:
+            logger.error(f"Error calling Hugging Face API: {str(error)}")
+        self._record(False)
+        return self._save_reply(get_simulated_response(self.message_text, self.language))
+
+    def started(self):
+        """The response data known before the model answers"""
+        return {
+            'conversation_id': self.conversation.id,
+            'model': self.model_id,
+            'user_message': {
+                'id': self.user_message.id,
+                'content': self.user_message.content,
+                'created_at': self.user_message.created_at
+            }
+        }
+
+    def read_event(self, event):
+        """The text to forward to the client for one event of a streamed answer"""
+        if self._answered_at is None:
+            self._answered_at = time.monotonic()
+        if isinstance(event, list):
+            # A model that does not stream answers in one piece
+            self._result = event
+            return self._extract_reply(event)
+        if 'error' in event:
+            # text-generation-inference reports failures mid-stream as an event
+            raise RuntimeError(f"Model error: {event['error']}")
+        token = event.get('token') or {}
+        if token.get('special'):
+            return ''
+        self._tokens.append(token.get('text', ''))
+        return self._tokens[-1]
+
+    def finish_stream(self):
+        """Save the reply extracted from the streamed answer and return the response data"""
+        result = self._result or [{'generated_text': ''.join(self._tokens)}]
+        ai_response = self._extract_reply(result)
+        self._record(True)
+        return self._save_reply(ai_response)
+
+    def _extract_reply(self, result):
+        message_text, language = self.message_text, self.language
+
+        # Special handling for Arabic greetings - models often struggle with these
+        if language == 'ar' and any(greeting in message_text.lower() for greeting in ARABIC_GREETINGS):
+            # For greeting messages in Arabic, use our predefined responses
+            if 'من أنت' in message_text.lower():
+                return "أنا مساعد ذكاء اصطناعي مصمم للمساعدة في الإجابة على أسئلتك وتقديم المعلومات. كيف يمكنني مساعدتك اليوم؟"
+            if any(greeting in message_text.lower() for greeting in ['كيف حالك', 'كيفك']):
+                return "أنا بخير، شكراً على سؤالك! كيف يمكنني مساعدتك اليوم؟"
+            return DEFAULT_RESPONSES[language]['greeting']
+
+        if self.model_id == 'lamini-t5':
+            # LaMini-T5 is better at handling different languages
+            ai_response = result[0].get('generated_text', '').strip()
+            # If response is empty, provide a fallback in the appropriate language
+            return ai_response or DEFAULT_RESPONSES[language]['fallback']
+
+        if self.model_id == 'deepseek':
+            generated_text = result[0].get('generated_text', '').strip()
+
+            # deepseek tends to return the conversation history
+            # We need to extract only the new response
+
+            # First, check if our last message is in the response
+            last_message_marker = f"{self.user_prefix}: {message_text}"
+            if last_message_marker in generated_text:
+                # Extract everything after the last occurrence of our message
+                ai_response = generated_text.split(last_message_marker)[-1].strip()
+
+                # If the response is empty or just contains the user message again
+                if not ai_response or f"{self.user_prefix}:" in ai_response:
+                    # Fallback to a simple response in the appropriate language
+                    ai_response = DEFAULT_RESPONSES[language]['fallback']
+            else:
+                # If we can't find our message, just take the last line
+                lines = [
+                    line for line in generated_text.split('\n')
+                    if line.strip() and not line.strip().startswith(f"{self.user_prefix}:")
+                ]
+                # Fallback response in the appropriate language
+                ai_response = lines[-1] if lines else DEFAULT_RESPONSES[language]['understanding']
+
+            # Clean up any remaining "Bot:" prefix
+            return ai_response.replace(f"{self.bot_prefix}:", '').strip()
+
+        # blenderbot (keeping as fallback)
+        ai_response = result[0].get('generated_text', '')
+        # If response is empty, provide a fallback in the appropriate language
+        return ai_response or DEFAULT_RESPONSES[language]['fallback']
+
+    def _save_reply(self, ai_response):
+        # Also updates the conversation's counters and last activity
+        ai_message = run_write(
+            create_chat_message,
+            user=self.user,
+            content=ai_response,
+            language=self.language,
+            is_user_message=False,
+            conversation=self.conversation
+        )
+        return {
+            **self.started(),
+            'ai_response': {
+                'id': ai_message.id,
+                'content': ai_message.content,
+                'created_at': ai_message.created_at
+            }
+        }
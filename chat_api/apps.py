@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ChatApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "chat_api"
+
+    def ready(self):
+        # Register the connection setup and cache invalidation signal handlers
+        from . import authentication, db, language, response_cache  # noqa: F401
@@ -1,10 +1,21 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
 from django.utils.translation import gettext_lazy as _
 from rest_framework import exceptions
 
 User = get_user_model()
 
+# Fields a stateless token user is built with; any other field is deferred
+# and loaded from the database on first access
+TOKEN_USER_FIELDS = ('id', 'username', 'is_active')
+ACTIVE_CHECK_TIMEOUT = getattr(settings, 'JWT_ACTIVE_CHECK_TIMEOUT', 30)
+
 def custom_user_authentication_rule(user, payload):
     """
     Custom authentication rule for JWT to authenticate with email instead of username
@@ -36,3 +47,70 @@ class EmailBasedJWTAuthentication(JWTAuthentication):
             raise exceptions.AuthenticationFailed(_('User is inactive'))
 
         return user
+
+
+def add_user_claims(token, user):
+    """
+    Add the claims a stateless token user is built from. Set on the refresh
+    token, they are copied into every access token derived from it. The
+    language is not one of them: it comes from the invalidated preference
+    cache, and a claim would stay stale until the token expires.
+    """
+    token['username'] = user.username
+    return token
+
+def _active_cache_key(user_id):
+    return f'user_active_{user_id}'
+
+def user_is_active(user_id):
+    """
+    Whether the user exists and is active, cached for JWT_ACTIVE_CHECK_TIMEOUT
+    seconds. Saving or deleting the user drops the cached answer at once.
+    """
+    key = _active_cache_key(user_id)
+    active = cache.get(key)
+    if active is None:
+        active = bool(User.objects.filter(pk=user_id).values_list('is_active', flat=True).first())
+        cache.set(key, active, ACTIVE_CHECK_TIMEOUT)
+    return active
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_is_active(sender, instance, **kwargs):
+    key = _active_cache_key(instance.pk)
+    transaction.on_commit(lambda: cache.delete(key))
+
+def load_full_user(user):
+    """Load every field a stateless token user was built without, in one query"""
+    deferred = user.get_deferred_fields()
+    if deferred:
+        user.refresh_from_db(fields=list(deferred))
+    return user
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds request.user from the token's claims
+    instead of loading it from the database on every request.
+
+    The user is a real User instance holding only id, username and
+    is_active, so it works in ORM filters and foreign keys; other fields
+    are deferred and load on first access (see load_full_user). Whether the
+    account is still active comes from a short-lived shared cache entry.
+    Tokens issued without the claims fall back to loading the user.
+
+    Enabled by the JWT_STATELESS_USER setting.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise exceptions.AuthenticationFailed(_('Token contained no recognizable user identification'))
+
+        username = validated_token.get('username')
+        if username is None:
+            return super().get_user(validated_token)
+
+        if not user_is_active(user_id):
+            raise exceptions.AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return User.from_db(router.db_for_read(User), TOKEN_USER_FIELDS, (user_id, username, True))
@@ -0,0 +1,148 @@
+"""
+Circuit breakers for the AI chat models, shared by all worker processes.
+
+During a provider outage every chat turn used to wait out the upstream
+deadline, with its retries, before falling back to a simulated reply,
+so an outage held every worker. Each model (lamini-t5, deepseek,
+blenderbot-400M) now has a breaker whose state lives in the default cache:
+
+- closed: calls go through. Each call is counted in a fixed window of
+  CIRCUIT_WINDOW_SECONDS, as a failure if it raised, got an error answer
+  or took more than CIRCUIT_SLOW_CALL_SECONDS. Once a window has
+  CIRCUIT_MIN_CALLS calls and at least CIRCUIT_FAILURE_RATE of them
+  failed, the breaker opens;
+- open: admit() raises CircuitOpen without calling the model, and the
+  turn falls back at once;
+- half-open, CIRCUIT_OPEN_SECONDS after opening: up to
+  CIRCUIT_HALF_OPEN_PROBES calls are let through as probes. When that
+  many have succeeded the breaker closes; a failed probe opens it again.
+
+Transitions are counted in the cache per model and logged; the
+circuit_status command reports them with each breaker's state.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+
+from .throttling import cache_lock
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_ENABLED = getattr(settings, 'CIRCUIT_BREAKER', True)
+WINDOW_SECONDS = getattr(settings, 'CIRCUIT_WINDOW_SECONDS', 60)
+MIN_CALLS = getattr(settings, 'CIRCUIT_MIN_CALLS', 5)
+FAILURE_RATE = getattr(settings, 'CIRCUIT_FAILURE_RATE', 0.5)
+SLOW_CALL_SECONDS = getattr(settings, 'CIRCUIT_SLOW_CALL_SECONDS', 10.0)
+OPEN_SECONDS = getattr(settings, 'CIRCUIT_OPEN_SECONDS', 30)
+HALF_OPEN_PROBES = getattr(settings, 'CIRCUIT_HALF_OPEN_PROBES', 1)
+# A probe that never reports back (its worker died) stops counting after
+# this long, so the breaker cannot stay half-open for good
+PROBE_TIMEOUT = getattr(settings, 'UPSTREAM_DEADLINE', 25.0) + 5
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+TRANSITIONS = ((CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, OPEN), (HALF_OPEN, CLOSED))
+
+
+class CircuitOpen(Exception):
+    """The model's breaker is open; fall back without calling it"""
+
+
+def _count(cache, key, timeout=None):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout)
+        return cache.incr(key)
+
+
+class CircuitBreaker:
+    """The breaker of one model; all of its state is in the shared cache"""
+    cache = default_cache
+
+    def __init__(self, name):
+        self.name = name
+        self._state_key = f'circuit_{name}'
+
+    def _opened_at(self):
+        # The breaker is closed when there is no state
+        return self.cache.get(self._state_key)
+
+    def state(self):
+        opened_at = self._opened_at()
+        if opened_at is None:
+            return CLOSED
+        return OPEN if time.time() < opened_at + OPEN_SECONDS else HALF_OPEN
+
+    def admit(self):
+        """
+        Raise CircuitOpen unless a call may go through. Returns the opening
+        time when the call is a half-open probe, to be passed to record().
+        """
+        if not CIRCUIT_ENABLED:
+            return None
+        opened_at = self._opened_at()
+        if opened_at is None:
+            return None
+        if time.time() >= opened_at + OPEN_SECONDS:
+            probe = _count(self.cache, f'{self._state_key}_probes_{opened_at}', PROBE_TIMEOUT)
+            if probe == 1:
+                self._transition(OPEN, HALF_OPEN)
+            if probe <= HALF_OPEN_PROBES:
+                return opened_at
+        _count(self.cache, f'{self._state_key}_rejected')
+        raise CircuitOpen(f'Circuit breaker for {self.name} is open')
+
+    def record(self, ok, elapsed, probe=None):
+        """Count the outcome of an admitted call; `probe` is what admit() returned"""
+        if not CIRCUIT_ENABLED:
+            return
+        failed = not ok or elapsed > SLOW_CALL_SECONDS
+        if probe is not None:
+            self._record_probe(failed, probe)
+            return
+
+        window = int(time.time() // WINDOW_SECONDS)
+        calls = _count(self.cache, f'{self._state_key}_calls_{window}', WINDOW_SECONDS * 2)
+        if not failed:
+            return
+        failures = _count(self.cache, f'{self._state_key}_failures_{window}', WINDOW_SECONDS * 2)
+        if calls >= MIN_CALLS and failures >= calls * FAILURE_RATE:
+            with cache_lock(self.cache, self._state_key):
+                # Another worker may have opened it already
+                if self._opened_at() is None:
+                    self.cache.set(self._state_key, time.time(), None)
+                    self._transition(CLOSED, OPEN, f'{failures} of {calls} calls failed')
+
+    def _record_probe(self, failed, opened_at):
+        with cache_lock(self.cache, self._state_key):
+            if self._opened_at() != opened_at:
+                # Decided by another probe
+                return
+            if failed:
+                self.cache.set(self._state_key, time.time(), None)
+                self._transition(HALF_OPEN, OPEN, 'a probe failed')
+                return
+            if _count(self.cache, f'{self._state_key}_probes_ok_{opened_at}', PROBE_TIMEOUT) >= HALF_OPEN_PROBES:
+                # Failures from before the outage ended must not reopen it
+                window = int(time.time() // WINDOW_SECONDS)
+                self.cache.delete_many([f'{self._state_key}_calls_{window}', f'{self._state_key}_failures_{window}'])
+                self.cache.delete(self._state_key)
+                self._transition(HALF_OPEN, CLOSED)
+
+    def _transition(self, old, new, reason=''):
+        _count(self.cache, f'{self._state_key}_{old}_to_{new}')
+        logger.warning("Circuit breaker for %s: %s -> %s%s", self.name, old, new, f' ({reason})' if reason else '')
+
+    def metrics(self):
+        """Transition and rejection counts, summed over all processes, and the current window"""
+        window = int(time.time() // WINDOW_SECONDS)
+        names = {
+            **{f'{old}_to_{new}': f'{self._state_key}_{old}_to_{new}' for old, new in TRANSITIONS},
+            'rejected': f'{self._state_key}_rejected',
+            'window_calls': f'{self._state_key}_calls_{window}',
+            'window_failures': f'{self._state_key}_failures_{window}',
+        }
+        values = self.cache.get_many(names.values())
+        return {name: values.get(key, 0) for name, key in names.items()}
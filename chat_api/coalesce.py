@@ -0,0 +1,224 @@
+"""
+Single-flight coalescing of identical AI chat calls.
+
+Much of the chat traffic is the same short prompt sent at the same moment
+("hello", "مرحبا", "who are you"), and each copy used to make its own
+inference call. With CHAT_COALESCE on, calls are keyed by (model, prompt,
+parameters), the prompt exactly as the model receives it. While a call
+for a key is in flight, other turns with the same key wait for it and
+share its response or error. Each turn still extracts and saves its own
+reply, so every request gets its own ChatMessage.
+
+Calls that sample (do_sample) are never shared: each user is meant to get
+a reply drawn for them, not a copy of someone else's.
+
+Within a worker process, threads (SingleFlight) and the tasks of an event
+loop (AsyncSingleFlight) share calls. With CHAT_COALESCE_SHARED on, they
+also share calls across workers through the default cache. The worker
+that adds the key's claim makes the call and publishes the outcome; the
+others poll for it every CHAT_COALESCE_POLL_MS milliseconds. If the
+claiming worker goes away without publishing, they make the call
+themselves.
+
+Streamed turns are not coalesced.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache as default_cache
+
+from . import upstream
+
+COALESCE_ENABLED = getattr(settings, 'CHAT_COALESCE', False)
+COALESCE_SHARED = getattr(settings, 'CHAT_COALESCE_SHARED', False)
+POLL_SECONDS = getattr(settings, 'CHAT_COALESCE_POLL_MS', 50) / 1000
+# Published outcomes only need to outlive the followers' polling
+RESULT_TIMEOUT = 10
+
+# A follower's poll result while the call is still in flight
+IN_FLIGHT = object()
+
+
+class CoalescedCallError(Exception):
+    """The call made by another worker failed; carries its error message"""
+
+
+def flight_key(model_id, payload):
+    """The key under which identical calls to a model are shared, or None if the call samples"""
+    parameters = payload.get('parameters', {})
+    if parameters.get('do_sample'):
+        return None
+    params = json.dumps(parameters, sort_keys=True)
+    digest = hashlib.sha256(f'{model_id}\0{payload["inputs"]}\0{params}'.encode()).hexdigest()
+    return f'chat_flight_{digest}'
+
+
+def _give_up_at():
+    # A leader's call ends within the upstream deadline
+    return time.monotonic() + upstream.DEADLINE + 5
+
+
+class SharedFlights:
+    """The cross-worker part: claims and published outcomes in the shared cache"""
+    cache = default_cache
+
+    def claim(self, key):
+        """(True, flight id) if this worker makes the call; else (False, the leader's id or None)"""
+        flight_id = uuid.uuid4().hex
+        if self.cache.add(key, flight_id, upstream.DEADLINE + 5):
+            return True, flight_id
+        return False, self.cache.get(key)
+
+    def publish(self, key, flight_id, outcome):
+        if isinstance(outcome, Exception):
+            shared = ('error', f'{type(outcome).__name__}: {outcome}')
+        else:
+            shared = (
+                'response', outcome.status_code, dict(outcome.headers), outcome.content, outcome.encoding or 'utf-8'
+            )
+        # The outcome goes first, so a follower never sees the claim gone
+        # without it
+        self.cache.set(f'{key}_{flight_id}', shared, RESULT_TIMEOUT)
+        if self.cache.get(key) == flight_id:
+            self.cache.delete(key)
+
+    def poll(self, key, leader_id):
+        """The leader's outcome, IN_FLIGHT, or None if the leader went away without one"""
+        result_key = f'{key}_{leader_id}'
+        values = self.cache.get_many([key, result_key])
+        shared = values.get(result_key)
+        if shared is None:
+            return IN_FLIGHT if values.get(key) == leader_id else None
+        if shared[0] == 'error':
+            return CoalescedCallError(shared[1])
+        return upstream.AsyncResponse(*shared[1:])
+
+
+shared_flights = SharedFlights()
+
+
+def _outcome(call):
+    try:
+        return call()
+    except Exception as e:
+        return e
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.outcome = RuntimeError('The coalesced call did not finish')
+
+
+class SingleFlight:
+    """Shares calls among the threads of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def run(self, key, call):
+        """
+        (led, outcome): whether this caller's call() was the one made, and
+        its return value or the exception it raised. A key of None is
+        never shared.
+        """
+        if not COALESCE_ENABLED or key is None:
+            return True, _outcome(call)
+        with self._lock:
+            flight = self._flights.get(key)
+            led = flight is None
+            if led:
+                flight = self._flights[key] = _Flight()
+        if not led:
+            flight.done.wait()
+            return False, flight.outcome
+        try:
+            led, flight.outcome = self._run_shared(key, call) if COALESCE_SHARED else (True, _outcome(call))
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return led, flight.outcome
+
+    def _run_shared(self, key, call):
+        give_up_at = _give_up_at()
+        while True:
+            led, flight_id = shared_flights.claim(key)
+            if led:
+                outcome = _outcome(call)
+                shared_flights.publish(key, flight_id, outcome)
+                return True, outcome
+            if flight_id is not None:
+                break
+            # The claim was released in between; try again
+        outcome = IN_FLIGHT
+        while outcome is IN_FLIGHT and time.monotonic() < give_up_at:
+            time.sleep(POLL_SECONDS)
+            outcome = shared_flights.poll(key, flight_id)
+        if outcome is None or outcome is IN_FLIGHT:
+            return True, _outcome(call)
+        return False, outcome
+
+
+class AsyncSingleFlight:
+    """Shares calls among the tasks of an event loop"""
+
+    def __init__(self):
+        # {event loop: {key: future}}
+        self._flights = weakref.WeakKeyDictionary()
+
+    async def run(self, key, call):
+        """SingleFlight.run() for coroutine functions"""
+        if not COALESCE_ENABLED or key is None:
+            return True, await _aoutcome(call)
+        loop = asyncio.get_running_loop()
+        flights = self._flights.setdefault(loop, {})
+        future = flights.get(key)
+        if future is not None:
+            # Shielded, so a follower going away does not cancel the call
+            return False, await asyncio.shield(future)
+        future = flights[key] = loop.create_future()
+        led, outcome = True, RuntimeError('The coalesced call did not finish')
+        try:
+            led, outcome = await self._run_shared(key, call) if COALESCE_SHARED else (True, await _aoutcome(call))
+        finally:
+            del flights[key]
+            future.set_result(outcome)
+        return led, outcome
+
+    async def _run_shared(self, key, call):
+        give_up_at = _give_up_at()
+        while True:
+            led, flight_id = await sync_to_async(shared_flights.claim)(key)
+            if led:
+                outcome = await _aoutcome(call)
+                await sync_to_async(shared_flights.publish)(key, flight_id, outcome)
+                return True, outcome
+            if flight_id is not None:
+                break
+        outcome = IN_FLIGHT
+        while outcome is IN_FLIGHT and time.monotonic() < give_up_at:
+            await asyncio.sleep(POLL_SECONDS)
+            outcome = await sync_to_async(shared_flights.poll)(key, flight_id)
+        if outcome is None or outcome is IN_FLIGHT:
+            return True, await _aoutcome(call)
+        return False, outcome
+
+
+async def _aoutcome(call):
+    try:
+        return await call()
+    except Exception as e:
+        return e
+
+
+flights = SingleFlight()
+async_flights = AsyncSingleFlight()
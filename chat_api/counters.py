@@ -0,0 +1,69 @@
+"""
+Maintenance of the denormalized message statistics stored on Conversation.
+
+Writers call these helpers inside the transaction that adds or removes
+messages, so the inbox can be rendered from the conversation rows alone.
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
+from django.utils import timezone
+
+from .models import ChatMessage, Conversation
+from .response_cache import bump_version
+
+PREVIEW_LENGTH = Conversation._meta.get_field('last_message_preview').max_length
+
+
+def record_new_message(message):
+    """
+    Account for a newly created message on its conversation.
+    Must run in the same transaction as the message INSERT.
+    """
+    if not message.conversation_id:
+        return
+    record_new_messages(message.conversation_id, 1, message)
+
+
+def record_new_messages(conversation_id, count, last_message):
+    """
+    Account for `count` new messages of which `last_message` is the latest.
+    The count is bumped with an F-expression so concurrent writers never
+    lose an increment.
+    """
+    Conversation.objects.filter(pk=conversation_id).update(
+        message_count=F('message_count') + count,
+        last_message_at=last_message.created_at,
+        last_message_preview=last_message.content[:PREVIEW_LENGTH],
+        last_message_is_user=last_message.is_user_message,
+        updated_at=timezone.now(),
+    )
+
+
+def expected_counters():
+    """Expressions computing each conversation's statistics from its messages"""
+    messages = ChatMessage.objects.filter(conversation=OuterRef('pk'))
+    last_message = messages.order_by('-created_at', '-id')
+    message_count = messages.order_by().values('conversation').annotate(
+        count=Count('id')
+    ).values('count')
+    return {
+        'message_count': Coalesce(Subquery(message_count), Value(0)),
+        'last_message_at': Subquery(last_message.values('created_at')[:1]),
+        'last_message_preview': Coalesce(
+            Substr(Subquery(last_message.values('content')[:1]), 1, PREVIEW_LENGTH),
+            Value(''),
+        ),
+        'last_message_is_user': Subquery(last_message.values('is_user_message')[:1]),
+    }
+
+
+def refresh_conversation_counters(conversation_ids):
+    """
+    Recompute the statistics of the given conversations from their messages
+    with a single set-based UPDATE. Used after deletions, where the previous
+    last message can only be found by looking at what remains.
+    """
+    conversations = Conversation.objects.filter(pk__in=conversation_ids)
+    # update() sends no signals, so the owners' cached lists are dropped here
+    bump_version(*conversations.values_list('user_id', flat=True).distinct())
+    return conversations.update(**expected_counters())
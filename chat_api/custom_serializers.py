@@ -1,8 +1,13 @@
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth import authenticate, get_user_model
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
+from .authentication import add_user_claims
+from .login import last_login, verify_password
+from .tokens import RefreshToken
+
 User = get_user_model()
 
 class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -10,6 +15,11 @@ class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
     Custom JWT token serializer that uses email instead of username
     """
     username_field = 'email'
+    token_class = RefreshToken
+
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -23,29 +33,28 @@ class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
         email = attrs.get('email')
         password = attrs.get('password')
 
-        if email and password:
-            # Find user by email
-            try:
-                user = User.objects.filter(email=email).first()
-                if user and user.check_password(password):
-                    # Manually set the user for token generation
-                    self.user = user
-                else:
-                    msg = _('Unable to log in with provided credentials.')
-                    raise serializers.ValidationError(msg, code='authorization')
-            except User.DoesNotExist:
-                msg = _('Unable to log in with provided credentials.')
-                raise serializers.ValidationError(msg, code='authorization')
-        else:
+        if not (email and password):
             msg = _('Must include "email" and "password".')
             raise serializers.ValidationError(msg, code='authorization')
 
-        # Use the user we found by email
-        refresh = self.get_token(self.user)
-        
+        # Find user by email, with the profile the login view needs
+        user = User.objects.select_related('profile').filter(email=email).first()
+        if not verify_password(user, password):
+            msg = _('Unable to log in with provided credentials.')
+            raise serializers.ValidationError(msg, code='authorization')
+
+        # Kept for the view, which builds its response from them
+        self.user = user
+        self.profile = getattr(user, 'profile', None)
+
+        refresh = add_user_claims(self.token_class.for_user(user), user)
+
         data = {
             'refresh': str(refresh),
             'access': str(refresh.access_token),
         }
-        
+
+        if api_settings.UPDATE_LAST_LOGIN:
+            last_login.record(user)
+
         return data
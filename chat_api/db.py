@@ -0,0 +1,53 @@
+"""
+SQLite connection setup.
+
+Django's sqlite3 backend opens connections with SQLite's defaults: rollback
+journal, full fsync on every commit and no busy handler beyond the Python
+driver's timeout. Under several gunicorn workers that means readers block
+writers and "database is locked" errors. The pragmas configured in
+settings.SQLITE_PRAGMAS are applied to every new connection instead, and
+the SQL function migration 0007 indexes existing messages with is
+registered.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .search import normalize_search_text
+
+# Pragmas whose value is a keyword rather than a number
+KEYWORD_PRAGMAS = {'journal_mode', 'synchronous', 'temp_store'}
+
+
+def sqlite_pragma_statements(pragmas):
+    """Return the PRAGMA statements for a {name: value} mapping, skipping blanks"""
+    statements = []
+    for name, value in pragmas.items():
+        value = str(value).strip()
+        if not value:
+            continue
+        if name in KEYWORD_PRAGMAS:
+            if not value.isalpha():
+                raise ValueError(f'Invalid value for PRAGMA {name}: {value!r}')
+        else:
+            value = str(int(value))
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+def apply_sqlite_pragmas(cursor, pragmas):
+    for statement in sqlite_pragma_statements(pragmas):
+        cursor.execute(statement)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_sqlite_pragmas(cursor, getattr(settings, 'SQLITE_PRAGMAS', {}))
+    # Used by migration 0007; the search triggers normalize in plain SQL
+    # since 0009 (see chat_api.search)
+    connection.connection.create_function(
+        'chat_normalize', 1, normalize_search_text, deterministic=True
+    )
@@ -0,0 +1,164 @@
+"""
+Deletion of conversations and their messages.
+
+Messages have no dependants and no delete signals, so deleting a
+conversation is a set-based DELETE ... WHERE conversation_id = ? that
+never loads message keys. Every removed row still updates the message
+indexes and the search index, though, so a conversation with many
+thousands of messages would hold SQLite's write lock for seconds.
+Conversations above CHAT_DELETE_PURGE_THRESHOLD messages are therefore
+soft-deleted: they are hidden at once, and a background thread purges
+their messages in short transactions of CHAT_PURGE_BATCH_SIZE rows,
+pausing between them so other writers get the lock.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+from .models import ChatMessage, Conversation
+from .response_cache import bump_version
+from .write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+
+def hidden_conversations():
+    """Soft-deleted conversations that are waiting for their purge"""
+    return Conversation.objects.filter(deleted_at__isnull=False)
+
+
+def visible_messages(queryset):
+    """Exclude messages belonging to soft-deleted conversations"""
+    return queryset.exclude(conversation__in=hidden_conversations().values('id'))
+
+
+def _delete_now(conversation_id):
+    deleted, per_model = Conversation.objects.filter(pk=conversation_id).delete()
+    return per_model.get(ChatMessage._meta.label, 0)
+
+
+def _soft_delete(conversation):
+    Conversation.objects.filter(pk=conversation.pk).update(deleted_at=timezone.now())
+    bump_version(conversation.user_id)
+
+
+def delete_conversation(conversation):
+    """
+    Delete a conversation and its messages, or soft-delete it and schedule
+    a purge when it is too large to remove in one transaction. Returns the
+    number of messages deleted (or to be deleted) and whether a purge is
+    pending.
+    """
+    threshold = getattr(settings, 'CHAT_DELETE_PURGE_THRESHOLD', 5000)
+    messages = ChatMessage.objects.filter(conversation=conversation)
+    # Counted from the rows, not message_count, which can drift; the cap
+    # stops the count at the threshold on huge conversations
+    if messages[:threshold + 1].count() <= threshold:
+        return run_write(_delete_now, conversation.pk), False
+
+    queued = messages.count()
+    run_write(_soft_delete, conversation)
+    if getattr(settings, 'CHAT_PURGE_IN_BACKGROUND', True):
+        purger.wake()
+    return queued, True
+
+
+def _delete_messages(message_ids):
+    return ChatMessage.objects.filter(pk__in=message_ids).delete()[0]
+
+
+def _delete_purged_conversation(conversation_id):
+    # Also sweeps any message that slipped in after the last batch
+    deleted, per_model = hidden_conversations().filter(pk=conversation_id).delete()
+    return per_model.get(ChatMessage._meta.label, 0)
+
+
+def purge_conversation(conversation_id, batch_size=None, pause=None):
+    """
+    Remove a soft-deleted conversation's messages batch by batch, then the
+    conversation itself. Returns the number of messages deleted.
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'CHAT_PURGE_BATCH_SIZE', 500)
+    if pause is None:
+        pause = getattr(settings, 'CHAT_PURGE_PAUSE_MS', 20) / 1000
+
+    deleted = 0
+    while True:
+        message_ids = list(
+            ChatMessage.objects.filter(conversation_id=conversation_id)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not message_ids:
+            break
+        deleted += run_write(_delete_messages, message_ids)
+        time.sleep(pause)
+    return deleted + run_write(_delete_purged_conversation, conversation_id)
+
+
+def purge_deleted_conversations(batch_size=None, pause=None):
+    """
+    Purge every soft-deleted conversation, oldest deletion first.
+    Returns (conversations purged, messages deleted).
+    """
+    conversations = messages = 0
+    pending = list(hidden_conversations().order_by('deleted_at').values_list('id', flat=True))
+    for conversation_id in pending:
+        messages += purge_conversation(conversation_id, batch_size=batch_size, pause=pause)
+        conversations += 1
+    return conversations, messages
+
+
+class BackgroundPurger:
+    """Runs purge_deleted_conversations in a daemon thread whenever woken"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._thread = None
+        self._pid = None
+
+    def wake(self):
+        """Ask the purger thread to look for soft-deleted conversations"""
+        self._ensure_started().set()
+
+    def _ensure_started(self):
+        # Started lazily in each process, as forked workers inherit the
+        # object but not the thread
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return self._wakeup
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._wakeup = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._wakeup,), name='chat-conversation-purger', daemon=True
+                )
+                self._pid = os.getpid()
+                self._thread.start()
+        return self._wakeup
+
+    def _run(self, wakeup):
+        try:
+            while True:
+                wakeup.wait()
+                wakeup.clear()
+                close_old_connections()
+                try:
+                    conversations, messages = purge_deleted_conversations()
+                except Exception as e:
+                    # Whatever is left is picked up on the next wake-up or by
+                    # the purge_deleted_conversations command
+                    logger.error(f"Conversation purge failed: {str(e)}")
+                    continue
+                if conversations:
+                    logger.info(f"Purged {conversations} conversations and {messages} messages")
+        finally:
+            connections.close_all()
+
+
+purger = BackgroundPurger()
@@ -0,0 +1,104 @@
+"""
+Bulk import of conversations from other chat tools.
+
+The submitted messages are checked in one plain pass over the payload
+rather than through a serializer instance per item, then written with
+bulk_create in batches of CHAT_IMPORT_BATCH_SIZE rows inside a single
+transaction. Original timestamps are kept, and the conversation's
+statistics are recomputed once at the end.
+"""
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext as _
+
+from .counters import expected_counters
+from .models import LANGUAGE_CHOICES, ChatMessage, Conversation
+from .response_cache import bump_version
+
+IMPORT_BATCH_SIZE = getattr(settings, 'CHAT_IMPORT_BATCH_SIZE', 500)
+LANGUAGES = frozenset(code for code, name in LANGUAGE_CHOICES)
+
+
+def _parse_timestamp(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def validate_messages(items, default_language):
+    """
+    Check raw message objects in a single pass.
+
+    Returns (messages, errors): `messages` holds the model field values of
+    every valid item, in order, and `errors` one {'index', 'errors'} entry
+    per rejected item, indexed by its position in the payload.
+    """
+    messages, errors = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'errors': {'non_field_errors': [_('Expected an object.')]}})
+            continue
+
+        item_errors = {}
+        content = item.get('content')
+        if not isinstance(content, str) or not content.strip():
+            item_errors['content'] = [_('This field is required.')]
+
+        language = item.get('language') or default_language
+        if language not in LANGUAGES:
+            item_errors['language'] = [_('"%(value)s" is not a valid choice.') % {'value': language}]
+
+        is_user_message = item.get('is_user_message', True)
+        if not isinstance(is_user_message, bool):
+            item_errors['is_user_message'] = [_('Must be a valid boolean.')]
+
+        created_at = _parse_timestamp(item.get('created_at'))
+        if created_at is None:
+            item_errors['created_at'] = [_('A valid ISO 8601 datetime is required.')]
+
+        if item_errors:
+            errors.append({'index': index, 'errors': item_errors})
+            continue
+        messages.append({
+            'content': content,
+            'language': language,
+            'is_user_message': is_user_message,
+            'created_at': created_at,
+        })
+    return messages, errors
+
+
+class RawInsertQuerySet(QuerySet):
+    """
+    bulk_create() that inserts field values as given, like loaddata's raw
+    saves, so auto_now_add does not overwrite the imported created_at.
+    """
+
+    def _insert(self, *args, **kwargs):
+        kwargs['raw'] = True
+        return super()._insert(*args, **kwargs)
+
+
+def import_messages(user, conversation, messages):
+    """
+    Insert validated messages into `conversation` and refresh its
+    statistics. Must run inside a transaction. Returns the number of
+    messages written.
+    """
+    objs = [ChatMessage(user=user, conversation=conversation, **fields) for fields in messages]
+    RawInsertQuerySet(ChatMessage).bulk_create(objs, batch_size=IMPORT_BATCH_SIZE)
+
+    Conversation.objects.filter(pk=conversation.pk).update(
+        updated_at=timezone.now(), **expected_counters()
+    )
+    # bulk_create and update() send no signals
+    bump_version(user.pk)
+    return len(objs)
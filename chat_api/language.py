@@ -0,0 +1,84 @@
+"""
+Resolution of the language a request is answered in.
+
+A user's profile preference wins; otherwise the Accept-Language header
+decides. Preferences are kept in the shared cache by user id, so the steady
+state request path runs no UserProfile query, and the cached entry is
+dropped whenever a profile is saved or deleted. The result is memoized on
+the request, since the middlewares and the view all ask for it, and
+Accept-Language headers are parsed once per distinct value.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation.trans_real import parse_accept_lang_header
+
+from .models import UserProfile
+
+DEFAULT_LANGUAGE = 'en'
+SUPPORTED_LANGUAGES = frozenset(code for code, name in settings.LANGUAGES)
+LANGUAGE_CACHE_TIMEOUT = getattr(settings, 'CHAT_LANGUAGE_CACHE_TIMEOUT', 24 * 60 * 60)
+
+# Cached for users without a profile, so they are not looked up again
+NO_PREFERENCE = ''
+
+
+def _cache_key(user_id):
+    return f'user_language_{user_id}'
+
+
+@lru_cache(maxsize=512)
+def accept_language(header):
+    """The first supported language of an Accept-Language header, by quality"""
+    for code, quality in parse_accept_lang_header(header):
+        language = code.split('-')[0]
+        if language in SUPPORTED_LANGUAGES:
+            return language
+    return DEFAULT_LANGUAGE
+
+
+def language_preference(user_id):
+    """A user's profile language, or None if they have no profile"""
+    key = _cache_key(user_id)
+    language = cache.get(key)
+    if language is None:
+        language = (
+            UserProfile.objects.filter(user_id=user_id)
+            .values_list('language_preference', flat=True).first()
+        ) or NO_PREFERENCE
+        cache.set(key, language, LANGUAGE_CACHE_TIMEOUT)
+    return language or None
+
+
+def resolve_language(request):
+    """
+    The language for a Django or DRF request. Memoized per user on the
+    underlying HttpRequest, because middleware runs before JWT
+    authentication and sees an anonymous user, while the view sees the
+    authenticated one.
+    """
+    user = request.user
+    user_id = user.pk if user.is_authenticated else None
+    http_request = getattr(request, '_request', request)
+    memo = getattr(http_request, '_resolved_language', None)
+    if memo is not None and memo[0] == user_id:
+        return memo[1]
+
+    language = user_id is not None and language_preference(user_id)
+    if not language:
+        language = accept_language(http_request.META.get('HTTP_ACCEPT_LANGUAGE', ''))
+    http_request._resolved_language = (user_id, language)
+    http_request.LANGUAGE_CODE = language
+    return language
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_language_preference(sender, instance, **kwargs):
+    # After commit, so a rolled back change never reaches the cache
+    key = _cache_key(instance.user_id)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,134 @@
+"""
+Password login support: bounded password hashing and batched last_login.
+
+Verifying a password runs PBKDF2 for hundreds of milliseconds. Under ASGI
+every request to a sync view gets its own thread, so a spike of logins
+turns into as many threads hashing at once and starves every other
+endpoint of CPU. Hashing is done in a per-process pool of LOGIN_HASH_WORKERS
+threads instead; extra logins queue for it.
+
+A login also used to write last_login straight away. The timestamps are
+now collected in memory and written every LOGIN_LAST_LOGIN_FLUSH_SECONDS
+by a background thread, in one statement executed for all users that
+logged in meanwhile.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection, connections
+from django.utils import timezone
+
+from .write_queue import run_write
+
+logger = logging.getLogger(__name__)
+
+HASH_WORKERS = getattr(settings, 'LOGIN_HASH_WORKERS', None) or os.cpu_count() or 1
+LAST_LOGIN_FLUSH_SECONDS = getattr(settings, 'LOGIN_LAST_LOGIN_FLUSH_SECONDS', 5.0)
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _hash_pool():
+    # Created lazily in each process; forked workers inherit the object
+    # but not its threads
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool_pid != os.getpid():
+                _pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='chat-password-hash')
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _must_update(encoded):
+    preferred = get_hasher('default')
+    return identify_hasher(encoded).algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def verify_password(user, password):
+    """
+    user.check_password(), hashed in the bounded pool. A hash made with
+    outdated parameters is upgraded, as Django does on a successful check.
+    Pass user=None to spend the same time when no user matched, so response
+    times do not reveal which emails are registered.
+    """
+    if user is None:
+        hash_password(password)
+        return False
+    verified = _hash_pool().submit(check_password, password, user.password).result()
+    if verified and _must_update(user.password):
+        user.set_password(password)
+        user.save(update_fields=['password'])
+    return verified
+
+
+def hash_password(password):
+    """make_password(), run in the bounded pool"""
+    return _hash_pool().submit(make_password, password).result()
+
+
+class LastLoginRecorder:
+    """Collects last_login times and writes them in batches from a daemon thread"""
+
+    def __init__(self, interval=LAST_LOGIN_FLUSH_SECONDS):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._pid = None
+
+    def record(self, user):
+        """Set user.last_login to now and queue the write"""
+        user.last_login = timezone.now()
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: the parent's queue and thread are not ours
+                self._pending = {}
+                self._thread = threading.Thread(target=self._run, name='chat-last-login', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+            self._pending[user.pk] = user.last_login
+
+    def flush(self):
+        """Write every queued last_login; returns the number of users updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            run_write(_update_last_login, pending)
+        return len(pending)
+
+    def _run(self):
+        try:
+            while True:
+                time.sleep(self.interval)
+                close_old_connections()
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Writing last_login failed: {str(e)}")
+        finally:
+            connections.close_all()
+
+
+def _update_last_login(pending):
+    field = User._meta.get_field('last_login')
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {quote(User._meta.db_table)} SET {quote(field.column)} = %s '
+            f'WHERE {quote(User._meta.pk.column)} = %s',
+            [(field.get_db_prep_value(when, connection), user_id) for user_id, when in pending.items()]
+        )
+
+
+last_login = LastLoginRecorder()
+atexit.register(last_login.flush)
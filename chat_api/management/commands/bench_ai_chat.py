@@ -0,0 +1,272 @@
+"""
+Load test of /api/chat/ai/ with a slow model, for concurrent chat turns per worker.
+
+A local stub stands in for Hugging Face and answers after --delay-ms (two
+seconds by default, like a real generation). For --seconds, as many clients
+as each setup allows send chat turns in a loop, in this process:
+
+- wsgi: the sync view through Django's WSGI handling, from --threads
+  threads, as a gunicorn worker with that many threads serves it (one for
+  the default sync worker);
+- asgi-sync: the sync view under Django's ASGI handler, from --concurrency
+  clients at once;
+- asgi-async: AsyncAIChatView under the ASGI handler, likewise.
+
+Reports turns per second, the most calls the stub had in flight at once
+(the worker's concurrent-turn capacity) and the most threads the process
+ran. Uses a throwaway database seeded with one user per client. Run it
+with CHAT_WRITE_COALESCING=True, as an ASGI deployment should: hundreds of
+threads writing to SQLite at once otherwise time out on the write lock.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat_api import upstream, urls
+from chat_api.models import UserProfile
+from chat_api.views import AIChatView, AsyncAIChatView
+
+BODY = b'[{"generated_text": "I am fine, thank you."}]'
+
+
+class SlowModel:
+    """A keep-alive HTTP server on its own event loop that answers every POST after a delay"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.in_flight = self.peak = self.calls = 0
+        self.writers = set()
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self._serve, '127.0.0.1', 0, backlog=4096)
+        )
+        self.url = f'http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}'
+        self.thread = threading.Thread(target=self.loop.run_forever, name='bench-slow-model', daemon=True)
+        self.thread.start()
+
+    async def _serve(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    name, _, value = line.partition(b':')
+                    if name.lower() == b'content-length':
+                        length = int(value)
+                await reader.readexactly(length)
+                self.calls += 1
+                self.in_flight += 1
+                self.peak = max(self.peak, self.in_flight)
+                try:
+                    await asyncio.sleep(self.delay)
+                finally:
+                    self.in_flight -= 1
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                    b'Content-Length: %d\r\n\r\n%s' % (len(BODY), BODY)
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def reset(self):
+        self.peak = 0
+
+    async def _shutdown(self):
+        self.server.close()
+        # Idle keep-alive connections end their handlers with a read error
+        for writer in list(self.writers):
+            writer.close()
+        await asyncio.sleep(0.1)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+async def _asgi_post(app, path, body, headers):
+    """POST straight to an ASGI application, as a server would; returns the status"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [
+            (b'host', b'testserver'), (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()), *headers,
+        ],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    received = False
+    finished = asyncio.Event()
+    status = None
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif not message.get('more_body', False):
+            finished.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+class ThreadCounter:
+    """Samples threading.active_count() in the background and keeps the peak"""
+
+    def __init__(self):
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(0.05):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+class Command(BaseCommand):
+    help = "Measure concurrent AI chat turns per worker with the sync and the async view"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--delay-ms', type=float, default=2000, help='Time the stub model takes to answer')
+        parser.add_argument('--threads', type=int, default=1, help='Threads of the WSGI worker')
+        parser.add_argument('--concurrency', type=int, default=300, help='Clients at once under ASGI')
+
+    def handle(self, *args, **options):
+        # Lets the test client's host through ALLOWED_HOSTS
+        setup_test_environment()
+        model = SlowModel(options['delay_ms'] / 1000)
+        with tempfile.TemporaryDirectory() as directory:
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            # Per-user throttles would stop the clients after a few turns
+            throttle_classes = AIChatView.throttle_classes
+            AIChatView.throttle_classes = []
+            base_url = upstream.huggingface.base_url
+            upstream.huggingface.base_url = model.url
+            pattern = next(p for p in urls.urlpatterns if p.name == 'ai-chat')
+            callback = pattern.callback
+            try:
+                tokens = self._seed(max(options['threads'], options['concurrency']))
+                self.stdout.write(
+                    f'Stub model answers in {options["delay_ms"]:g} ms; each setup runs for {options["seconds"]:g}s; '
+                    f'write coalescing {"on" if settings.CHAT_WRITE_COALESCING else "off"}'
+                )
+                self._report('wsgi', options['threads'], model, lambda: self._run_wsgi(tokens, options))
+                pattern.callback = AIChatView.as_view()
+                self._report('asgi-sync', options['concurrency'], model, lambda: self._run_asgi(tokens, options))
+                pattern.callback = AsyncAIChatView.as_view()
+                self._report('asgi-async', options['concurrency'], model, lambda: self._run_asgi(tokens, options))
+            finally:
+                pattern.callback = callback
+                upstream.huggingface.base_url = base_url
+                AIChatView.throttle_classes = throttle_classes
+                model.close()
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+    def _seed(self, count):
+        encoded = make_password(None)
+        users = User.objects.bulk_create(
+            User(username=f'bench-chat-{i}', email=f'bench-chat-{i}@example.com', password=encoded)
+            for i in range(count)
+        )
+        UserProfile.objects.bulk_create(
+            UserProfile(user=user, fullname=f'Bench User {i}', language_preference='en')
+            for i, user in enumerate(users)
+        )
+        return [str(AccessToken.for_user(user)) for user in users]
+
+    def _report(self, name, clients, model, run):
+        model.reset()
+        with ThreadCounter() as threads:
+            started = time.perf_counter()
+            turns, errors = run()
+            elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{name:<11} {clients:>4} clients: {turns / elapsed:7.1f} turns/s, {model.peak:>4} turns in flight at peak, '
+            f'{threads.peak:>4} threads at peak, {errors} errors'
+        )
+
+    def _run_wsgi(self, tokens, options):
+        stop_at = time.monotonic() + options['seconds']
+        counts = []
+
+        def client(token):
+            api = APIClient()
+            api.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            turns = errors = 0
+            try:
+                while time.monotonic() < stop_at:
+                    response = api.post('/api/chat/ai/', {'message': 'Hello, how are you?'}, format='json')
+                    turns += 1
+                    errors += response.status_code != 200
+            finally:
+                connections.close_all()
+                counts.append((turns, errors))
+
+        workers = [threading.Thread(target=client, args=(token,)) for token in tokens[:options['threads']]]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return sum(t for t, e in counts), sum(e for t, e in counts)
+
+    def _run_asgi(self, tokens, options):
+        app = get_asgi_application()
+        body = json.dumps({'message': 'Hello, how are you?'}).encode()
+
+        async def client(token, stop_at):
+            headers = [(b'authorization', f'Bearer {token}'.encode())]
+            turns = errors = 0
+            while time.monotonic() < stop_at:
+                status = await _asgi_post(app, '/api/chat/ai/', body, headers)
+                turns += 1
+                errors += status != 200
+            return turns, errors
+
+        async def run():
+            stop_at = time.monotonic() + options['seconds']
+            try:
+                counts = await asyncio.gather(*(client(token, stop_at) for token in tokens[:options['concurrency']]))
+            finally:
+                await upstream.huggingface.aclose()
+            return sum(t for t, e in counts), sum(e for t, e in counts)
+
+        return asyncio.run(run())
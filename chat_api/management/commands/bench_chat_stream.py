@@ -0,0 +1,283 @@
+"""
+Time to first byte of /api/chat/ai/ with and without streaming.
+
+A local stub stands in for a text-generation-inference model: it takes
+--first-token-ms to produce the first token and --token-ms for each of the
+others. Asked to stream, it sends each token as a server-sent event as it
+is produced; otherwise it answers with the whole text at the end. For
+--turns chat turns each, the command reports:
+
+- non-streamed: when the response arrives;
+- streamed, through the sync view (as under WSGI) and AsyncAIChatView
+  under the ASGI handler: when the start event, the first token and the
+  done event arrive.
+
+It then checks that a model that breaks off after a few tokens still ends
+the stream with a done event carrying a simulated reply, and that every
+turn saved exactly one reply. Uses a throwaway database.
+"""
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat_api import upstream, urls
+from chat_api.models import ChatMessage
+from chat_api.views import AIChatView, AsyncAIChatView
+
+TOKENS = ['Sure', ',', ' here', ' is', ' a', ' short', ' answer', ' for', ' you', '.']
+
+
+def _event(token, generated_text=None):
+    event = {
+        'token': {'id': 1, 'text': token, 'logprob': -0.1, 'special': False},
+        'generated_text': generated_text, 'details': None,
+    }
+    return b'data: %s\n\n' % json.dumps(event).encode()
+
+
+def _chunk(data):
+    return b'%x\r\n%s\r\n' % (len(data), data)
+
+
+class StreamingModel:
+    """A keep-alive HTTP server on its own event loop that produces TOKENS one at a time"""
+
+    def __init__(self, first_token, per_token):
+        self.first_token = first_token
+        self.per_token = per_token
+        # Tokens sent before dropping the connection, or None to finish
+        self.break_after = None
+        self.writers = set()
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._serve, '127.0.0.1', 0))
+        self.url = f'http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}'
+        self.thread = threading.Thread(target=self.loop.run_forever, name='bench-streaming-model', daemon=True)
+        self.thread.start()
+
+    async def _serve(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    name, _, value = line.partition(b':')
+                    if name.lower() == b'content-length':
+                        length = int(value)
+                payload = json.loads(await reader.readexactly(length))
+                if payload.get('stream'):
+                    if not await self._stream(writer):
+                        return
+                else:
+                    await asyncio.sleep(self.first_token + self.per_token * (len(TOKENS) - 1))
+                    body = json.dumps([{'generated_text': ''.join(TOKENS)}]).encode()
+                    writer.write(
+                        b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                        b'Content-Length: %d\r\n\r\n%s' % (len(body), body)
+                    )
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def _stream(self, writer):
+        writer.write(
+            b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n'
+        )
+        await asyncio.sleep(self.first_token)
+        for i, token in enumerate(TOKENS):
+            if i == self.break_after:
+                # Drop the connection part way through the answer
+                return False
+            if i:
+                await asyncio.sleep(self.per_token)
+            last = i == len(TOKENS) - 1
+            writer.write(_chunk(_event(token, ''.join(TOKENS) if last else None)))
+            await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        return True
+
+    async def _shutdown(self):
+        self.server.close()
+        for writer in list(self.writers):
+            writer.close()
+        await asyncio.sleep(0.1)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def _parse_events(body):
+    events = []
+    for block in body.decode('utf-8').split('\n\n'):
+        if block.strip():
+            name, data = block.split('\n', 1)
+            events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+async def _asgi_stream(app, path, body, headers):
+    """POST straight to an ASGI application; returns [(seconds since the request, body chunk)]"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [
+            (b'host', b'testserver'), (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()), *headers,
+        ],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    received = False
+    finished = asyncio.Event()
+    chunks = []
+    started = time.perf_counter()
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.body':
+            if message.get('body'):
+                chunks.append((time.perf_counter() - started, message['body']))
+            if not message.get('more_body', False):
+                finished.set()
+
+    await app(scope, receive, send)
+    return chunks
+
+
+def _milestones(chunks):
+    """Seconds until the start event, the first token and the done event, from timed body chunks"""
+    times = {}
+    for elapsed, chunk in chunks:
+        for name, data in _parse_events(chunk):
+            times.setdefault(name, elapsed)
+    return times.get('start'), times.get('token'), times.get('done')
+
+
+class Command(BaseCommand):
+    help = "Compare time to first byte of AI chat turns with and without streaming"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turns', type=int, default=10)
+        parser.add_argument('--first-token-ms', type=float, default=300)
+        parser.add_argument('--token-ms', type=float, default=100)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        model = StreamingModel(options['first_token_ms'] / 1000, options['token_ms'] / 1000)
+        with tempfile.TemporaryDirectory() as directory:
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            throttle_classes = AIChatView.throttle_classes
+            AIChatView.throttle_classes = []
+            base_url = upstream.huggingface.base_url
+            upstream.huggingface.base_url = model.url
+            pattern = next(p for p in urls.urlpatterns if p.name == 'ai-chat')
+            callback = pattern.callback
+            try:
+                user = User.objects.create_user('bench-stream', 'bench-stream@example.com', None)
+                token = str(AccessToken.for_user(user))
+                self.stdout.write(
+                    f'Stub model: first token after {options["first_token_ms"]:g} ms, then one every '
+                    f'{options["token_ms"]:g} ms ({len(TOKENS)} tokens)'
+                )
+                self._run(token, options['turns'])
+                self._check_broken_stream(token, model)
+                saved = ChatMessage.objects.filter(user=user, is_user_message=False).count()
+                turns = ChatMessage.objects.filter(user=user, is_user_message=True).count()
+                self.stdout.write(f'Replies saved: {saved} for {turns} turns')
+            finally:
+                pattern.callback = callback
+                upstream.huggingface.base_url = base_url
+                AIChatView.throttle_classes = throttle_classes
+                model.close()
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+    def _client(self, token):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return api
+
+    def _post_stream(self, api):
+        started = time.perf_counter()
+        response = api.post('/api/chat/ai/?stream=1', {'message': 'Hello', 'model': 'deepseek'}, format='json')
+        return [(time.perf_counter() - started, chunk) for chunk in response.streaming_content]
+
+    def _run(self, token, turns):
+        api = self._client(token)
+        whole = []
+        for _ in range(turns):
+            started = time.perf_counter()
+            response = api.post('/api/chat/ai/', {'message': 'Hello', 'model': 'deepseek'}, format='json')
+            whole.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f'Chat turn answered {response.status_code}')
+        self.stdout.write(f'{"non-streamed":<16} response after {statistics.median(whole) * 1000:7.1f} ms')
+
+        sync_runs = [_milestones(self._post_stream(api)) for _ in range(turns)]
+        self._report('streamed (sync)', sync_runs)
+
+        pattern = next(p for p in urls.urlpatterns if p.name == 'ai-chat')
+        callback, pattern.callback = pattern.callback, AsyncAIChatView.as_view()
+        app = get_asgi_application()
+        body = json.dumps({'message': 'Hello', 'model': 'deepseek'}).encode()
+        headers = [(b'authorization', f'Bearer {token}'.encode()), (b'accept', b'text/event-stream')]
+
+        async def run():
+            try:
+                return [_milestones(await _asgi_stream(app, '/api/chat/ai/', body, headers)) for _ in range(turns)]
+            finally:
+                await upstream.huggingface.aclose()
+
+        try:
+            self._report('streamed (async)', asyncio.run(run()))
+        finally:
+            pattern.callback = callback
+
+    def _report(self, name, runs):
+        start, first, done = (statistics.median(times) * 1000 for times in zip(*runs))
+        self.stdout.write(
+            f'{name:<16} start event after {start:7.1f} ms, first token after {first:7.1f} ms, '
+            f'done after {done:7.1f} ms'
+        )
+
+    def _check_broken_stream(self, token, model):
+        model.break_after = 3
+        try:
+            events = [
+                event for _, chunk in self._post_stream(self._client(token)) for event in _parse_events(chunk)
+            ]
+        finally:
+            model.break_after = None
+        names = [name for name, data in events]
+        reply = events[-1][1]['ai_response']['content'] if names[-1] == 'done' else None
+        self.stdout.write(
+            f'Model breaking off after 3 tokens: {names.count("token")} tokens, then {names[-1]!r} '
+            f'with reply {reply!r}'
+        )
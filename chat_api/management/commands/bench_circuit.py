@@ -0,0 +1,141 @@
+"""
+Chat turn latency during a model outage, with and without the circuit breaker.
+
+A local stub stands in for Hugging Face. During the outage it never
+answers in time, so every call runs until the upstream deadline, cut to
+--deadline seconds here. For --turns chat turns from --clients threads
+each, the command reports the turn latency and how many turns waited on
+the model:
+
+- breaker off: every turn waits out the deadline before falling back;
+- breaker on: after CIRCUIT_MIN_CALLS failed calls the breaker opens and
+  the remaining turns fall back at once.
+
+The stub then recovers. After --open-seconds the breaker lets a probe
+through, and closes when it succeeds; the command shows the state
+transitions it went through. Breaker state is kept in a throwaway SQLite
+cache file, and chat data in a throwaway database.
+"""
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat_api import circuit, upstream
+from chat_api.cache import SQLiteCache
+from chat_api.circuit import TRANSITIONS, CircuitBreaker
+from chat_api.management.commands.bench_ai_chat import SlowModel
+from chat_api.views import AIChatView
+
+MODEL = 'lamini-t5'
+
+
+class Command(BaseCommand):
+    help = "Compare AI chat turn latency during an outage with and without the circuit breaker"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turns', type=int, default=40)
+        parser.add_argument('--clients', type=int, default=4)
+        parser.add_argument('--deadline', type=float, default=2, help='Upstream deadline of each call, in seconds')
+        parser.add_argument('--open-seconds', type=float, default=3, help='Time the breaker stays open')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        # Outlasts the deadline: the stub never answers in time
+        model = SlowModel(options['deadline'] + 1)
+        with tempfile.TemporaryDirectory() as directory:
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            saved = (
+                AIChatView.throttle_classes, upstream.huggingface.base_url, upstream.DEADLINE,
+                CircuitBreaker.cache, circuit.CIRCUIT_ENABLED, circuit.OPEN_SECONDS,
+            )
+            AIChatView.throttle_classes = []
+            upstream.huggingface.base_url = model.url
+            upstream.DEADLINE = options['deadline']
+            CircuitBreaker.cache = SQLiteCache(os.path.join(directory, 'cache.sqlite3'), {})
+            circuit.OPEN_SECONDS = options['open_seconds']
+            try:
+                user = User.objects.create_user('bench-circuit', 'bench-circuit@example.com', None)
+                token = str(AccessToken.for_user(user))
+                self.stdout.write(
+                    f'Model down; calls give up after {options["deadline"]:g}s; {options["turns"]} turns '
+                    f'from {options["clients"]} clients'
+                )
+                circuit.CIRCUIT_ENABLED = False
+                self._report('breaker off', self._run(token, options['turns'], options['clients']), options['turns'])
+                circuit.CIRCUIT_ENABLED = True
+                self._report('breaker on', self._run(token, options['turns'], options['clients']))
+                self._recover(token, model, options)
+            finally:
+                (
+                    AIChatView.throttle_classes, upstream.huggingface.base_url, upstream.DEADLINE,
+                    CircuitBreaker.cache, circuit.CIRCUIT_ENABLED, circuit.OPEN_SECONDS,
+                ) = saved
+                model.close()
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+    def _run(self, token, turns, clients):
+        """Latencies of `turns` chat turns sent from `clients` threads"""
+        latencies = []
+        remaining = iter(range(turns))
+        lock = threading.Lock()
+
+        def client():
+            api = APIClient()
+            api.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            try:
+                while True:
+                    with lock:
+                        turn = next(remaining, None)
+                    if turn is None:
+                        return
+                    started = time.perf_counter()
+                    # Distinct prompts, so no two turns share a call
+                    message = f'Question {turn}: how are you?'
+                    response = api.post('/api/chat/ai/', {'message': message, 'model': MODEL}, format='json')
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        raise RuntimeError(f'Chat turn answered {response.status_code}')
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies
+
+    def _report(self, name, latencies, waited=None):
+        if waited is None:
+            waited = len(latencies) - CircuitBreaker(MODEL).metrics()['rejected']
+        ordered = sorted(latencies)
+        p99 = ordered[min(int(len(ordered) * 0.99), len(ordered) - 1)]
+        self.stdout.write(
+            f'{name:<12} p50 {statistics.median(latencies) * 1000:8.1f} ms  p99 {p99 * 1000:8.1f} ms  '
+            f'total {sum(latencies):6.1f}s of worker time  {waited} of {len(latencies)} turns waited on the model'
+        )
+
+    def _recover(self, token, model, options):
+        breaker = CircuitBreaker(MODEL)
+        model.delay = 0.05
+        self.stdout.write(f'Model back up; breaker {breaker.state()}')
+        time.sleep(options['open_seconds'])
+        self.stdout.write(f'After {options["open_seconds"]:g}s: breaker {breaker.state()}')
+        self._run(token, 5, 1)
+        counts = breaker.metrics()
+        self.stdout.write(
+            f'After 5 more turns: breaker {breaker.state()}; transitions: '
+            + ', '.join(f'{old}->{new} {counts[f"{old}_to_{new}"]}' for old, new in TRANSITIONS)
+        )
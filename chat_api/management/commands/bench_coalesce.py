@@ -0,0 +1,157 @@
+"""
+Upstream calls made for bursts of identical AI chat prompts.
+
+A local stub stands in for Hugging Face and answers after --delay-ms. The
+command forks --workers worker processes with --clients threads each. In
+each of --rounds rounds, every client sends the same greeting at the same
+moment. Sampled calls are never shared, so sampling is turned off for the
+model under test. It runs three times:
+
+- off: every turn makes its own call;
+- per worker: the threads of a worker share calls;
+- shared: workers also share calls through the cache (CHAT_COALESCE_SHARED).
+
+Reports upstream calls per round, the median turn latency and the replies
+saved, which should be one per turn however many calls were made. Uses a
+throwaway database and a throwaway SQLite cache file.
+"""
+import multiprocessing
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat_api import coalesce, upstream
+from chat_api.ai_chat import AVAILABLE_MODELS
+from chat_api.cache import SQLiteCache
+from chat_api.circuit import CircuitBreaker
+from chat_api.coalesce import SharedFlights
+from chat_api.management.commands.bench_ai_chat import SlowModel
+from chat_api.models import ChatMessage
+from chat_api.views import AIChatView
+
+MODEL = 'lamini-t5'
+PROMPT = 'Hello'
+
+MODES = [
+    ('off', False, False),
+    ('per worker', True, False),
+    ('shared', True, True),
+]
+
+
+def _worker(tokens, rounds, barrier, results):
+    """Send each round's turns from one thread per token; runs in a forked process"""
+    latencies = []
+    lock = threading.Lock()
+
+    def client(token):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        try:
+            for _ in range(rounds):
+                barrier.wait()
+                started = time.perf_counter()
+                response = api.post('/api/chat/ai/', {'message': PROMPT, 'model': MODEL}, format='json')
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(f'Chat turn answered {response.status_code}')
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=client, args=(token,)) for token in tokens]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(latencies)
+
+
+class Command(BaseCommand):
+    help = "Count upstream calls for bursts of identical AI chat prompts, with and without coalescing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--clients', type=int, default=8, help='Threads per worker')
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--delay-ms', type=float, default=500, help='Time the stub model takes to answer')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        model = SlowModel(options['delay_ms'] / 1000)
+        with tempfile.TemporaryDirectory() as directory:
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            params = AVAILABLE_MODELS[MODEL]['params']
+            saved = (
+                AIChatView.throttle_classes, upstream.huggingface.base_url, CircuitBreaker.cache, SharedFlights.cache,
+                coalesce.COALESCE_ENABLED, coalesce.COALESCE_SHARED, params['do_sample'],
+            )
+            AIChatView.throttle_classes = []
+            params['do_sample'] = False
+            upstream.huggingface.base_url = model.url
+            bench_cache = SQLiteCache(os.path.join(directory, 'cache.sqlite3'), {})
+            CircuitBreaker.cache = SharedFlights.cache = bench_cache
+            try:
+                tokens = self._seed(options['workers'] * options['clients'])
+                turns = len(tokens) * options['rounds']
+                self.stdout.write(
+                    f'Stub model answers in {options["delay_ms"]:g} ms; {options["workers"]} workers x '
+                    f'{options["clients"]} clients send the same greeting at once, {options["rounds"]} rounds'
+                )
+                for name, enabled, shared in MODES:
+                    coalesce.COALESCE_ENABLED, coalesce.COALESCE_SHARED = enabled, shared
+                    saved_before = ChatMessage.objects.filter(is_user_message=False).count()
+                    calls_before = model.calls
+                    latencies = self._run(tokens, options)
+                    calls = model.calls - calls_before
+                    replies = ChatMessage.objects.filter(is_user_message=False).count() - saved_before
+                    self.stdout.write(
+                        f'{name:<11} {calls / options["rounds"]:5.1f} upstream calls per round of {len(tokens)} turns, '
+                        f'p50 {statistics.median(latencies) * 1000:7.1f} ms, {replies} replies saved for {turns} turns'
+                    )
+            finally:
+                (
+                    AIChatView.throttle_classes, upstream.huggingface.base_url, CircuitBreaker.cache,
+                    SharedFlights.cache, coalesce.COALESCE_ENABLED, coalesce.COALESCE_SHARED, params['do_sample'],
+                ) = saved
+                model.close()
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+    def _seed(self, count):
+        users = [
+            User.objects.create_user(f'bench-coalesce-{i}', f'bench-coalesce-{i}@example.com', None)
+            for i in range(count)
+        ]
+        return [str(AccessToken.for_user(user)) for user in users]
+
+    def _run(self, tokens, options):
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(len(tokens))
+        results = context.Queue()
+        # Forked workers must open their own database connections
+        connections.close_all()
+        per_worker = options['clients']
+        workers = [
+            context.Process(
+                target=_worker, args=(tokens[i * per_worker:(i + 1) * per_worker], options['rounds'], barrier, results)
+            )
+            for i in range(options['workers'])
+        ]
+        for worker in workers:
+            worker.start()
+        latencies = [latency for _ in workers for latency in results.get()]
+        for worker in workers:
+            worker.join()
+        return latencies
@@ -0,0 +1,102 @@
+"""
+Benchmark the streaming history export on a large synthetic history.
+
+Seeds a throwaway database with one user owning --messages messages,
+streams the export and samples the process RSS while it runs. Memory
+should stay flat no matter how many messages are exported.
+"""
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from chat_api.export import export_stream
+from chat_api.models import Conversation
+
+
+def current_rss_mb():
+    """
+    Private resident memory of this process in MiB (Linux). File-backed
+    pages are left out: with mmap_size set, the database pages SQLite reads
+    show up in RSS but belong to the page cache, not to the export.
+    """
+    with open('/proc/self/statm') as statm:
+        _, resident, shared = (int(value) for value in statm.read().split()[:3])
+    return (resident - shared) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class Command(BaseCommand):
+    help = "Stream an export of a large synthetic history and report RSS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1_000_000)
+        parser.add_argument('--conversations', type=int, default=1000)
+        parser.add_argument('--type', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument('--compress', action='store_true')
+        parser.add_argument('--samples', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                user = self._seed(options['messages'], options['conversations'])
+                self._stream(user, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _seed(self, messages, conversations):
+        started = time.perf_counter()
+        user = User.objects.create(username='bench-export')
+        Conversation.objects.bulk_create(
+            Conversation(user=user, title=f'Conversation {i}') for i in range(conversations)
+        )
+        first_conversation = Conversation.objects.filter(user=user).order_by('id').first().id
+        with connection.cursor() as cursor:
+            # The search index is irrelevant here and would dominate seeding time
+            cursor.execute('DROP TRIGGER IF EXISTS chat_api_search_message_insert')
+            cursor.execute(
+                """
+                WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < %s)
+                INSERT INTO chat_api_chatmessage
+                    (user_id, conversation_id, content, language, is_user_message, created_at)
+                SELECT %s, %s + i %% %s,
+                       'Synthetic message number ' || i || ' with some typical chat length text',
+                       CASE WHEN i %% 3 = 0 THEN 'ar' ELSE 'en' END, i %% 2 = 0,
+                       datetime('2025-01-01', '+' || i || ' seconds')
+                FROM n
+                """,
+                [messages, user.id, first_conversation, conversations]
+            )
+        self.stdout.write(f'Seeded {messages} messages in {time.perf_counter() - started:.1f}s')
+        return user
+
+    def _stream(self, user, options):
+        baseline = current_rss_mb()
+        expected = options['messages'] + (options['conversations'] if options['type'] == 'ndjson' else 0)
+        every = max(expected // options['samples'], 1)
+
+        started = time.perf_counter()
+        total_bytes = rows = 0
+        peak = baseline
+        next_sample = every
+        for block in export_stream(user.id, options['type'], compress=options['compress']):
+            total_bytes += len(block)
+            if not options['compress']:
+                rows += block.count(b'\n')
+                if rows >= next_sample:
+                    rss = current_rss_mb()
+                    peak = max(peak, rss)
+                    self.stdout.write(f'  {rows:>10} rows  RSS {rss:7.1f} MiB')
+                    next_sample += every
+        elapsed = time.perf_counter() - started
+        peak = max(peak, current_rss_mb())
+
+        self.stdout.write(
+            f'Exported {total_bytes / (1024 * 1024):.1f} MiB in {elapsed:.1f}s '
+            f'({options["messages"] / elapsed:,.0f} messages/s); '
+            f'RSS baseline {baseline:.1f} MiB, peak {peak:.1f} MiB'
+        )
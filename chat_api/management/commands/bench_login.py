@@ -0,0 +1,129 @@
+"""
+Benchmark password logins through the full login endpoint.
+
+Seeds a throwaway database with --users users, then logs in one at a time
+(the rate one core sustains) and from --threads threads at once, which
+the bounded password hashing pool (LOGIN_HASH_WORKERS) spreads over the
+available cores. Also reports the queries each login runs and how much of
+its time goes to verifying the password alone.
+"""
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+
+from chat_api.login import HASH_WORKERS, last_login
+from chat_api.models import UserProfile
+from chat_api.views import CustomTokenObtainPairView
+
+PASSWORD = 'bench-Passw0rd!'
+
+
+class Command(BaseCommand):
+    help = "Measure logins per second per core through POST /api/auth/login/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--logins', type=int, default=50, help='Sequential logins to time')
+        parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        # Lets the test client's host through ALLOWED_HOSTS
+        setup_test_environment()
+        with tempfile.TemporaryDirectory() as directory:
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            # The login throttle would stop the benchmark after a few requests
+            throttle_classes = CustomTokenObtainPairView.throttle_classes
+            CustomTokenObtainPairView.throttle_classes = []
+            try:
+                emails = self._seed(options['users'])
+                self._run(emails, options)
+            finally:
+                CustomTokenObtainPairView.throttle_classes = throttle_classes
+                last_login.flush()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+    def _seed(self, count):
+        # Every user shares one hash; hashing thousands of passwords would
+        # only slow the seeding down
+        encoded = make_password(PASSWORD)
+        users = User.objects.bulk_create(
+            User(username=f'bench-login-{i}', email=f'bench-login-{i}@example.com', password=encoded)
+            for i in range(count)
+        )
+        UserProfile.objects.bulk_create(
+            UserProfile(user=user, fullname=f'Bench User {i}', language_preference='en')
+            for i, user in enumerate(users)
+        )
+        return [user.email for user in users]
+
+    def _login(self, client, email):
+        response = client.post('/api/auth/login/', {'email': email, 'password': PASSWORD})
+        if response.status_code != 200:
+            raise RuntimeError(f'Login failed with {response.status_code}: {response.content[:200]}')
+
+    def _run(self, emails, options):
+        encoded = User.objects.values_list('password', flat=True).first()
+        hash_times = []
+        for _ in range(5):
+            started = time.perf_counter()
+            check_password(PASSWORD, encoded)
+            hash_times.append(time.perf_counter() - started)
+        hash_ms = statistics.median(hash_times) * 1000
+
+        client = APIClient()
+        self._login(client, emails[0])
+        # Counted with a wrapper: the test client resets connection.queries
+        # at the start of every request
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            self._login(client, emails[0])
+
+        times = []
+        for i in range(options['logins']):
+            started = time.perf_counter()
+            self._login(client, emails[i % len(emails)])
+            times.append(time.perf_counter() - started)
+        login_ms = statistics.median(times) * 1000
+        self.stdout.write(
+            f'Sequential: {1000 / login_ms:.1f} logins/s on one core, {login_ms:.1f} ms per login '
+            f'({hash_ms:.1f} ms verifying the password), {len(queries)} queries per login'
+        )
+
+        threads = options['threads']
+        per_thread = max(options['logins'] // threads, 1)
+        start = threading.Event()
+
+        def worker(offset):
+            thread_client = APIClient()
+            start.wait()
+            try:
+                for i in range(per_thread):
+                    self._login(thread_client, emails[(offset + i * threads) % len(emails)])
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for thread in workers:
+            thread.start()
+        started = time.perf_counter()
+        start.set()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        rate = threads * per_thread / elapsed
+        cores = min(threads, HASH_WORKERS, os.cpu_count() or 1)
+        self.stdout.write(
+            f'Concurrent: {threads} threads, {HASH_WORKERS} hashing workers: {rate:.1f} logins/s, '
+            f'{rate / cores:.1f} logins/s per core'
+        )
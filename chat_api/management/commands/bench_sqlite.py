@@ -0,0 +1,140 @@
+"""
+Concurrent read/write benchmark for the SQLite connection settings.
+
+Starts several writer and reader processes, like gunicorn workers, against
+a scratch database and reports throughput and "database is locked" errors,
+once with SQLite's defaults and once with settings.SQLITE_PRAGMAS.
+"""
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat_api.db import apply_sqlite_pragmas
+
+SCHEMA = [
+    'CREATE TABLE conversation (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, '
+    'message_count INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)',
+    'CREATE TABLE message (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, '
+    'conversation_id INTEGER NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL)',
+    'CREATE INDEX message_user_created ON message (user_id, created_at)',
+]
+
+
+def _connect(path, pragmas, timeout):
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    apply_sqlite_pragmas(connection.cursor(), pragmas)
+    return connection
+
+
+def _worker(role, path, pragmas, timeout, duration, users, results):
+    """Run chat turns (writer) or history page reads (reader) until the deadline"""
+    connection = _connect(path, pragmas, timeout)
+    cursor = connection.cursor()
+    ops = errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        user_id = random.randint(1, users)
+        try:
+            if role == 'writer':
+                now = time.time()
+                cursor.execute('BEGIN IMMEDIATE')
+                cursor.execute(
+                    'INSERT INTO message (user_id, conversation_id, content, created_at) '
+                    'VALUES (?, ?, ?, ?)', (user_id, user_id, 'x' * 200, now)
+                )
+                cursor.execute(
+                    'UPDATE conversation SET message_count = message_count + 1, '
+                    'updated_at = ? WHERE id = ?', (now, user_id)
+                )
+                cursor.execute('COMMIT')
+            else:
+                cursor.execute(
+                    'SELECT id, content FROM message WHERE user_id = ? '
+                    'ORDER BY created_at DESC LIMIT 50', (user_id,)
+                ).fetchall()
+            ops += 1
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            errors += 1
+            if connection.in_transaction:
+                cursor.execute('ROLLBACK')
+    connection.close()
+    results.put((role, ops, errors))
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent SQLite reads/writes with default and tuned pragmas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per run')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--seed-messages', type=int, default=20000)
+        parser.add_argument(
+            '--timeout', type=float, default=0.1,
+            help='Driver busy timeout in seconds (the tuned run overrides it with busy_timeout)'
+        )
+
+    def handle(self, *args, **options):
+        runs = [
+            ('defaults', {}, options['timeout']),
+            ('tuned', settings.SQLITE_PRAGMAS, options['timeout']),
+        ]
+        for label, pragmas, timeout in runs:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self._seed(path, pragmas, options)
+                self._run(label, path, pragmas, timeout, options)
+
+    def _seed(self, path, pragmas, options):
+        connection = _connect(path, pragmas, 30)
+        cursor = connection.cursor()
+        cursor.execute('BEGIN')
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        cursor.executemany(
+            'INSERT INTO conversation (id, user_id, updated_at) VALUES (?, ?, 0)',
+            [(i, i) for i in range(1, options['users'] + 1)]
+        )
+        cursor.executemany(
+            'INSERT INTO message (user_id, conversation_id, content, created_at) VALUES (?, ?, ?, ?)',
+            [(u, u, 'x' * 200, i) for i, u in (
+                (i, random.randint(1, options['users'])) for i in range(options['seed_messages'])
+            )]
+        )
+        cursor.execute('COMMIT')
+        connection.close()
+
+    def _run(self, label, path, pragmas, timeout, options):
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=_worker,
+                args=(role, path, pragmas, timeout, options['duration'], options['users'], results)
+            )
+            for role in ['writer'] * options['writers'] + ['reader'] * options['readers']
+        ]
+        for process in processes:
+            process.start()
+        totals = {'writer': [0, 0], 'reader': [0, 0]}
+        for _ in processes:
+            role, ops, errors = results.get()
+            totals[role][0] += ops
+            totals[role][1] += errors
+        for process in processes:
+            process.join()
+
+        duration = options['duration']
+        self.stdout.write(
+            f"{label:<9} writes/s {totals['writer'][0] / duration:>9.0f}  "
+            f"reads/s {totals['reader'][0] / duration:>9.0f}  "
+            f"lock errors {totals['writer'][1] + totals['reader'][1]:>6}"
+        )
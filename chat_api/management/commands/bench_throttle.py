@@ -0,0 +1,76 @@
+"""
+Microbenchmark of the per-request cost of a throttle check.
+
+Times one allow_request() call at a time, with the state for the user
+preset just below the quota (the request is allowed and recorded) and at
+the quota (the request is denied), for growing quota sizes. DRF's
+SimpleRateThrottle stores one timestamp per request in the window, so its
+cost grows with the quota; SlidingWindowRateThrottle's does not.
+"""
+import statistics
+import time
+from types import SimpleNamespace
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from rest_framework.throttling import UserRateThrottle
+
+from chat_api.throttling import SlidingWindowRateThrottle
+
+REQUEST = SimpleNamespace(user=SimpleNamespace(is_authenticated=True, pk=1))
+
+
+def _timestamps_state(throttle, count):
+    # Newest first, all inside the window, as SimpleRateThrottle keeps them
+    now = throttle.timer()
+    return [now - i * 1e-3 for i in range(count)]
+
+
+def _counters_state(throttle, count):
+    return (int(throttle.timer() // throttle.duration), count, 0)
+
+
+IMPLEMENTATIONS = [
+    ('timestamps', (UserRateThrottle,), _timestamps_state),
+    ('counters', (SlidingWindowRateThrottle, UserRateThrottle), _counters_state),
+]
+
+
+class Command(BaseCommand):
+    help = "Compare per-request throttle cost of DRF's timestamp list and the sliding-window counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quotas', default='10,100,1000,10000', help='Comma-separated requests per day')
+        parser.add_argument('--iterations', type=int, default=2000, help='Timed calls per case')
+        parser.add_argument(
+            '--cache', default=None,
+            help='Cache alias to use (default: a private in-process LocMemCache, to time the algorithm alone)'
+        )
+
+    def handle(self, *args, **options):
+        cache = caches[options['cache']] if options['cache'] else LocMemCache('bench-throttle', {})
+        quotas = [int(quota) for quota in options['quotas'].split(',')]
+
+        self.stdout.write(f"{'quota/day':>10}  {'state':<10}  {'allowed us':>10}  {'denied us':>10}")
+        for quota in quotas:
+            for label, bases, make_state in IMPLEMENTATIONS:
+                throttle_class = type('BenchThrottle', bases, {
+                    'scope': 'bench', 'rate': f'{quota}/day', 'cache': cache,
+                })
+                allowed = self._time(throttle_class, make_state, quota - 1, options['iterations'])
+                denied = self._time(throttle_class, make_state, quota, options['iterations'])
+                self.stdout.write(f'{quota:>10}  {label:<10}  {allowed:>10.1f}  {denied:>10.1f}')
+
+    def _time(self, throttle_class, make_state, count, iterations):
+        """Median microseconds of one allow_request() with `count` requests already recorded"""
+        throttle = throttle_class()
+        key = throttle.get_cache_key(REQUEST, None)
+        timings = []
+        for _ in range(iterations):
+            throttle.cache.set(key, make_state(throttle, count), throttle.duration)
+            started = time.perf_counter()
+            throttle_class().allow_request(REQUEST, None)
+            timings.append(time.perf_counter() - started)
+        throttle.cache.delete(key)
+        return statistics.median(timings) * 1e6
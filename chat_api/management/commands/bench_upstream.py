@@ -0,0 +1,185 @@
+"""
+Benchmark calls to an inference provider against a local stub server.
+
+Runs --calls POSTs through requests.post(), which opens a new connection
+for every call, and the same number through the pooled client in
+chat_api.upstream, which keeps connections alive. It reports the p50/p99
+latency of each and how many connections the server accepted. The stub
+serves TLS with a throwaway self-signed certificate when the openssl
+command is available, so the handshake the pool saves is counted.
+
+It then checks the failure handling: a call to an endpoint that answers
+503 twice succeeds on the third attempt, and a call to an endpoint that
+never answers returns within its deadline.
+"""
+import json
+import os
+import shutil
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+
+from chat_api.upstream import UpstreamClient
+
+PAYLOAD = {'inputs': 'Hello, how are you?', 'parameters': {'max_length': 100}}
+BODY = json.dumps([{'generated_text': "I'm fine, thank you."}]).encode()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, delay):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.delay = delay
+        self.connections = 0
+        self.flaky_calls = 0
+        self.lock = threading.Lock()
+
+    def get_request(self):
+        with self.lock:
+            self.connections += 1
+        return super().get_request()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive needs HTTP/1.1
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; with Nagle's algorithm the
+    # body would wait for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path == '/hang':
+            time.sleep(60)
+            return
+        if self.path == '/flaky':
+            with self.server.lock:
+                self.server.flaky_calls += 1
+                failing = self.server.flaky_calls <= 2
+            if failing:
+                self._respond(503, b'{"error": "Model is currently loading"}')
+                return
+        time.sleep(self.server.delay)
+        self._respond(200, BODY)
+
+    def _respond(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _percentile(times, fraction):
+    ordered = sorted(times)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000
+
+
+def _stub_client(base_url, verify):
+    client = UpstreamClient('stub', base_url)
+    session = client.session()
+    session.verify = verify
+    # REQUESTS_CA_BUNDLE would otherwise replace the stub's certificate
+    session.trust_env = False
+    return client
+
+
+class Command(BaseCommand):
+    help = "Compare upstream call latency with and without connection reuse, against a local stub"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=300)
+        parser.add_argument('--delay-ms', type=float, default=5, help='Time the stub takes to answer')
+        parser.add_argument('--no-tls', action='store_true', help='Serve plain HTTP')
+
+    def handle(self, *args, **options):
+        server = StubServer(options['delay_ms'] / 1000)
+        with tempfile.TemporaryDirectory() as directory:
+            verify = True
+            if not options['no_tls'] and shutil.which('openssl'):
+                verify = self._wrap_tls(server, directory)
+            scheme = 'http' if verify is True else 'https'
+            base_url = f'{scheme}://127.0.0.1:{server.server_address[1]}'
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                self.stdout.write(f'Stub server at {base_url}, answering in {options["delay_ms"]:g} ms')
+                self._compare(server, base_url, verify, options['calls'])
+                self._check_failures(base_url, verify)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+    def _wrap_tls(self, server, directory):
+        cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+        subprocess.run(
+            [
+                'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                '-keyout', key, '-out', cert, '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+            ],
+            check=True, capture_output=True
+        )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        return cert
+
+    def _time_calls(self, server, call, count):
+        call()  # warm up
+        before = server.connections
+        times = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = call()
+            times.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f'Stub answered {response.status_code}')
+        return times, server.connections - before
+
+    def _compare(self, server, base_url, verify, count):
+        client = _stub_client(base_url, verify)
+        modes = [
+            ('requests.post (new connection)', lambda: requests.post(
+                f'{base_url}/models/stub', json=PAYLOAD, verify=verify, timeout=(3.05, 20)
+            )),
+            ('pooled client (keep-alive)', lambda: client.post('models/stub', json=PAYLOAD)),
+        ]
+        results = []
+        for name, call in modes:
+            times, connections = self._time_calls(server, call, count)
+            p50, p99 = _percentile(times, 0.5), _percentile(times, 0.99)
+            results.append(p50)
+            self.stdout.write(
+                f'{name:<32} p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  mean {statistics.mean(times) * 1000:7.2f} ms  '
+                f'{connections} connections for {count} calls'
+            )
+        self.stdout.write(f'Connection reuse saves {results[0] - results[1]:.2f} ms per call at p50')
+
+    def _check_failures(self, base_url, verify):
+        client = _stub_client(base_url, verify)
+
+        started = time.perf_counter()
+        response = client.post('flaky', json=PAYLOAD)
+        self.stdout.write(
+            f'Two 503s then 200: got {response.status_code} after {time.perf_counter() - started:.2f}s'
+        )
+
+        started = time.perf_counter()
+        try:
+            client.post('hang', json=PAYLOAD, deadline=2)
+            outcome = 'a response'
+        except requests.RequestException as exc:
+            outcome = type(exc).__name__
+        self.stdout.write(
+            f'Hung upstream with a 2s deadline: {outcome} after {time.perf_counter() - started:.2f}s'
+        )
@@ -0,0 +1,69 @@
+"""
+Benchmark sustained message writes with and without write coalescing.
+
+Runs against a throwaway copy of the schema in a temporary file, so the
+configured database is never touched.
+"""
+import os
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from chat_api.models import Conversation
+from chat_api.views import create_chat_message
+from chat_api.write_queue import run_write
+
+
+class Command(BaseCommand):
+    help = "Compare message writes/s from many threads, inline vs. coalesced"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--messages', type=int, default=200, help='Messages per thread')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stderr.write('The write queue only matters on SQLite; nothing to compare.')
+            return
+
+        with tempfile.TemporaryDirectory() as directory:
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                user = User.objects.create(username='bench-writer')
+                conversations = [
+                    Conversation.objects.create(user=user, title=f'bench {i}')
+                    for i in range(options['threads'])
+                ]
+                for coalescing in (False, True):
+                    with override_settings(CHAT_WRITE_COALESCING=coalescing):
+                        rate = self._run(user, conversations, options['messages'])
+                    label = 'coalesced' if coalescing else 'inline'
+                    self.stdout.write(f'{label:<10} {rate:>9.0f} messages/s')
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _run(self, user, conversations, per_thread):
+        def worker(conversation):
+            for i in range(per_thread):
+                run_write(
+                    create_chat_message,
+                    user=user,
+                    content=f'message {i}',
+                    is_user_message=bool(i % 2),
+                    conversation=conversation
+                )
+            connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(c,)) for c in conversations]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(threads) * per_thread / (time.perf_counter() - started)
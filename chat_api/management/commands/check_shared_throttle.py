@@ -0,0 +1,94 @@
+"""
+Check that throttle quotas hold across worker processes.
+
+Starts several processes, like gunicorn workers, that all hammer one
+throttle for the same user at the same time through the configured cache,
+and fails unless exactly `--limit` requests were let through in total.
+With a per-process cache (LocMemCache) each worker would allow the full
+quota; without the shared lock, concurrent state updates get lost.
+"""
+import multiprocessing
+import os
+import time
+from types import SimpleNamespace
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.throttling import UserRateThrottle
+
+from chat_api.throttling import SharedUserRateThrottle, SlidingWindowRateThrottle
+
+
+def _throttle_class(cache_alias, limit, locked):
+    bases = (SharedUserRateThrottle,) if locked else (SlidingWindowRateThrottle, UserRateThrottle)
+    return type('CheckThrottle', bases, {
+        'scope': 'shared_throttle_check',
+        'rate': f'{limit}/hour',
+        'cache': caches[cache_alias],
+    })
+
+
+def _worker(cache_alias, limit, locked, ident, attempts, start, results):
+    throttle_class = _throttle_class(cache_alias, limit, locked)
+    request = SimpleNamespace(user=SimpleNamespace(is_authenticated=True, pk=ident))
+    start.wait()
+    allowed = 0
+    for _ in range(attempts):
+        if throttle_class().allow_request(request, None):
+            allowed += 1
+    results.put(allowed)
+
+
+class Command(BaseCommand):
+    help = "Verify that a throttle quota is enforced globally across worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--limit', type=int, default=50, help='Requests allowed per hour')
+        parser.add_argument(
+            '--attempts', type=int, default=None,
+            help='Requests made by each worker (default: --limit, so every worker alone could use the quota)'
+        )
+        parser.add_argument('--cache', default='default', help='Cache alias to check')
+        parser.add_argument(
+            '--without-lock', action='store_true',
+            help="Skip the shared lock, to show the updates lost without it"
+        )
+
+    def handle(self, *args, **options):
+        workers, limit = options['workers'], options['limit']
+        attempts = options['attempts'] or limit
+        locked = not options['without_lock']
+        ident = f'check-{os.getpid()}-{time.time_ns()}'
+
+        throttle = _throttle_class(options['cache'], limit, locked)()
+        throttle.cache.delete(throttle.cache_format % {'scope': throttle.scope, 'ident': ident})
+
+        start = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=_worker,
+                args=(options['cache'], limit, locked, ident, attempts, start, results)
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        started = time.perf_counter()
+        start.set()
+        allowed = [results.get() for _ in processes]
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+        throttle.cache.delete(throttle.cache_format % {'scope': throttle.scope, 'ident': ident})
+
+        backend = type(throttle.cache).__name__
+        self.stdout.write(
+            f'{backend}: {workers} workers x {attempts} requests, quota {limit}: '
+            f'{sum(allowed)} allowed ({", ".join(map(str, allowed))}) '
+            f'in {elapsed:.2f}s, {elapsed / (workers * attempts) * 1e6:.0f} us per check'
+        )
+        if sum(allowed) != limit:
+            raise CommandError(f'Quota not enforced globally: {sum(allowed)} requests allowed, expected {limit}.')
+        self.stdout.write(self.style.SUCCESS('Quota enforced across all workers.'))
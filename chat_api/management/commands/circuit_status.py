@@ -0,0 +1,28 @@
+"""
+Report the state of each AI chat model's circuit breaker.
+
+The state and the counts are kept in the shared cache, so they cover
+every worker process: state transitions and turns answered with the
+fallback while a breaker was open since the cache was last cleared, and
+the calls and failures of the current window.
+"""
+from django.core.management.base import BaseCommand
+
+from chat_api.ai_chat import AVAILABLE_MODELS
+from chat_api.circuit import TRANSITIONS, CircuitBreaker
+
+
+class Command(BaseCommand):
+    help = "Show state, transitions and rejected calls of the AI model circuit breakers"
+
+    def handle(self, *args, **options):
+        for model_id in AVAILABLE_MODELS:
+            breaker = CircuitBreaker(model_id)
+            counts = breaker.metrics()
+            transitions = '  '.join(
+                f'{old}->{new} {counts[f"{old}_to_{new}"]}' for old, new in TRANSITIONS
+            )
+            self.stdout.write(
+                f'{model_id:<16} {breaker.state():<9}  window {counts["window_failures"]}/{counts["window_calls"]} '
+                f'failed  rejected {counts["rejected"]}  {transitions}'
+            )
@@ -0,0 +1,110 @@
+"""
+Run EXPLAIN QUERY PLAN on the queries behind each API endpoint and fail
+if any of them falls back to a full table scan or a temporary sort.
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chat_api.accounts import taken_usernames
+from chat_api.deletion import hidden_conversations, visible_messages
+from chat_api.models import UserProfile, ChatMessage, Conversation, UserSummary
+from chat_api.pagination import (
+    MessageCursorPagination,
+    ConversationCursorPagination,
+    SummaryCursorPagination
+)
+
+
+def cursor_page(queryset, pagination_class, position='2025-01-01T00:00:00+00:00|1'):
+    """Apply the keyset condition and ordering a cursor page request runs"""
+    paginator = pagination_class()
+    ordering = paginator.ordering
+    queryset = queryset.order_by(*ordering)
+    queryset = queryset.filter(paginator._keyset_filter(queryset, ordering, position))
+    return queryset[:paginator.page_size + 1]
+
+
+def endpoint_queries(user_id=1, conversation_id=1, email='user@example.com'):
+    """Return (label, queryset) pairs mirroring the endpoints' read paths"""
+    messages = visible_messages(ChatMessage.objects.filter(user_id=user_id))
+    conversations = Conversation.objects.filter(user_id=user_id, deleted_at__isnull=True)
+    return [
+        ('login: user by email', User.objects.filter(email=email)),
+        ('register: usernames taken', taken_usernames(email.split('@')[0])),
+        ('profile: profile by user', UserProfile.objects.filter(user_id=user_id)),
+        ('messages: list', messages),
+        ('messages: list by language', messages.filter(language='ar')),
+        ('messages: cursor page', cursor_page(messages, MessageCursorPagination)),
+        ('messages: cursor page by language',
+         cursor_page(messages.filter(language='ar'), MessageCursorPagination)),
+        ('conversations: list', conversations),
+        ('conversations: list by language', conversations.filter(language='ar')),
+        ('conversations: cursor page', cursor_page(conversations, ConversationCursorPagination)),
+        ('conversations: cursor page by language',
+         cursor_page(conversations.filter(language='ar'), ConversationCursorPagination)),
+        ('conversations: messages',
+         ChatMessage.objects.filter(conversation_id=conversation_id).order_by('created_at')),
+        ('summaries: list', UserSummary.objects.filter(user_id=user_id)),
+        ('summaries: list by language',
+         UserSummary.objects.filter(user_id=user_id, language='ar')),
+        ('summaries: cursor page',
+         cursor_page(UserSummary.objects.filter(user_id=user_id), SummaryCursorPagination)),
+        ('chat/ai: recent history',
+         ChatMessage.objects.filter(user_id=user_id, conversation_id=conversation_id)
+         .order_by('-created_at')[:5]),
+        ('messages/export: conversations', conversations.order_by('id')),
+        ('messages/export: messages', messages.order_by('created_at', 'id')),
+        ('chat/summary: recent messages', messages.order_by('-created_at')[:50]),
+        ('purge: soft-deleted conversations', hidden_conversations().order_by('deleted_at')),
+        ('purge: message batch',
+         ChatMessage.objects.filter(conversation_id=conversation_id).values_list('id', flat=True)[:500]),
+    ]
+
+
+def plan_problems(plan):
+    """Return the plan lines that indicate a whole-table scan or a filesort"""
+    problems = []
+    for line in plan.splitlines():
+        detail = line.split(' ', 3)[-1] if line[:1].isdigit() else line
+        if detail.startswith('SCAN ') and 'CONSTANT ROW' not in detail:
+            problems.append(detail)
+        elif 'USE TEMP B-TREE' in detail:
+            problems.append(detail)
+    return problems
+
+
+class Command(BaseCommand):
+    help = "Check the query plan of every endpoint query and fail on table scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Run ANALYZE first so the planner uses real table statistics'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN checks are only supported on SQLite.')
+
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        failures = 0
+        for label, queryset in endpoint_queries():
+            plan = queryset.explain()
+            problems = plan_problems(plan)
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f'FAIL  {label}'))
+                for problem in problems:
+                    self.stdout.write(f'      {problem}')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'ok    {label}'))
+            if options['verbosity'] > 1:
+                for line in plan.splitlines():
+                    self.stdout.write(f'      | {line}')
+
+        if failures:
+            raise CommandError(f'{failures} query plan(s) scan a whole table or sort without an index.')
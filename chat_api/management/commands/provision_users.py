@@ -0,0 +1,67 @@
+"""
+Bulk-create users and profiles for load-test environments.
+
+Hashing is what makes registration slow, so the password is hashed once
+and the hash shared by every account created. Usernames continue after the
+highest '<prefix><n>' already taken, and rows are inserted with
+bulk_create in batches of --batch-size, so thousands of accounts take
+seconds. Every account logs in with --password.
+"""
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from chat_api.accounts import next_username_suffix
+from chat_api.models import LANGUAGE_CHOICES, UserProfile
+
+
+class Command(BaseCommand):
+    help = "Create many users with profiles and one shared password, for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int)
+        parser.add_argument('--prefix', default='loadtest', help='Username prefix; users are <prefix><n>')
+        parser.add_argument('--domain', default='example.com', help='Emails are <username>@<domain>')
+        parser.add_argument('--password', default='LoadTest-Passw0rd!')
+        parser.add_argument(
+            '--language', choices=[code for code, name in LANGUAGE_CHOICES] + ['mixed'], default='mixed',
+            help="Profile language; 'mixed' alternates between the supported languages"
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count, prefix = options['count'], options['prefix']
+        if count < 1:
+            raise CommandError('count must be at least 1.')
+
+        started = time.perf_counter()
+        encoded = make_password(options['password'])
+        languages = (
+            [code for code, name in LANGUAGE_CHOICES] if options['language'] == 'mixed' else [options['language']]
+        )
+
+        with transaction.atomic():
+            # Suffixes start at 1 even when the bare prefix is free
+            first = next_username_suffix(prefix) or 1
+            for start in range(0, count, options['batch_size']):
+                numbers = range(first + start, first + min(start + options['batch_size'], count))
+                users = User.objects.bulk_create(
+                    User(
+                        username=f'{prefix}{n}', email=f'{prefix}{n}@{options["domain"]}',
+                        first_name='Load', last_name=f'Test {n}', password=encoded
+                    )
+                    for n in numbers
+                )
+                UserProfile.objects.bulk_create(
+                    UserProfile(user=user, fullname=f'Load Test {n}', language_preference=languages[n % len(languages)])
+                    for n, user in zip(numbers, users)
+                )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {count} users ({prefix}{first} to {prefix}{first + count - 1}) with profiles '
+            f'in {elapsed:.1f}s; password: {options["password"]}'
+        ))
@@ -0,0 +1,35 @@
+"""
+Purge soft-deleted conversations and their messages.
+
+Web workers purge in a background thread right after a large conversation
+is deleted. This command catches up on anything left behind, for example
+when a worker was restarted mid-purge, and can be run from cron.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from chat_api.deletion import purge_deleted_conversations
+
+
+class Command(BaseCommand):
+    help = "Delete the messages of soft-deleted conversations in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Messages deleted per transaction (default: CHAT_PURGE_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--pause-ms', type=float, default=None,
+            help='Pause between batches so other writers get the lock (default: CHAT_PURGE_PAUSE_MS)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size is not None and batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        pause = options['pause_ms'] / 1000 if options['pause_ms'] is not None else None
+
+        conversations, messages = purge_deleted_conversations(batch_size=batch_size, pause=pause)
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {conversations} conversations and {messages} messages.'
+        ))
@@ -0,0 +1,69 @@
+"""
+Recompute the denormalized message statistics stored on Conversation.
+
+Used to backfill existing databases after the counters were introduced,
+and to detect (and repair) drift between the counters and the messages.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from chat_api.counters import expected_counters, refresh_conversation_counters
+from chat_api.models import Conversation
+
+COUNTER_FIELDS = ('message_count', 'last_message_at', 'last_message_preview', 'last_message_is_user')
+
+
+class Command(BaseCommand):
+    help = "Rebuild conversation message counters in batches and report drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of conversations recomputed per transaction'
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report conversations whose counters drifted; exit non-zero if any did'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        scanned = drifted = 0
+        last_pk = 0
+        while True:
+            # Walk the primary key so every batch is a short, indexed range
+            batch = list(
+                Conversation.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1]
+            scanned += len(batch)
+
+            with transaction.atomic():
+                rows = Conversation.objects.filter(pk__in=batch).annotate(
+                    **{f'expected_{name}': expr for name, expr in expected_counters().items()}
+                ).values('pk', *COUNTER_FIELDS, *(f'expected_{name}' for name in COUNTER_FIELDS))
+                stale = [
+                    row['pk'] for row in rows
+                    if any(row[name] != row[f'expected_{name}'] for name in COUNTER_FIELDS)
+                ]
+                drifted += len(stale)
+                if stale and not options['check']:
+                    refresh_conversation_counters(stale)
+
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Scanned up to conversation {last_pk}: {len(stale)} drifted')
+
+        if options['check']:
+            if drifted:
+                raise CommandError(f'{drifted} of {scanned} conversations have drifted counters.')
+            self.stdout.write(self.style.SUCCESS(f'All {scanned} conversations are consistent.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Scanned {scanned} conversations, repaired {drifted}.'
+            ))
@@ -0,0 +1,22 @@
+"""
+Report the response cache's hit and miss counts.
+
+The counts are kept in the shared cache and summed over every worker
+process; each process adds its own in batches, so the most recent lookups
+of a running worker may not be included yet.
+"""
+from django.core.management.base import BaseCommand
+
+from chat_api import views  # noqa: F401  (defines the cached views)
+from chat_api.response_cache import CachedListMixin, metrics
+
+
+class Command(BaseCommand):
+    help = "Show hits, misses and hit rate of the per-user response cache"
+
+    def handle(self, *args, **options):
+        for view in CachedListMixin.__subclasses__():
+            hits, misses = metrics.counts(view.cache_endpoint)
+            lookups = hits + misses
+            rate = f'{hits / lookups:.1%}' if lookups else 'n/a'
+            self.stdout.write(f'{view.cache_endpoint:<15} hits {hits:>10}  misses {misses:>10}  hit rate {rate}')
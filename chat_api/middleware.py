@@ -1,10 +1,11 @@
-from django.utils.translation import activate
+from django.conf import settings
+from django.utils.translation import activate, gettext_lazy, override
 from django.utils.deprecation import MiddlewareMixin
-from .models import UserProfile
+from rest_framework.renderers import JSONRenderer
+from .language import resolve_language
+from .throttling import SlidingWindowRateThrottle
 import logging
-import time
-from django.http import JsonResponse
-from django.utils.translation import gettext as _
+import math
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -14,33 +15,63 @@ class LanguageMiddleware(MiddlewareMixin):
     Middleware to set the language based on user preference or request header
     """
     def process_request(self, request):
-        language = 'en'  # Default language
-        
-        # Check if user is authenticated and has a language preference
-        if request.user.is_authenticated:
-            try:
-                profile = UserProfile.objects.get(user=request.user)
-                language = profile.language_preference
-            except UserProfile.DoesNotExist:
-                pass
-        
-        # If no user profile, check Accept-Language header
-        if language == 'en' and 'HTTP_ACCEPT_LANGUAGE' in request.META:
-            accept_language = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
-            if accept_language.startswith('ar'):
-                language = 'ar'
-        
         # Activate the language for this request
-        activate(language)
+        activate(resolve_language(request))
         return None
 
+def _throttle_scopes(throttle_class=SlidingWindowRateThrottle):
+    """Every (scope, message) pair of the sliding-window throttles"""
+    for subclass in throttle_class.__subclasses__():
+        if getattr(subclass, 'scope', None):
+            yield subclass.scope, subclass.message
+        yield from _throttle_scopes(subclass)
+
 class RateLimitMiddleware(MiddlewareMixin):
     """
     Middleware to improve rate limit error messages and logging.
     This middleware intercepts rate limit responses and enhances them with
     more user-friendly messages and logs rate limit events.
+
+    Responses to throttled endpoints get RateLimit-Limit, RateLimit-Remaining
+    and RateLimit-Reset headers for the scope with the least quota left, and
+    429 responses a Retry-After header. The localized 429 bodies are rendered
+    once, when the middleware is loaded, for every language and message.
     """
+    # Messages for throttles without their own, by path prefix
+    path_messages = (
+        ('/api/chat/ai/', gettext_lazy("You've reached your AI chat limit. Please try again later.")),
+        ('/api/auth/', gettext_lazy("Too many authentication attempts. Please try again later.")),
+        ('/api/chat/summary/', gettext_lazy("You've reached your summary generation limit. Please try again later.")),
+        ('', gettext_lazy("Too many requests. Please try again later.")),
+    )
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        # {(language, path prefix or 'throttled_<scope>' code): body bytes}
+        self.bodies = {}
+        for language, name in settings.LANGUAGES:
+            for prefix, message in self.path_messages:
+                self.render_body(language, prefix, message)
+            for scope, message in _throttle_scopes():
+                self.render_body(language, f'throttled_{scope}', message)
+
+    def render_body(self, language, key, message):
+        with override(language):
+            body = JSONRenderer().render({'detail': str(message), 'status_code': 429})
+        self.bodies[language, key] = body
+        return body
+
     def process_response(self, request, response):
+        throttle = getattr(request, 'rate_limit', None)
+        if throttle is not None:
+            reset = throttle.reset()
+            response['RateLimit-Limit'] = str(throttle.num_requests)
+            response['RateLimit-Remaining'] = str(throttle.remaining())
+            if reset is not None:
+                response['RateLimit-Reset'] = str(math.ceil(reset))
+                if response.status_code == 429 and not response.has_header('Retry-After'):
+                    response['Retry-After'] = str(math.ceil(reset))
+
         # Check if the response is a rate limit response (status code 429)
         if response.status_code == 429:
             # Log the rate limit event
@@ -52,43 +83,25 @@ class RateLimitMiddleware(MiddlewareMixin):
                 f"Rate limit exceeded - User: {user_id}, IP: {ip_address}, Path: {path}"
             )
             
-            # Get the user's language
-            language = 'en'
-            if request.user.is_authenticated:
-                try:
-                    profile = UserProfile.objects.get(user=request.user)
-                    language = profile.language_preference
-                except UserProfile.DoesNotExist:
-                    pass
+            # Resolved again only if authentication changed the user
+            language = resolve_language(request)
             
-            # Activate the language for the response
-            activate(language)
-            
-            # Create a more user-friendly response
-            if path.startswith('/api/chat/ai/'):
-                message = _("You've reached your AI chat limit. Please try again later.")
-            elif path.startswith('/api/auth/'):
-                message = _("Too many authentication attempts. Please try again later.")
-            elif path.startswith('/api/chat/summary/'):
-                message = _("You've reached your summary generation limit. Please try again later.")
+            # Pick the user-friendly body. Composite throttles already name
+            # the exceeded scope (code 'throttled_<scope>').
+            detail = response.data.get('detail') if isinstance(getattr(response, 'data', None), dict) else None
+            code = getattr(detail, 'code', '')
+            if code.startswith('throttled_'):
+                body = self.bodies.get((language, code)) or self.render_body(language, code, detail)
             else:
-                message = _("Too many requests. Please try again later.")
+                prefix, message = next(
+                    (prefix, message) for prefix, message in self.path_messages if path.startswith(prefix)
+                )
+                body = self.bodies.get((language, prefix)) or self.render_body(language, prefix, message)
             
-            # If it's a DRF response, modify it
-            if hasattr(response, 'data'):
-                response.data = {
-                    'detail': message,
-                    'status_code': 429
-                }
-                response._is_rendered = False
-                response.render()
-            # If it's a regular HttpResponse, replace it
-            else:
-                new_response = JsonResponse({
-                    'detail': message,
-                    'status_code': 429
-                }, status=429)
-                return new_response
+            response.content = body
+            response['Content-Type'] = 'application/json'
+            if response.has_header('Content-Length'):
+                response['Content-Length'] = str(len(body))
                 
         return response
     
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.10 on 2026-10-17 04:18
+
+from django.db import migrations, models
+
+
+USER_EMAIL_INDEX = models.Index(fields=["email"], name="auth_user_email_idx")
+
+
+def add_user_email_index(apps, schema_editor):
+    # auth.User belongs to another app, so the index cannot live in its Meta
+    User = apps.get_model("auth", "User")
+    schema_editor.add_index(User, USER_EMAIL_INDEX)
+
+
+def remove_user_email_index(apps, schema_editor):
+    User = apps.get_model("auth", "User")
+    schema_editor.remove_index(User, USER_EMAIL_INDEX)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("chat_api", "0003_chatmessage_conversation"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["user", "created_at"], name="msg_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["user", "language", "created_at"],
+                name="msg_user_lang_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["conversation", "created_at"], name="msg_conv_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="conversation",
+            index=models.Index(
+                fields=["user", "-updated_at"], name="conv_user_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="conversation",
+            index=models.Index(
+                fields=["user", "language", "-updated_at"],
+                name="conv_user_lang_updated_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="usersummary",
+            index=models.Index(
+                fields=["user", "created_at"], name="summary_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="usersummary",
+            index=models.Index(
+                fields=["user", "language", "created_at"],
+                name="summary_user_lang_created_idx",
+            ),
+        ),
+        migrations.RunPython(add_user_email_index, remove_user_email_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.10 on 2026-10-17 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat_api", "0004_composite_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="conversation",
+            name="conv_user_updated_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="conversation",
+            name="conv_user_lang_updated_idx",
+        ),
+        migrations.AddIndex(
+            model_name="conversation",
+            index=models.Index(
+                fields=["user", "-updated_at", "-id"], name="conv_user_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="conversation",
+            index=models.Index(
+                fields=["user", "language", "-updated_at", "-id"],
+                name="conv_user_lang_updated_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.10 on 2026-10-17 04:23
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
+
+
+def backfill_counters(apps, schema_editor):
+    # One set-based UPDATE, so existing conversations do not show zero
+    # messages and no preview until the counters are rebuilt
+    Conversation = apps.get_model("chat_api", "Conversation")
+    ChatMessage = apps.get_model("chat_api", "ChatMessage")
+    messages = ChatMessage.objects.filter(conversation=OuterRef("pk"))
+    last_message = messages.order_by("-created_at", "-id")
+    message_count = (
+        messages.order_by()
+        .values("conversation")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    Conversation.objects.update(
+        message_count=Coalesce(Subquery(message_count), Value(0)),
+        last_message_at=Subquery(last_message.values("created_at")[:1]),
+        last_message_preview=Coalesce(
+            Substr(Subquery(last_message.values("content")[:1]), 1, 100),
+            Value(""),
+        ),
+        last_message_is_user=Subquery(
+            last_message.values("is_user_message")[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat_api", "0005_conversation_cursor_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="last_message_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Last Message At"
+            ),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="last_message_is_user",
+            field=models.BooleanField(
+                blank=True, null=True, verbose_name="Last Message Is User"
+            ),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="last_message_preview",
+            field=models.CharField(
+                blank=True,
+                default="",
+                max_length=100,
+                verbose_name="Last Message Preview",
+            ),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="message_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Message Count"),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.10 on 2026-10-17 04:31
+# The FTS5 index and its triggers are SQLite-specific; on other databases
+# this migration is a no-op and the search endpoint reports it is unavailable.
+# The triggers call chat_normalize(), registered by chat_api.db.
+
+from django.db import migrations
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE chat_api_search USING fts5(
+        owner, body, title, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER chat_api_search_message_insert
+    AFTER INSERT ON chat_api_chatmessage BEGIN
+        INSERT INTO chat_api_search (rowid, owner, body, title)
+        VALUES (
+            new.id, 'u' || new.user_id, chat_normalize(new.content),
+            coalesce((SELECT chat_normalize(title) FROM chat_api_conversation
+                      WHERE id = new.conversation_id), '')
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER chat_api_search_message_update
+    AFTER UPDATE OF content, user_id, conversation_id ON chat_api_chatmessage BEGIN
+        UPDATE chat_api_search SET
+            owner = 'u' || new.user_id,
+            body = chat_normalize(new.content),
+            title = coalesce((SELECT chat_normalize(title) FROM chat_api_conversation
+                              WHERE id = new.conversation_id), '')
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_api_search_message_delete
+    AFTER DELETE ON chat_api_chatmessage BEGIN
+        DELETE FROM chat_api_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_api_search_conversation_update
+    AFTER UPDATE OF title ON chat_api_conversation BEGIN
+        UPDATE chat_api_search SET title = chat_normalize(new.title)
+        WHERE rowid IN (SELECT id FROM chat_api_chatmessage WHERE conversation_id = new.id);
+    END
+    """,
+    """
+    INSERT INTO chat_api_search (rowid, owner, body, title)
+    SELECT m.id, 'u' || m.user_id, chat_normalize(m.content), coalesce(chat_normalize(c.title), '')
+    FROM chat_api_chatmessage m LEFT JOIN chat_api_conversation c ON c.id = m.conversation_id
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS chat_api_search_conversation_update",
+    "DROP TRIGGER IF EXISTS chat_api_search_message_delete",
+    "DROP TRIGGER IF EXISTS chat_api_search_message_update",
+    "DROP TRIGGER IF EXISTS chat_api_search_message_insert",
+    "DROP TABLE IF EXISTS chat_api_search",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat_api", "0006_conversation_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
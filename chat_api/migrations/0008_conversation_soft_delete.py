@@ -0,0 +1,26 @@
+# Generated by Django 4.2.10 on 2026-10-17 04:36
+# deleted_at is nullable without a default, so SQLite adds it with ALTER
+# TABLE instead of rebuilding the table (which would drop the search
+# triggers created in 0007).
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat_api", "0007_message_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="deleted_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Deleted At"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="conversation",
+            index=models.Index(fields=["deleted_at"], name="conv_deleted_idx"),
+        ),
+    ]
@@ -0,0 +1,154 @@
+# Generated by Django 4.2.10 on 2026-10-17 06:10
+# The search triggers created in 0007 call chat_normalize(), a Python
+# function registered only on connections opened by Django, so a write to
+# chat_api_chatmessage or chat_api_conversation from any other client (the
+# sqlite3 shell, a backup tool, a script) failed with "no such function".
+#
+# The index rows are now read from the chat_api_search_source view, which
+# normalizes in plain SQL with replace(). One expression of 64 nested
+# replace() calls overflows SQLite's parser, so the view applies them in
+# stages of 16, one CTE each. Lookups by id still use the primary keys.
+# The normalization must stay in step with
+# chat_api.search.normalize_search_text(), which normalizes queries.
+
+from django.db import migrations
+
+# Harakat, superscript alef, Quranic annotation marks and tatweel are
+# removed; alef with madda, hamza above, hamza below and wasla become alef,
+# alef maksura yaa and taa marbuta haa
+REPLACEMENTS = [
+    *((code, None) for code in range(0x0610, 0x061B)),
+    *((code, None) for code in range(0x064B, 0x0660)),
+    (0x0670, None),
+    *((code, None) for code in range(0x06D6, 0x06EE)),
+    (0x0640, None),
+    (0x0622, 0x0627), (0x0623, 0x0627), (0x0625, 0x0627), (0x0671, 0x0627),
+    (0x0649, 0x064A), (0x0629, 0x0647),
+]
+STAGE_SIZE = 16
+
+
+def _replaced(column, replacements):
+    expression = column
+    for old, new in replacements:
+        replacement = f"char({new})" if new else "''"
+        expression = f"replace({expression}, char({old}), {replacement})"
+    return expression
+
+
+def source_view_sql():
+    stages = [
+        "s0 AS (SELECT m.id, 'u' || m.user_id AS owner, m.content AS body, coalesce(c.title, '') AS title "
+        "FROM chat_api_chatmessage m LEFT JOIN chat_api_conversation c ON c.id = m.conversation_id)"
+    ]
+    for number, start in enumerate(range(0, len(REPLACEMENTS), STAGE_SIZE), 1):
+        replacements = REPLACEMENTS[start:start + STAGE_SIZE]
+        stages.append(
+            f"s{number} AS (SELECT id, owner, {_replaced('body', replacements)} AS body, "
+            f"{_replaced('title', replacements)} AS title FROM s{number - 1})"
+        )
+    return (
+        f"CREATE VIEW chat_api_search_source AS WITH {', '.join(stages)} "
+        f"SELECT id, owner, body, title FROM s{len(stages) - 1}"
+    )
+
+
+TRIGGER_NAMES = [
+    "chat_api_search_message_insert",
+    "chat_api_search_message_update",
+    "chat_api_search_conversation_update",
+]
+
+PLAIN_SQL_TRIGGERS = [
+    """
+    CREATE TRIGGER chat_api_search_message_insert
+    AFTER INSERT ON chat_api_chatmessage BEGIN
+        INSERT INTO chat_api_search (rowid, owner, body, title)
+        SELECT id, owner, body, title FROM chat_api_search_source WHERE id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_api_search_message_update
+    AFTER UPDATE OF content, user_id, conversation_id ON chat_api_chatmessage BEGIN
+        UPDATE chat_api_search SET (owner, body, title) = (
+            SELECT owner, body, title FROM chat_api_search_source WHERE id = new.id
+        )
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_api_search_conversation_update
+    AFTER UPDATE OF title ON chat_api_conversation BEGIN
+        UPDATE chat_api_search SET title = (
+            SELECT title FROM chat_api_search_source WHERE id = chat_api_search.rowid
+        )
+        WHERE rowid IN (SELECT id FROM chat_api_chatmessage WHERE conversation_id = new.id);
+    END
+    """,
+]
+
+# As created by 0007
+UDF_TRIGGERS = [
+    """
+    CREATE TRIGGER chat_api_search_message_insert
+    AFTER INSERT ON chat_api_chatmessage BEGIN
+        INSERT INTO chat_api_search (rowid, owner, body, title)
+        VALUES (
+            new.id, 'u' || new.user_id, chat_normalize(new.content),
+            coalesce((SELECT chat_normalize(title) FROM chat_api_conversation
+                      WHERE id = new.conversation_id), '')
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER chat_api_search_message_update
+    AFTER UPDATE OF content, user_id, conversation_id ON chat_api_chatmessage BEGIN
+        UPDATE chat_api_search SET
+            owner = 'u' || new.user_id,
+            body = chat_normalize(new.content),
+            title = coalesce((SELECT chat_normalize(title) FROM chat_api_conversation
+                              WHERE id = new.conversation_id), '')
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_api_search_conversation_update
+    AFTER UPDATE OF title ON chat_api_conversation BEGIN
+        UPDATE chat_api_search SET title = chat_normalize(new.title)
+        WHERE rowid IN (SELECT id FROM chat_api_chatmessage WHERE conversation_id = new.id);
+    END
+    """,
+]
+
+
+def _drop_triggers(schema_editor):
+    for name in TRIGGER_NAMES:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def use_plain_sql(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    _drop_triggers(schema_editor)
+    schema_editor.execute(source_view_sql())
+    for statement in PLAIN_SQL_TRIGGERS:
+        schema_editor.execute(statement)
+
+
+def use_udf(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    _drop_triggers(schema_editor)
+    schema_editor.execute("DROP VIEW IF EXISTS chat_api_search_source")
+    for statement in UDF_TRIGGERS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat_api", "0008_conversation_soft_delete"),
+    ]
+
+    operations = [
+        migrations.RunPython(use_plain_sql, use_udf),
+    ]
@@ -38,11 +38,32 @@ class Conversation(models.Model):
         default='en',
         verbose_name=_('Conversation Language')
     )
+    # Denormalized message statistics, maintained by chat_api.counters
+    message_count = models.PositiveIntegerField(default=0, verbose_name=_('Message Count'))
+    last_message_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Last Message At'))
+    last_message_preview = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name=_('Last Message Preview')
+    )
+    last_message_is_user = models.BooleanField(null=True, blank=True, verbose_name=_('Last Message Is User'))
+    # Set when a large conversation is soft-deleted; it is hidden from then
+    # on and its messages are purged in the background (chat_api.deletion)
+    deleted_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Deleted At'))
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Conversation list: filter by user, newest activity first. The id
+            # is spelled out so the (updated_at, id) cursor order needs no sort.
+            models.Index(fields=['user', '-updated_at', '-id'], name='conv_user_updated_idx'),
+            models.Index(fields=['user', 'language', '-updated_at', '-id'], name='conv_user_lang_updated_idx'),
+            # Finding the few soft-deleted conversations awaiting a purge
+            models.Index(fields=['deleted_at'], name='conv_deleted_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.user.username})"
@@ -65,6 +86,13 @@ class ChatMessage(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Message list and summary source: filter by user, ordered by time
+            models.Index(fields=['user', 'created_at'], name='msg_user_created_idx'),
+            models.Index(fields=['user', 'language', 'created_at'], name='msg_user_lang_created_idx'),
+            # Messages of a single conversation, oldest first
+            models.Index(fields=['conversation', 'created_at'], name='msg_conv_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}: {self.content[:30]}..."
@@ -87,6 +115,10 @@ class UserSummary(models.Model):
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = 'User Summaries'
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='summary_user_created_idx'),
+            models.Index(fields=['user', 'language', 'created_at'], name='summary_user_lang_created_idx'),
+        ]
 
     def __str__(self):
         return f"Summary for {self.user.username} ({self.language})"
@@ -0,0 +1,167 @@
+"""
+Keyset (cursor) pagination for the chat list endpoints.
+"""
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination keyed on a (timestamp, id) pair.
+
+    DRF's CursorPagination positions on the first ordering field only and
+    uses an offset to step over ties. Here the cursor carries both the
+    timestamp and the primary key of the boundary row, so a page is a
+    single indexed range query, rows inserted concurrently never shift the
+    following pages, and no COUNT(*) is ever run.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        assert len(self.ordering) == 2 and self.ordering[1].lstrip('-') == 'id', (
+            'KeysetCursorPagination expects an ordering of (<field>, id).'
+        )
+
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor.reverse if self.cursor else False
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(_invert(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+
+        if self.cursor and self.cursor.position is not None:
+            queryset = queryset.filter(self._keyset_filter(queryset, ordering, self.cursor.position))
+
+        # Fetch one extra row to find out whether there is a following page
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = self.cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        field_name = ordering[0].lstrip('-')
+        if isinstance(instance, dict):
+            value, pk = instance[field_name], instance['id']
+        else:
+            value, pk = getattr(instance, field_name), instance.pk
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        return f'{value}|{pk}'
+
+    def _keyset_filter(self, queryset, ordering, position):
+        """
+        Build the "rows after (value, pk)" condition for the given ordering.
+
+        Written as a range on the leading column minus the rows sharing its
+        value that were already returned, so SQLite can still walk the
+        composite index instead of expanding an OR.
+        """
+        field_name = ordering[0].lstrip('-')
+        descending = ordering[0].startswith('-')
+        try:
+            raw_value, raw_pk = position.rsplit('|', 1)
+            pk = int(raw_pk)
+            value = raw_value
+            if queryset.model._meta.get_field(field_name).get_internal_type() == 'DateTimeField':
+                value = parse_datetime(raw_value)
+                if value is None:
+                    raise ValueError(raw_value)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        range_lookup, seen_lookup = ('lte', 'gte') if descending else ('gte', 'lte')
+        return Q(**{f'{field_name}__{range_lookup}': value}) & ~Q(
+            **{field_name: value, f'id__{seen_lookup}': pk}
+        )
+
+
+def _invert(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+class MessageCursorPagination(KeysetCursorPagination):
+    """Messages in chronological order, oldest first"""
+    ordering = ('created_at', 'id')
+
+
+class ConversationCursorPagination(KeysetCursorPagination):
+    """Conversations by most recent activity"""
+    ordering = ('-updated_at', '-id')
+
+
+class SummaryCursorPagination(KeysetCursorPagination):
+    """Summaries newest first"""
+    ordering = ('-created_at', '-id')
+
+
+class SearchCursorPagination(KeysetCursorPagination):
+    """
+    Forward-only cursor over ranked search results, keyed on (score, id).
+
+    Paginates a search callable rather than a queryset: it is called as
+    search(limit, after) and returns (id, score, ...) rows best match first.
+    """
+    ordering = ('score', 'id')
+
+    def paginate_queryset(self, search, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+
+        after = None
+        if self.cursor and self.cursor.position is not None:
+            try:
+                raw_score, raw_pk = self.cursor.position.rsplit('|', 1)
+                after = (float(raw_score), int(raw_pk))
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = search(self.page_size + 1, after)
+        self.page = rows[:self.page_size]
+        self.has_next = len(rows) > self.page_size
+        self.has_previous = False
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        pk, score = self.page[-1][:2]
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=f'{score!r}|{pk}'))
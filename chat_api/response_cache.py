@@ -0,0 +1,163 @@
+"""
+Server-side cache of rendered list responses, per user.
+
+Clients poll the conversation and summary lists far more often than the
+data changes. A cached response is stored as rendered bytes under
+(user, version, endpoint, language, query string), and served before the
+queryset or the serializers run. Every user has a version number in the
+shared cache, bumped after commit whenever one of their conversations,
+messages, summaries or their profile is saved or deleted. Invalidation is
+a single increment: entries under older versions are never read again and
+expire after CHAT_RESPONSE_CACHE_TIMEOUT seconds.
+
+Message deletions do not bump through signals: a post_delete receiver on
+ChatMessage would stop Django from deleting a conversation's messages with
+one set-based DELETE. The deletion, import and counter helpers call
+bump_version() themselves instead.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.http import urlencode
+
+from .language import resolve_language
+from .models import ChatMessage, Conversation, UserProfile, UserSummary
+
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'CHAT_RESPONSE_CACHE_TIMEOUT', 300)
+RESPONSE_CACHE_ENABLED = getattr(settings, 'CHAT_RESPONSE_CACHE', True)
+
+# Hit and miss counts are added to the shared counters in batches of this
+# many lookups per process
+METRICS_FLUSH_EVERY = 100
+
+
+def _version_key(user_id):
+    return f'response_version_{user_id}'
+
+
+def _new_version():
+    # A version that appears after its key was evicted starts from the
+    # clock, above any number the lost counter could have reached, so
+    # entries stored under old versions are never mistaken for current ones
+    return time.time_ns() // 1000
+
+
+def user_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(user_id):
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _new_version(), None)
+
+
+def bump_version(*user_ids):
+    """Invalidate the cached responses of these users once the transaction commits"""
+    for user_id in set(user_ids):
+        transaction.on_commit(lambda user_id=user_id: _bump(user_id))
+
+
+class ResponseCacheMetrics:
+    """Per-endpoint hit and miss counts, shared by all worker processes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def record(self, endpoint, hit):
+        name = f'response_cache_{"hits" if hit else "misses"}_{endpoint}'
+        with self._lock:
+            self._pending[name] = self._pending.get(name, 0) + 1
+            if sum(self._pending.values()) < METRICS_FLUSH_EVERY:
+                return
+            pending, self._pending = self._pending, {}
+        self._add(pending)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        self._add(pending)
+
+    def _add(self, counts):
+        for name, count in counts.items():
+            cache.add(name, 0, None)
+            cache.incr(name, count)
+
+    def counts(self, endpoint):
+        """(hits, misses) of an endpoint across all processes"""
+        self.flush()
+        values = cache.get_many([f'response_cache_hits_{endpoint}', f'response_cache_misses_{endpoint}'])
+        return values.get(f'response_cache_hits_{endpoint}', 0), values.get(f'response_cache_misses_{endpoint}', 0)
+
+
+metrics = ResponseCacheMetrics()
+
+
+class CachedListMixin:
+    """
+    Serve a list view's GET from the response cache. Set `cache_endpoint`
+    to a name unique among the cached views.
+    """
+    cache_endpoint = None
+
+    def _response_cache_key(self, request):
+        if not (RESPONSE_CACHE_ENABLED and request.user.is_authenticated):
+            return None
+        if request.accepted_renderer.format != 'json':
+            # The browsable API renders differently for every request
+            return None
+        query = hashlib.blake2b(
+            urlencode(sorted(request.query_params.lists()), doseq=True).encode(), digest_size=16
+        ).hexdigest()
+        return (
+            f'response_cache_{request.user.pk}_{user_version(request.user.pk)}_'
+            f'{self.cache_endpoint}_{resolve_language(request)}_{query}'
+        )
+
+    def list(self, request, *args, **kwargs):
+        key = self._response_cache_key(request)
+        if key is not None:
+            cached = cache.get(key)
+            metrics.record(self.cache_endpoint, hit=cached is not None)
+            if cached is not None:
+                content_type, body = cached
+                response = HttpResponse(body, content_type=content_type)
+                response['X-Response-Cache'] = 'hit'
+                return response
+        request.response_cache_key = key
+        return super().list(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(request, 'response_cache_key', None)
+        if key is not None and response.status_code == 200:
+            response.render()
+            cache.set(key, (response['Content-Type'], response.content), RESPONSE_CACHE_TIMEOUT)
+            response['X-Response-Cache'] = 'miss'
+        return response
+
+
+@receiver(post_save, sender=ChatMessage)
+@receiver(post_save, sender=Conversation)
+@receiver(post_delete, sender=Conversation)
+@receiver(post_save, sender=UserSummary)
+@receiver(post_delete, sender=UserSummary)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_user_responses(sender, instance, **kwargs):
+    bump_version(instance.user_id)
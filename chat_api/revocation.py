@@ -0,0 +1,202 @@
+"""
+Revocation of JWTs by their jti claim.
+
+simplejwt's token_blacklist app keeps a database row for every token ever
+issued and never shrinks. Here only revoked tokens are stored, as
+'revoked_jti_<jti>' entries in the shared cache that expire together with
+the token, so the store holds at most the tokens revoked within one token
+lifetime.
+
+Most tokens checked are not revoked, and answering that must not cost a
+cache round trip on every request. Each process keeps a Bloom filter of
+the revoked jtis: a miss proves the token is not revoked, and only a hit
+(a revoked token or a rare false positive) is confirmed in the cache.
+Revocations are also appended to a log in the cache ('revoked_jti_log_<n>',
+numbered by the 'revoked_jti_seq' counter), which every process replays
+into its filter at most once per JWT_REVOCATION_SYNC_INTERVAL seconds.
+A token revoked in another worker is therefore refused there within that
+interval; in the revoking worker, at once.
+
+Log entries expire with their tokens, so only those written within the
+last token lifetime can still be live. The first revocation in each
+1/MARK_BUCKETS of a lifetime records its log number under
+'revoked_jti_mark_<bucket>'. A process that starts, or falls behind by
+more than a few entries, reads those marks to find the oldest number that
+may still be live and replays the log from there, rather than from the
+first revocation ever logged.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.settings import api_settings
+
+BLOOM_CAPACITY = getattr(settings, 'JWT_REVOCATION_BLOOM_CAPACITY', 100000)
+BLOOM_ERROR_RATE = getattr(settings, 'JWT_REVOCATION_BLOOM_ERROR_RATE', 0.001)
+SYNC_INTERVAL = getattr(settings, 'JWT_REVOCATION_SYNC_INTERVAL', 1.0)
+
+SEQUENCE_KEY = 'revoked_jti_seq'
+
+# A log entry is written just after its number is taken, so the newest
+# missing entries of a sync may still be on their way; older ones expired
+IN_FLIGHT_WINDOW = 64
+
+# Log numbers are marked this many times per token lifetime
+MARK_BUCKETS = 64
+
+
+def _revoked_key(jti):
+    return f'revoked_jti_{jti}'
+
+
+def _log_key(number):
+    return f'revoked_jti_log_{number}'
+
+
+def _mark_key(bucket):
+    return f'revoked_jti_mark_{bucket}'
+
+
+def _read_log(numbers, chunk_size=1000):
+    """{number: (jti, exp)} for the log entries in `numbers` that still exist"""
+    entries = {}
+    for start in range(0, len(numbers), chunk_size):
+        chunk = numbers[start:start + chunk_size]
+        found = cache.get_many([_log_key(number) for number in chunk])
+        entries.update((number, found[_log_key(number)]) for number in chunk if _log_key(number) in found)
+    return entries
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter of strings"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing: the k positions are h1 + i * h2
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class RevocationStore:
+    """Revoked jtis in the shared cache, fronted by a per-process Bloom filter"""
+
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE, sync_interval=SYNC_INTERVAL,
+                 lifetime=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        # The longest a revoked token, and so its log entry, can live
+        if lifetime is None:
+            lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME).total_seconds()
+        self.lifetime = lifetime
+        self.bucket_seconds = max(lifetime / MARK_BUCKETS, 1.0)
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(capacity, error_rate)
+        # Log entries up to `_seen` are in the filter; entries below `_floor`
+        # have expired
+        self._floor = 1
+        self._seen = 0
+        self._retry = ()
+        self._synced_at = 0.0
+
+    def revoke(self, jti, exp):
+        """Revoke the token with this jti until its expiry time `exp` (epoch seconds)"""
+        timeout = exp - time.time()
+        if timeout <= 0:
+            return
+        cache.set(_revoked_key(jti), True, timeout)
+        cache.add(SEQUENCE_KEY, 0, None)
+        number = cache.incr(SEQUENCE_KEY)
+        cache.set(_log_key(number), (jti, exp), timeout)
+        # Kept until every entry logged before this bucket has expired
+        cache.add(_mark_key(int(time.time() // self.bucket_seconds)), number, self.lifetime + self.bucket_seconds)
+        self._bloom.add(jti)
+
+    def is_revoked(self, jti):
+        if time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+        if jti not in self._bloom:
+            return False
+        return cache.get(_revoked_key(jti)) is not None
+
+    def sync(self):
+        """Add revocations logged by other processes since the last sync"""
+        if not self._lock.acquire(blocking=False):
+            # Another thread is syncing; the filter is at most one interval old
+            return
+        try:
+            self._synced_at = time.monotonic()
+            latest = cache.get(SEQUENCE_KEY, 0)
+            if latest <= self._seen and not self._retry:
+                return
+            if latest - self._seen > IN_FLIGHT_WINDOW:
+                # Cold or long idle: skip the entries that have expired
+                self._floor = max(self._floor, self._live_floor(latest))
+                self._seen = max(self._seen, self._floor - 1)
+            numbers = [*self._retry, *range(self._seen + 1, latest + 1)]
+            entries = _read_log(numbers)
+            for jti, exp in entries.values():
+                self._bloom.add(jti)
+            # Missing entries are looked up once more on the next sync
+            self._retry = [
+                number for number in range(max(self._seen + 1, latest - IN_FLIGHT_WINDOW + 1), latest + 1)
+                if number not in entries
+            ]
+            self._seen = max(self._seen, latest)
+            if self._bloom.count > self.capacity:
+                self._rebuild()
+        finally:
+            self._lock.release()
+
+    def _rebuild(self):
+        # A Bloom filter cannot forget, so once it is over capacity it is
+        # rebuilt from the log entries that have not expired yet
+        self._floor = max(self._floor, self._live_floor(self._seen))
+        live = _read_log(range(self._floor, self._seen + 1))
+        capacity = self.capacity
+        while len(live) > capacity // 2:
+            capacity *= 2
+        bloom = BloomFilter(capacity, self.error_rate)
+        for jti, exp in live.values():
+            bloom.add(jti)
+        self.capacity = capacity
+        self._floor = min(live, default=self._seen + 1)
+        self._bloom = bloom
+
+    def _live_floor(self, latest):
+        """The lowest log number that may not have expired yet"""
+        # Entries logged before the bucket holding now - lifetime began
+        # have expired. The first mark found from there is the lowest
+        # number logged since, less the numbers that may have been taken
+        # but not yet marked when it was set.
+        now = time.time()
+        buckets = range(int((now - self.lifetime) // self.bucket_seconds), int(now // self.bucket_seconds) + 1)
+        marks = cache.get_many([_mark_key(bucket) for bucket in buckets])
+        for bucket in buckets:
+            if _mark_key(bucket) in marks:
+                return max(marks[_mark_key(bucket)] - IN_FLIGHT_WINDOW, 1)
+        # Nothing was revoked within a token lifetime
+        return max(latest - IN_FLIGHT_WINDOW + 1, 1)
+
+
+revocations = RevocationStore()
@@ -0,0 +1,163 @@
+"""
+Full-text search over chat history, backed by an SQLite FTS5 index.
+
+The chat_api_search table holds one row per message (rowid = message id)
+with three columns: an owner token ("u<user_id>") so a user's matches are
+found through the index, the normalized message content, and the
+normalized title of the message's conversation. Triggers keep it in sync
+with chat_api_chatmessage and chat_api_conversation, reading the
+normalized rows from the chat_api_search_source view. Since migration 0009
+the view normalizes in plain SQL, so any SQLite client can write to those
+tables; its replacements must match normalize_search_text(), which
+normalizes queries.
+
+The index holds normalized text, so result highlights are built in Python
+from the message as written (see highlight()).
+
+A migration that makes Django rebuild either table on SQLite (for example
+adding a NOT NULL column) drops these triggers and must recreate them as
+0009 does.
+"""
+import re
+import unicodedata
+from html import escape
+
+from django.db import connection
+
+SEARCH_TABLE = 'chat_api_search'
+
+# Harakat, superscript alef and Quranic annotation marks
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]')
+TATWEEL = '\u0640'
+ARABIC_LETTER_FORMS = str.maketrans({
+    'آ': 'ا',  # alef with madda -> alef
+    'أ': 'ا',  # alef with hamza above -> alef
+    'إ': 'ا',  # alef with hamza below -> alef
+    'ٱ': 'ا',  # alef wasla -> alef
+    'ى': 'ي',  # alef maksura -> yaa
+    'ة': 'ه',  # taa marbuta -> haa
+})
+WORD = re.compile(r'\w+')
+# A word as written: diacritics and tatweel do not split it
+WRITTEN_WORD = re.compile(r'(?:\w|[\u0300-\u036f\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640])+')
+
+# Words in a result highlight, and how many of them come before the first match
+HIGHLIGHT_WORDS = 16
+HIGHLIGHT_LEAD = 3
+
+# bm25 weights for the (owner, body, title) columns
+RANK_WEIGHTS = (0.0, 1.0, 0.5)
+
+
+def normalize_search_text(text):
+    """
+    Normalize text for indexing and querying. Arabic diacritics and tatweel
+    are stripped and alef, yaa and taa marbuta variants are unified, so
+    spelling variations of the same word match each other. Case folding
+    and Latin accents are left to the unicode61 tokenizer.
+    """
+    if not text:
+        return ''
+    text = ARABIC_DIACRITICS.sub('', text).replace(TATWEEL, '')
+    return text.translate(ARABIC_LETTER_FORMS)
+
+
+def _fold(word):
+    # What the index compares: normalized, without diacritics, case-folded
+    word = unicodedata.normalize('NFKD', normalize_search_text(word))
+    return ''.join(char for char in word if not unicodedata.combining(char)).casefold()
+
+
+def highlight(content, query):
+    """
+    An HTML-safe excerpt of `content` as the user wrote it, with the words
+    matching `query` wrapped in <mark>. Words match as they do in the
+    index, the last query word as a prefix. The excerpt is HIGHLIGHT_WORDS
+    words starting just before the first match; '…' marks cut text.
+    """
+    terms = [_fold(word) for word in WORD.findall(normalize_search_text(query))]
+    words = list(WRITTEN_WORD.finditer(content or ''))
+    if not terms or not words:
+        return escape(content or '')
+    whole, prefix = set(terms[:-1]), terms[-1]
+    matched = [_fold(word.group()) in whole or _fold(word.group()).startswith(prefix) for word in words]
+
+    first = matched.index(True) if True in matched else 0
+    start = max(0, min(first - HIGHLIGHT_LEAD, len(words) - HIGHLIGHT_WORDS))
+    end = min(start + HIGHLIGHT_WORDS, len(words))
+    parts = ['…'] if start > 0 else [escape(content[:words[0].start()])]
+    for index in range(start, end):
+        word = words[index]
+        if index > start:
+            parts.append(escape(content[words[index - 1].end():word.start()]))
+        parts.append(f'<mark>{escape(word.group())}</mark>' if matched[index] else escape(word.group()))
+    parts.append('…' if end < len(words) else escape(content[words[-1].end():]))
+    return ''.join(parts)
+
+
+def build_match_query(user_id, query):
+    """
+    Turn free text into an FTS5 MATCH expression restricted to one user.
+    Every word must appear in the content or the conversation title; the
+    last word is matched as a prefix so results show up while typing.
+    Returns None when the query has no searchable words.
+    """
+    words = WORD.findall(normalize_search_text(query))
+    if not words:
+        return None
+    phrases = [f'"{word}"' for word in words]
+    phrases[-1] += '*'
+    return f'owner : "u{int(user_id)}" AND {{body title}} : ({" ".join(phrases)})'
+
+
+def is_available():
+    """FTS search needs SQLite and the index created by migration 0007"""
+    if connection.vendor != 'sqlite':
+        return False
+    return SEARCH_TABLE in connection.introspection.table_names()
+
+
+def search_messages(user_id, query, limit, after=None, language=None):
+    """
+    Return up to `limit` (message_id, score) tuples for the
+    user's messages matching `query`, best match first. `after` is the
+    (score, message_id) of the last row of the previous page.
+    """
+    match = build_match_query(user_id, query)
+    if match is None:
+        return []
+
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    score = f'bm25({SEARCH_TABLE}, {weights})'
+    sql = [
+        f"SELECT m.id, {score} AS score "
+        # CROSS JOIN keeps the FTS index as the outer loop: the owner token
+        # already narrows it to this user's matches
+        f"FROM {SEARCH_TABLE} CROSS JOIN chat_api_chatmessage m ON m.id = {SEARCH_TABLE}.rowid "
+        f"WHERE {SEARCH_TABLE} MATCH %s AND m.user_id = %s"
+    ]
+    params = [match, user_id]
+    if language:
+        sql.append('AND m.language = %s')
+        params.append(language)
+    if after is not None:
+        sql.append(f'AND ({score}, m.id) > (%s, %s)')
+        params.extend(after)
+    sql.append('ORDER BY score, m.id LIMIT %s')
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(' '.join(sql), params)
+        return cursor.fetchall()
+
+
+def matching_message_ids_sql(query):
+    """
+    SQL and params selecting the ids of all messages (any user) whose
+    content or conversation title match, for use in a pk__in subquery.
+    """
+    words = WORD.findall(normalize_search_text(query))
+    if not words:
+        return None
+    phrases = ' '.join(f'"{word}"' for word in words)
+    return f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [f'{{body title}} : ({phrases})']
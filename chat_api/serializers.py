@@ -1,7 +1,10 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
-from .models import UserProfile, ChatMessage, Conversation, UserSummary
+from django.utils.translation import gettext_lazy as _
+from .models import LANGUAGE_CHOICES, UserProfile, ChatMessage, Conversation, UserSummary
+from .accounts import create_user
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -42,43 +45,12 @@ class RegisterSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        fullname = validated_data.pop('fullname')
-        language_preference = validated_data.pop('language_preference')
-        validated_data.pop('password2')
-        
-        # Split fullname into first_name and last_name
-        name_parts = fullname.split(' ', 1)
-        first_name = name_parts[0]
-        last_name = name_parts[1] if len(name_parts) > 1 else ''
-        
-        # Create username from email (Django User model requires username)
-        username = validated_data['email'].split('@')[0]
-        base_username = username
-        counter = 1
-        
-        # Ensure username is unique
-        while User.objects.filter(username=username).exists():
-            username = f"{base_username}{counter}"
-            counter += 1
-        
-        # Create user
-        user = User.objects.create(
-            username=username,
+        return create_user(
             email=validated_data['email'],
-            first_name=first_name,
-            last_name=last_name
-        )
-        user.set_password(validated_data['password'])
-        user.save()
-
-        # Create user profile with fullname and language preference
-        UserProfile.objects.create(
-            user=user,
-            fullname=fullname,
-            language_preference=language_preference
+            password=validated_data['password'],
+            fullname=validated_data['fullname'],
+            language_preference=validated_data['language_preference'],
         )
-        
-        return user
 
 
 class ChatMessageSerializer(serializers.ModelSerializer):
@@ -93,6 +65,27 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         return obj.user.username
 
 
+def conversation_messages_queryset():
+    """Messages of a conversation in display order, with their user joined in"""
+    return ChatMessage.objects.select_related('user').order_by('created_at', 'id')
+
+
+class ConversationListSerializer(serializers.ModelSerializer):
+    """
+    Lightweight conversation representation for the inbox list.
+    The message statistics are denormalized onto the conversation row,
+    so no message queries are run here.
+    """
+    class Meta:
+        model = Conversation
+        fields = ('id', 'user', 'title', 'language', 'created_at', 'updated_at',
+                  'message_count', 'last_message_at', 'last_message_preview',
+                  'last_message_is_user')
+        read_only_fields = ('id', 'user', 'created_at', 'updated_at',
+                            'message_count', 'last_message_at', 'last_message_preview',
+                            'last_message_is_user')
+
+
 class ConversationSerializer(serializers.ModelSerializer):
     messages = serializers.SerializerMethodField()
     
@@ -102,10 +95,22 @@ class ConversationSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at', 'updated_at')
     
     def get_messages(self, obj):
-        # Get messages related to this conversation
-        messages = ChatMessage.objects.filter(conversation=obj).order_by('created_at')
+        # Use the messages prefetched by the view when they are available
+        prefetched = getattr(obj, '_prefetched_objects_cache', {})
+        if 'messages' in prefetched:
+            messages = prefetched['messages']
+        else:
+            messages = conversation_messages_queryset().filter(conversation=obj)
         return ChatMessageSerializer(messages, many=True).data
 
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Only write the edited columns so a concurrent message write's
+        # counter update is not overwritten with stale values
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
+
 
 class UserSummarySerializer(serializers.ModelSerializer):
     username = serializers.SerializerMethodField()
@@ -117,3 +122,23 @@ class UserSummarySerializer(serializers.ModelSerializer):
     
     def get_username(self, obj):
         return obj.user.username
+
+
+class MessageImportSerializer(serializers.Serializer):
+    """
+    Envelope of a bulk import: the target conversation, either an existing
+    one or a new one to create, and the raw messages. The messages are
+    validated in bulk by chat_api.importer rather than item by item here.
+    """
+    conversation_id = serializers.IntegerField(required=False)
+    title = serializers.CharField(max_length=255, required=False)
+    language = serializers.ChoiceField(choices=LANGUAGE_CHOICES, required=False)
+    messages = serializers.ListField(
+        allow_empty=False,
+        max_length=getattr(settings, 'CHAT_IMPORT_MAX_MESSAGES', 10000)
+    )
+    
+    def validate(self, attrs):
+        if 'conversation_id' not in attrs and not attrs.get('title'):
+            raise serializers.ValidationError(_('Either conversation_id or title is required.'))
+        return attrs
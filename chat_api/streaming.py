@@ -0,0 +1,88 @@
+"""
+Server-sent events for the AI chat (/api/chat/ai/?stream=1, or with
+Accept: text/event-stream).
+
+The response starts as soon as the user's message is saved and carries
+three kinds of event:
+
+- start: the conversation and the saved user message;
+- token: {"text": ...} for each piece of the answer, as the model
+  produces it;
+- done: the same data as a non-streamed response, including the saved
+  reply.
+
+The reply is saved once, when the model has finished. If the model fails
+part way, done carries a simulated reply, as the non-streamed view would
+return, and clients should show that instead of the tokens so far.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+STREAM_VALUES = ('1', 'true')
+
+
+def sse(event, data):
+    """One server-sent event, with the data encoded as the API encodes JSON"""
+    payload = json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+    return f'event: {event}\ndata: {payload}\n\n'.encode('utf-8')
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients ask for text/event-stream; error responses become an error event"""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse('error', data)
+
+
+def wants_stream(request):
+    return (
+        request.query_params.get('stream', '').lower() in STREAM_VALUES
+        or request.accepted_renderer.format == EventStreamRenderer.format
+    )
+
+
+def chat_events(turn, events):
+    """The events of a chat turn, for the model's streamed answer `events`"""
+    yield sse('start', turn.started())
+    try:
+        turn.admit()
+        for event in events:
+            text = turn.read_event(event)
+            if text:
+                yield sse('token', {'text': text})
+        data = turn.finish_stream()
+    except Exception as e:
+        # A simulated reply, as the non-streamed view falls back to,
+        # also when the model's circuit breaker is open
+        data = turn.fail(e)
+    yield sse('done', data)
+
+
+async def achat_events(turn, events):
+    """chat_events() for async views, with the model's answer as an async iterator"""
+    yield sse('start', turn.started())
+    try:
+        await sync_to_async(turn.admit)()
+        async for event in events:
+            text = turn.read_event(event)
+            if text:
+                yield sse('token', {'text': text})
+        data = await sync_to_async(turn.finish_stream)()
+    except Exception as e:
+        data = await sync_to_async(turn.fail)(e)
+    yield sse('done', data)
+
+
+def event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the events
+    response['X-Accel-Buffering'] = 'no'
+    return response
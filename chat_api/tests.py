@@ -1,3 +1,96 @@
-from django.test import TestCase
+import multiprocessing
+import os
+import tempfile
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from rest_framework.exceptions import Throttled
+
+from .cache import SQLiteCache
+from .throttling import CompositeRateThrottle, SharedUserRateThrottle
+
+WORKERS = 4
+
+
+def _request(user_id=1):
+    return SimpleNamespace(user=SimpleNamespace(is_authenticated=True, pk=user_id))
+
+
+def _allowed(throttle_class, attempts):
+    """How many of `attempts` checks the throttle lets through"""
+    allowed = 0
+    for _ in range(attempts):
+        try:
+            if throttle_class().allow_request(_request(), None):
+                allowed += 1
+        except Throttled:
+            pass
+    return allowed
+
+
+def _worker(throttle_class, attempts, start, results):
+    start.wait()
+    results.put(_allowed(throttle_class, attempts))
+
+
+class SharedThrottleTests(SimpleTestCase):
+    """Throttle quotas hold across worker processes sharing one SQLite cache file"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+
+    def cache(self):
+        # A separate client, with its own connection, for each caller
+        return SQLiteCache(self.path, {})
+
+    def throttle(self, scope, rate, cache):
+        return type('TestThrottle', (SharedUserRateThrottle,), {'scope': scope, 'rate': rate, 'cache': cache})
+
+    def composite(self, cache):
+        return type('TestCompositeThrottle', (CompositeRateThrottle,), {
+            'cache': cache,
+            'throttle_classes': (
+                self.throttle('test_burst', '20/hour', cache), self.throttle('test_sustained', '30/hour', cache)
+            ),
+        })
+
+    def run_workers(self, throttle_class, attempts):
+        """Allowed counts of WORKERS forked processes checking the throttle at once"""
+        context = multiprocessing.get_context('fork')
+        start, results = context.Event(), context.Queue()
+        processes = [
+            context.Process(target=_worker, args=(throttle_class, attempts, start, results)) for _ in range(WORKERS)
+        ]
+        for process in processes:
+            process.start()
+        start.set()
+        allowed = [results.get(timeout=60) for _ in processes]
+        for process in processes:
+            process.join()
+        return allowed
+
+    def test_sliding_window_shared_between_cache_clients(self):
+        first = self.throttle('test_user', '10/hour', self.cache())
+        second = self.throttle('test_user', '10/hour', self.cache())
+        self.assertEqual(_allowed(first, 6), 6)
+        self.assertEqual(_allowed(second, 10), 4)
+        self.assertEqual(_allowed(first, 1), 0)
+
+    def test_sliding_window_shared_between_processes(self):
+        allowed = self.run_workers(self.throttle('test_user', '25/hour', self.cache()), 25)
+        self.assertEqual(sum(allowed), 25)
+
+    def test_composite_shared_between_cache_clients(self):
+        first, second = self.composite(self.cache()), self.composite(self.cache())
+        self.assertEqual(_allowed(first, 15), 15)
+        self.assertEqual(_allowed(second, 15), 5)
+
+    def test_composite_shared_between_processes(self):
+        cache = self.cache()
+        allowed = self.run_workers(self.composite(cache), 20)
+        self.assertEqual(sum(allowed), 20)
+        # Both scopes counted every allowed request, and only those
+        self.assertEqual(cache.get('throttle_window_test_burst_1')[1], 20)
+        self.assertEqual(cache.get('throttle_window_test_sustained_1')[1], 20)
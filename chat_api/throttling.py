@@ -1,46 +1,332 @@
 """
 Custom throttling classes for rate limiting API endpoints.
+
+Throttle state lives in the default cache, which settings.CACHES points at
+Redis or at a SQLite file shared by all worker processes, so quotas hold
+across workers and restarts. Each (scope, user) keeps a fixed-size state
+of two counters instead of DRF's list of request timestamps. Views that
+apply several scopes use a CompositeRateThrottle, which checks them all
+with one cache read and one write.
+
+Every check leaves the state of the scope with the least quota left on the
+request (see note_rate_limit), from which RateLimitMiddleware sets the
+RateLimit-* and Retry-After response headers.
 """
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+import math
+import random
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache as default_cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle, UserRateThrottle, AnonRateThrottle
+
+
+@contextmanager
+def cache_lock(cache, key, timeout=2, poll=0.0002, max_poll=0.004):
+    """
+    Hold a short lock on `key` in a shared cache. Relies only on the
+    atomicity of cache.add(); a lock left behind by a crashed worker
+    expires after `timeout` seconds.
+
+    Each attempt is a write (on the SQLite cache, a BEGIN IMMEDIATE
+    transaction), so waiters back off exponentially from `poll` to
+    `max_poll` seconds, with jitter, rather than adding write load to the
+    database the lock serializes. A waiter that is still shut out after
+    `timeout` seconds takes the lock over, since the lock it first found
+    has expired by then.
+    """
+    lock_key = f'{key}:lock'
+    give_up_at = time.monotonic() + timeout
+    while not cache.add(lock_key, 1, timeout):
+        left = give_up_at - time.monotonic()
+        if left <= 0:
+            cache.set(lock_key, 1, timeout)
+            break
+        time.sleep(min(random.uniform(poll / 2, poll), left))
+        poll = min(poll * 2, max_poll)
+    try:
+        yield
+    finally:
+        cache.delete(lock_key)
+
+
+def client_lock_key(throttle, request):
+    """
+    The lock guarding all of a client's throttle state. Locking per client
+    rather than per scope keeps single and composite throttles that share a
+    scope from updating it at the same time.
+    """
+    if request.user and request.user.is_authenticated:
+        return f'throttle_lock_user_{request.user.pk}'
+    return f'throttle_lock_anon_{throttle.get_ident(request)}'
+
+
+def _tightness(throttle):
+    # Least quota left first; among exhausted scopes, the longest wait
+    reset = throttle.reset()
+    return throttle.remaining(), -(math.inf if reset is None else reset)
+
+
+def note_rate_limit(request, throttle):
+    """
+    Keep a checked scope on the underlying HttpRequest as `rate_limit`,
+    unless a scope already kept for this request has less quota left. Its
+    num_requests, remaining() and reset() describe the state as of the check.
+    """
+    http_request = getattr(request, '_request', request)
+    noted = getattr(http_request, 'rate_limit', None)
+    if noted is None or _tightness(throttle) < _tightness(noted):
+        http_request.rate_limit = throttle
+
+
+class SharedRateThrottleMixin:
+    """
+    Make a throttle's check-and-record atomic across worker processes.
+    The state is read, updated and written back; two workers doing that at
+    once for the same user would lose one of the requests.
+    """
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        if self.get_cache_key(request, view) is None:
+            return True
+        with cache_lock(self.cache, client_lock_key(self, request)):
+            return super().allow_request(request, view)
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """
+    Drop-in replacement for SimpleRateThrottle with constant-size state.
 
-class AIChatRateThrottle(UserRateThrottle):
+    SimpleRateThrottle caches a list of every request timestamp in the
+    window and unpickles, trims and re-pickles it on each request, so a
+    1000/day rate churns up to 1000 floats per request. This keeps only the
+    request counts of the current and the previous fixed window, and
+    estimates the rolling count by weighting the previous window by how
+    much of it still overlaps the rolling one:
+
+        estimate = previous * (1 - elapsed / duration) + current
+
+    A request is allowed while the estimate is below the rate, so a steady
+    client gets exactly the configured rate and no fixed window ever holds
+    more than `num_requests` requests.
+    """
+    # Distinct from SimpleRateThrottle's keys, so timestamp lists cached
+    # before an upgrade are never read as counters
+    cache_format = 'throttle_window_%(scope)s_%(ident)s'
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        if self.evaluate(self.cache.get(self.key)):
+            allowed = self.throttle_success()
+        else:
+            allowed = self.throttle_failure()
+        note_rate_limit(request, self)
+        return allowed
+
+    def throttle_success(self):
+        self.cache.set(self.key, self.record(), self.state_timeout())
+        return True
+
+    def evaluate(self, state):
+        """Load the cached state (or None) and tell whether one more request fits"""
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        start, current, previous = state or (window, 0, 0)
+        if start != window:
+            # Roll over; a window older than the previous one no longer counts
+            previous = current if start == window - 1 else 0
+            current = 0
+        self.window, self.current, self.previous = window, current, previous
+        self.elapsed = self.now - window * self.duration
+        return self.estimate() < self.num_requests
+
+    def estimate(self):
+        return self.previous * (1 - self.elapsed / self.duration) + self.current
+
+    def record(self):
+        """Count the request and return the state to cache"""
+        self.current += 1
+        return (self.window, self.current, self.previous)
+
+    def state_timeout(self):
+        # Kept until the end of the next window, where it is still "previous"
+        return (self.window + 2) * self.duration - self.now
+
+    def remaining(self):
+        """Requests still allowed right now"""
+        return max(math.ceil(self.num_requests - self.estimate()), 0)
+
+    def reset(self):
+        """
+        Seconds until more quota frees up: the next accepted request when
+        none is left, otherwise the end of the current window.
+        """
+        if self.remaining() == 0:
+            return self.wait()
+        return self.duration - self.elapsed
+
+    def wait(self):
+        """
+        Seconds until the estimate drops below the rate again, assuming no
+        further requests are allowed meanwhile.
+        """
+        window_left = self.duration - self.elapsed
+        if self.num_requests == 0:
+            return None
+        if self.current >= self.num_requests:
+            # The current window alone is full: wait for it to end and for
+            # enough of it to slide out of the rolling window
+            return window_left + self.duration * (1 - self.num_requests / self.current)
+        # Only the fading previous window keeps the estimate up
+        needed = self.duration * (1 - (self.num_requests - self.current) / self.previous) - self.elapsed
+        return max(min(needed, window_left), 0)
+
+class CompositeRateThrottle(BaseThrottle):
+    """
+    Checks several throttle scopes for a request at once.
+
+    Stacked DRF throttles each read and write their own cache entry, and
+    with the shared lock that is four cache round trips per scope. This
+    takes the client's lock once, loads every applicable scope's state with
+    a single get_many() and stores them with a single set_many(). A request
+    is only counted when every scope allows it.
+
+    When a scope is exceeded, Throttled is raised with the message of the
+    scope that will stay closed longest and a 'throttled_<scope>' code.
+    After a check, `limit`, `remaining` and `reset` describe the scope with
+    the least quota left.
+    """
+    throttle_classes = ()
+    cache = default_cache
+
+    def __init__(self):
+        self.throttles = [throttle_class() for throttle_class in self.throttle_classes]
+        self.tightest = None
+
+    def allow_request(self, request, view):
+        active = []
+        for throttle in self.throttles:
+            if throttle.rate is None:
+                continue
+            throttle.key = throttle.get_cache_key(request, view)
+            if throttle.key is not None:
+                active.append(throttle)
+        if not active:
+            return True
+
+        with cache_lock(self.cache, client_lock_key(active[0], request)):
+            states = self.cache.get_many([throttle.key for throttle in active])
+            failed = [throttle for throttle in active if not throttle.evaluate(states.get(throttle.key))]
+            if not failed:
+                self.cache.set_many(
+                    {throttle.key: throttle.record() for throttle in active},
+                    max(throttle.state_timeout() for throttle in active)
+                )
+
+        # After a rejection every failed scope has no quota left and the
+        # tightest is the one with the longest wait
+        self.tightest = throttle = min(active, key=_tightness)
+        note_rate_limit(request, throttle)
+        if failed:
+            raise Throttled(wait=throttle.wait(), detail=str(throttle.message), code=f'throttled_{throttle.scope}')
+        return True
+
+    @property
+    def limit(self):
+        return self.tightest.num_requests if self.tightest else None
+
+    @property
+    def remaining(self):
+        return self.tightest.remaining() if self.tightest else None
+
+    @property
+    def reset(self):
+        return self.tightest.reset() if self.tightest else None
+
+class SharedAnonRateThrottle(SharedRateThrottleMixin, SlidingWindowRateThrottle, AnonRateThrottle):
+    """
+    Default throttle for anonymous requests (the 'anon' rate), and the base
+    class of the other anonymous throttles.
+    """
+    message = _("Too many requests. Please try again later.")
+
+class SharedUserRateThrottle(SharedRateThrottleMixin, SlidingWindowRateThrottle, UserRateThrottle):
+    """
+    Default throttle for authenticated requests (the 'user' rate), and the
+    base class of the other per-user throttles.
+    """
+    message = _("Too many requests. Please try again later.")
+
+class AIChatRateThrottle(SharedUserRateThrottle):
     """
     Throttle class for AI chat endpoints.
     Limits the number of requests a user can make to AI-powered endpoints.
     """
     scope = 'ai_chat'
+    message = _("You've reached your AI chat limit. Please try again later.")
 
-class AuthRateThrottle(AnonRateThrottle):
+class AuthRateThrottle(SharedAnonRateThrottle):
     """
     Throttle class for authentication endpoints.
     Helps prevent brute force attacks on login/register endpoints.
     """
     scope = 'auth'
+    message = _("Too many authentication attempts. Please try again later.")
 
-class ProfileUpdateRateThrottle(UserRateThrottle):
+class ProfileUpdateRateThrottle(SharedUserRateThrottle):
     """
     Throttle class for profile update endpoints.
     Limits how frequently users can update their profile information.
     """
     scope = 'profile_update'
+    message = _("You've reached your profile update limit. Please try again later.")
 
-class ChatSummaryRateThrottle(UserRateThrottle):
+class ChatSummaryRateThrottle(SharedUserRateThrottle):
     """
     Throttle class for chat summary generation.
     Limits resource-intensive operations like generating summaries.
     """
     scope = 'chat_summary'
+    message = _("You've reached your summary generation limit. Please try again later.")
 
-class BurstRateThrottle(UserRateThrottle):
+class BurstRateThrottle(SharedUserRateThrottle):
     """
     Throttle class for short-term burst protection.
     Prevents rapid-fire requests in a short time window.
     """
     scope = 'burst'
+    message = _("Too many requests in a short time. Please slow down.")
 
-class SustainedRateThrottle(UserRateThrottle):
+class SustainedRateThrottle(SharedUserRateThrottle):
     """
     Throttle class for long-term sustained usage.
     Ensures users don't exceed daily quotas.
     """
     scope = 'sustained'
+    message = _("You've reached your daily request limit. Please try again later.")
+
+class ExportRateThrottle(SharedUserRateThrottle):
+    """
+    Throttle class for chat history exports.
+    Full exports read a user's entire history, so they are limited separately.
+    """
+    scope = 'export'
+    message = _("You've reached your export limit. Please try again later.")
+
+class BurstSustainedRateThrottle(CompositeRateThrottle):
+    """
+    Burst and sustained limits checked together, for the list and create
+    endpoints.
+    """
+    throttle_classes = (BurstRateThrottle, SustainedRateThrottle)
+
+class DefaultRateThrottle(CompositeRateThrottle):
+    """
+    The 'anon' and 'user' limits, for views without their own throttles.
+    """
+    throttle_classes = (SharedAnonRateThrottle, SharedUserRateThrottle)
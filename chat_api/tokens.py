@@ -0,0 +1,41 @@
+"""
+JWT classes that can be revoked by jti (see chat_api.revocation).
+
+They keep simplejwt's blacklist() method name, so LogoutView and the
+refresh token rotation in TokenRefreshSerializer (BLACKLIST_AFTER_ROTATION)
+revoke through them without the token_blacklist app.
+"""
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .revocation import revocations
+
+
+class RevocableTokenMixin:
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        self.check_blacklist()
+
+    def check_blacklist(self):
+        """Raise TokenError if this token has been revoked"""
+        if revocations.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        """Revoke this token until it expires"""
+        revocations.revoke(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+
+
+class AccessToken(RevocableTokenMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(RevocableTokenMixin, tokens.RefreshToken):
+    access_token_class = AccessToken
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RefreshToken
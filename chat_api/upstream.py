@@ -0,0 +1,268 @@
+"""
+Shared HTTP client for the inference providers (Hugging Face and DeepSeek).
+
+The chat and summary views used to call requests.post() directly, so every
+call opened a new TCP and TLS connection. With no timeout set, a hung
+provider held the worker until gunicorn killed it. Calls now go through
+one requests.Session per provider and process, which keeps up to
+UPSTREAM_POOL_SIZE connections alive for reuse, and every call is bounded:
+
+- connecting may take UPSTREAM_CONNECT_TIMEOUT seconds, and waiting for
+  the response UPSTREAM_READ_TIMEOUT;
+- failed connections, timeouts and 429/5xx responses are retried up to
+  UPSTREAM_RETRIES times, after a jittered exponential backoff that
+  honours Retry-After;
+- attempts and backoffs together end after UPSTREAM_DEADLINE seconds. A
+  backoff that would run past the deadline is not started, and each
+  attempt's timeouts are cut to the time left.
+
+When the retries run out, the last response is returned, or the last
+error is raised if there was no response.
+
+stream() yields the server-sent events of a streamed response as they
+arrive. Async views use apost() and astream(), which apply the same
+limits through an aiohttp session per event loop. There the deadline
+also bounds a response that arrives slowly, not just each wait for data.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+import aiohttp
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = getattr(settings, 'UPSTREAM_CONNECT_TIMEOUT', 3.05)
+READ_TIMEOUT = getattr(settings, 'UPSTREAM_READ_TIMEOUT', 20.0)
+DEADLINE = getattr(settings, 'UPSTREAM_DEADLINE', 25.0)
+RETRIES = getattr(settings, 'UPSTREAM_RETRIES', 2)
+BACKOFF = getattr(settings, 'UPSTREAM_BACKOFF', 0.5)
+BACKOFF_MAX = getattr(settings, 'UPSTREAM_BACKOFF_MAX', 4.0)
+POOL_SIZE = getattr(settings, 'UPSTREAM_POOL_SIZE', 10)
+# Connections per event loop for async views, which hold many calls at once
+ASYNC_POOL_SIZE = getattr(settings, 'UPSTREAM_ASYNC_POOL_SIZE', 500)
+
+# Hugging Face answers 503 while a model is loading
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def _retry_after(headers):
+    try:
+        return float(headers.get('Retry-After', ''))
+    except ValueError:
+        return 0.0
+
+
+def _event_data(line):
+    """The JSON payload of a server-sent event's data line, or None for other lines"""
+    if not line.startswith(b'data:'):
+        return None
+    payload = line[5:].strip()
+    if not payload or payload == b'[DONE]':
+        return None
+    return json.loads(payload)
+
+
+class UpstreamClient:
+    """Pooled, keep-alive POSTs to one provider, with timeouts and retries"""
+
+    def __init__(self, name, base_url):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._async_sessions = weakref.WeakKeyDictionary()
+
+    def session(self):
+        # Created lazily in each process; forked workers must not share
+        # the parent's sockets
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    session = requests.Session()
+                    # Retries are done here, within the deadline
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def _pause_before_retry(self, attempt, give_up_at, failure, retry_after=0.0):
+        """Seconds to wait before the next attempt, or None to stop"""
+        if attempt == RETRIES:
+            return None
+        pause = max(random.uniform(0, min(BACKOFF_MAX, BACKOFF * 2 ** attempt)), retry_after)
+        if time.monotonic() + pause >= give_up_at:
+            return None
+        logger.warning(
+            "%s upstream attempt %d failed (%s); retrying in %.2fs", self.name, attempt + 1, failure, pause
+        )
+        return pause
+
+    def post(self, path, *, json=None, headers=None, deadline=None, stream=False):
+        """
+        POST to `path` under the base URL and return the response. With
+        stream=True the body is left unread, as for requests.
+        """
+        url = f'{self.base_url}/{path.lstrip("/")}'
+        give_up_at = time.monotonic() + (DEADLINE if deadline is None else deadline)
+        response = error = None
+        for attempt in range(RETRIES + 1):
+            remaining = give_up_at - time.monotonic()
+            try:
+                response = self.session().post(
+                    url, json=json, headers=headers, stream=stream,
+                    timeout=(min(CONNECT_TIMEOUT, remaining), min(READ_TIMEOUT, remaining))
+                )
+            except requests.exceptions.SSLError:
+                # A certificate problem does not go away on retry
+                raise
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                response, error = None, exc
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+
+            if response is None:
+                pause = self._pause_before_retry(attempt, give_up_at, error)
+            else:
+                pause = self._pause_before_retry(
+                    attempt, give_up_at, f'HTTP {response.status_code}', _retry_after(response.headers)
+                )
+            if pause is None:
+                break
+            if response is not None:
+                # Read the body so the connection goes back to the pool
+                response.content
+            time.sleep(pause)
+
+        if response is not None:
+            return response
+        raise error
+
+    def stream(self, path, *, json=None, headers=None, deadline=None):
+        """
+        POST and yield the provider's server-sent events, each parsed from
+        JSON, as they arrive. Getting the response is retried as in post();
+        after that an error status, a broken connection or running past the
+        deadline is raised to the caller. A response that is not an event
+        stream is yielded whole, as one event.
+        """
+        give_up_at = time.monotonic() + (DEADLINE if deadline is None else deadline)
+        response = self.post(path, json=json, headers=headers, deadline=give_up_at - time.monotonic(), stream=True)
+        with response:
+            response.raise_for_status()
+            if not response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                yield response.json()
+                return
+            for line in response.iter_lines():
+                if time.monotonic() > give_up_at:
+                    raise requests.Timeout(f'{self.name} response ran past its deadline')
+                event = _event_data(line)
+                if event is not None:
+                    yield event
+
+    def async_session(self):
+        # aiohttp sessions belong to the event loop they were created on
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None:
+            session = self._async_sessions[loop] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=ASYNC_POOL_SIZE)
+            )
+        return session
+
+    async def aclose(self):
+        """Close the current event loop's session, e.g. before the loop ends"""
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    async def _aopen(self, path, json, headers, give_up_at):
+        # The response with its body unread, retried as in post()
+        url = f'{self.base_url}/{path.lstrip("/")}'
+        response = error = None
+        for attempt in range(RETRIES + 1):
+            remaining = give_up_at - time.monotonic()
+            timeout = aiohttp.ClientTimeout(
+                total=remaining, sock_connect=min(CONNECT_TIMEOUT, remaining), sock_read=min(READ_TIMEOUT, remaining)
+            )
+            try:
+                response = await self.async_session().post(url, json=json, headers=headers, timeout=timeout)
+            except aiohttp.ClientSSLError:
+                # A certificate problem does not go away on retry
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                response, error = None, exc
+            else:
+                if response.status not in RETRY_STATUSES:
+                    return response
+
+            if response is None:
+                pause = self._pause_before_retry(attempt, give_up_at, error)
+            else:
+                pause = self._pause_before_retry(
+                    attempt, give_up_at, f'HTTP {response.status}', _retry_after(response.headers)
+                )
+            if pause is None:
+                break
+            if response is not None:
+                response.release()
+            await asyncio.sleep(pause)
+
+        if response is not None:
+            return response
+        raise error
+
+    async def apost(self, path, *, json=None, headers=None, deadline=None):
+        """post() for async views: awaits the provider without holding a thread"""
+        give_up_at = time.monotonic() + (DEADLINE if deadline is None else deadline)
+        async with await self._aopen(path, json, headers, give_up_at) as response:
+            return AsyncResponse(response.status, response.headers, await response.read(), response.get_encoding())
+
+    async def astream(self, path, *, json=None, headers=None, deadline=None):
+        """stream() for async views"""
+        give_up_at = time.monotonic() + (DEADLINE if deadline is None else deadline)
+        # The session's timeout covers reading the body, up to the deadline
+        async with await self._aopen(path, json, headers, give_up_at) as response:
+            response.raise_for_status()
+            if response.content_type != 'text/event-stream':
+                yield await response.json(content_type=None)
+                return
+            async for line in response.content:
+                event = _event_data(line.rstrip(b'\r\n'))
+                if event is not None:
+                    yield event
+
+
+class AsyncResponse:
+    """What callers use of a requests.Response, for a response read by apost() or shared through the cache"""
+
+    def __init__(self, status_code, headers, content, encoding):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+huggingface = UpstreamClient(
+    'huggingface', getattr(settings, 'HUGGINGFACE_API_URL', 'https://api-inference.huggingface.co')
+)
+deepseek = UpstreamClient('deepseek', getattr(settings, 'DEEPSEEK_API_URL', 'https://api.deepseek.com'))
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
@@ -8,11 +9,15 @@ from .views import (
     UserProfileDetailView,
     ChangePasswordView,
     ChatMessageListCreateView,
+    ChatMessageSearchView,
+    ChatHistoryExportView,
+    ChatMessageImportView,
     ConversationListCreateView,
     ConversationDetailView,
     UserSummaryListCreateView,
     UserSummaryDetailView,
     AIChatView,
+    AsyncAIChatView,
     APIKeyTestView,
     ChatSummaryView
 )
@@ -31,11 +36,18 @@ urlpatterns = [
     
     # Chat endpoints
     path('messages/', ChatMessageListCreateView.as_view(), name='message-list-create'),
+    path('messages/search/', ChatMessageSearchView.as_view(), name='message-search'),
+    path('messages/export/', ChatHistoryExportView.as_view(), name='message-export'),
+    path('messages/import/', ChatMessageImportView.as_view(), name='message-import'),
     path('conversations/', ConversationListCreateView.as_view(), name='conversation-list-create'),
     path('conversations/<int:pk>/', ConversationDetailView.as_view(), name='conversation-detail'),
     
-    # AI Chat endpoint
-    path('chat/ai/', AIChatView.as_view(), name='ai-chat'),
+    # AI Chat endpoint; the async view needs an ASGI server
+    path(
+        'chat/ai/',
+        (AsyncAIChatView if getattr(settings, 'CHAT_AI_ASYNC', False) else AIChatView).as_view(),
+        name='ai-chat'
+    ),
     
     # User summary endpoints
     path('summaries/', UserSummaryListCreateView.as_view(), name='summary-list-create'),
@@ -1,16 +1,19 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import activate
-from rest_framework import generics, permissions, status
+from rest_framework import exceptions, generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
 from rest_framework import permissions
 from django.core.exceptions import ValidationError
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.contrib.auth.password_validation import validate_password
 
 from .models import UserProfile, ChatMessage, Conversation, UserSummary
@@ -19,17 +22,38 @@ from .serializers import (
     UserProfileSerializer, 
     RegisterSerializer, 
     ChatMessageSerializer, 
+    ConversationListSerializer,
     ConversationSerializer, 
-    UserSummarySerializer
+    UserSummarySerializer,
+    MessageImportSerializer,
+    conversation_messages_queryset
 )
+from .counters import record_new_message
+from .write_queue import run_write
+from .authentication import add_user_claims, load_full_user
 from .custom_serializers import EmailTokenObtainPairSerializer
+from .tokens import RefreshToken
+from .pagination import (
+    MessageCursorPagination,
+    ConversationCursorPagination,
+    SummaryCursorPagination,
+    SearchCursorPagination
+)
+from . import importer, search, upstream
+from .ai_chat import ChatTurn
+from .deletion import delete_conversation, visible_messages
+from .export import EXPORT_FORMATS, export_stream
+from .language import resolve_language
+from .response_cache import CachedListMixin
+from .streaming import EventStreamRenderer, achat_events, chat_events, event_stream_response, wants_stream
 from .throttling import (
     AIChatRateThrottle,
     AuthRateThrottle,
     ProfileUpdateRateThrottle,
     ChatSummaryRateThrottle,
     BurstRateThrottle,
-    SustainedRateThrottle
+    BurstSustainedRateThrottle,
+    ExportRateThrottle
 )
 
 import os
@@ -50,18 +74,8 @@ class UserLoginRateThrottle(AuthRateThrottle):
 
 # Language middleware
 def get_user_language(request):
-    """Get user language from request header or user profile"""
-    if request.user.is_authenticated:
-        try:
-            return request.user.profile.language_preference
-        except UserProfile.DoesNotExist:
-            pass
-    
-    # Check header
-    lang_header = request.META.get('HTTP_ACCEPT_LANGUAGE', 'en')
-    if lang_header.startswith('ar'):
-        return 'ar'
-    return 'en'
+    """Get user language from user profile or request header"""
+    return resolve_language(request)
 
 # Authentication views
 class RegisterView(generics.CreateAPIView):
@@ -80,7 +94,7 @@ class RegisterView(generics.CreateAPIView):
         activate(language)
         
         # Generate tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = add_user_claims(RefreshToken.for_user(user), user)
         
         return Response({
             'refresh': str(refresh),
@@ -94,29 +108,26 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = EmailTokenObtainPairSerializer
     
     def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-        
-        if response.status_code == 200:
-            # Get user and activate their language
-            email = request.data.get('email')
-            try:
-                user = User.objects.get(email=email)
-                try:
-                    profile = UserProfile.objects.get(user=user)
-                    language = profile.language_preference
-                    activate(language)
-                    
-                    # Add user data to response
-                    response.data['user'] = UserSerializer(user).data
-                    response.data['language'] = language
-                    response.data['message'] = _('Login successful')
-                    
-                except UserProfile.DoesNotExist:
-                    # Create profile with default language if it doesn't exist
-                    UserProfile.objects.create(user=user, fullname=email.split('@')[0], language_preference='en')
-                    
-            except User.DoesNotExist:
-                pass
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        response = Response(serializer.validated_data, status=status.HTTP_200_OK)
+        
+        # The serializer already loaded the user and profile
+        user, profile = serializer.user, serializer.profile
+        if profile is None:
+            # Create profile with default language if it doesn't exist
+            UserProfile.objects.create(user=user, fullname=user.email.split('@')[0], language_preference='en')
+        else:
+            language = profile.language_preference
+            activate(language)
+            
+            # Add user data to response
+            response.data['user'] = UserSerializer(user).data
+            response.data['language'] = language
+            response.data['message'] = _('Login successful')
                 
         return response
 
@@ -128,6 +139,9 @@ class LogoutView(APIView):
             refresh_token = request.data["refresh"]
             token = RefreshToken(refresh_token)
             token.blacklist()
+            # The access token used for this request stops working too
+            if hasattr(request.auth, 'blacklist'):
+                request.auth.blacklist()
             return Response({"message": _("Logout successful")}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -139,7 +153,7 @@ class UserProfileDetailView(APIView):
     
     def get(self, request):
         """Get the user's profile information"""
-        user = request.user
+        user = load_full_user(request.user)
         try:
             profile = UserProfile.objects.get(user=user)
             
@@ -165,7 +179,7 @@ class UserProfileDetailView(APIView):
     
     def patch(self, request):
         """Update the user's profile information"""
-        user = request.user
+        user = load_full_user(request.user)
         
         # Get user language and activate it
         language = get_user_language(request)
@@ -280,7 +294,8 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
 class ChatMessageListCreateView(generics.ListCreateAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = ChatMessageSerializer
-    throttle_classes = [BurstRateThrottle, SustainedRateThrottle]
+    pagination_class = MessageCursorPagination
+    throttle_classes = [BurstSustainedRateThrottle]
     
     def get_queryset(self):
         # Get user's language from profile
@@ -288,7 +303,9 @@ class ChatMessageListCreateView(generics.ListCreateAPIView):
         activate(language)
         
         # Filter messages by user and optionally by language
-        queryset = ChatMessage.objects.filter(user=self.request.user)
+        queryset = visible_messages(
+            ChatMessage.objects.filter(user=self.request.user)
+        ).select_related('user')
         lang_filter = self.request.query_params.get('language')
         if lang_filter:
             queryset = queryset.filter(language=lang_filter)
@@ -297,16 +314,176 @@ class ChatMessageListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         # Set user and language automatically
         language = get_user_language(self.request)
-        serializer.save(
-            user=self.request.user,
-            language=language
+        
+        def write():
+            message = serializer.save(
+                user=self.request.user,
+                language=language
+            )
+            record_new_message(message)
+        
+        run_write(write)
+
+class ChatMessageSearchView(APIView):
+    """Full-text search over the user's messages and conversation titles"""
+    permission_classes = (permissions.IsAuthenticated,)
+    throttle_classes = [BurstSustainedRateThrottle]
+    
+    def get(self, request):
+        language = get_user_language(request)
+        activate(language)
+        
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'detail': _('Search query is required.')},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not search.is_available():
+            return Response(
+                {'detail': _('Search is not available.')},
+                status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+        
+        lang_filter = request.query_params.get('language')
+        
+        def run_search(limit, after):
+            return search.search_messages(
+                request.user.id, query, limit, after=after, language=lang_filter
+            )
+        
+        paginator = SearchCursorPagination()
+        rows = paginator.paginate_queryset(run_search, request, view=self)
+        
+        # Load the matched messages in one query, keeping the ranking order
+        # Matches in soft-deleted conversations are dropped until their purge
+        messages = visible_messages(ChatMessage.objects.all()).select_related('user', 'conversation').in_bulk(
+            [row[0] for row in rows]
+        )
+        results = []
+        for message_id, score in rows:
+            message = messages.get(message_id)
+            if message is None:
+                continue
+            data = ChatMessageSerializer(message).data
+            data['conversation_id'] = message.conversation_id
+            data['conversation_title'] = message.conversation.title if message.conversation else None
+            data['highlight'] = search.highlight(message.content, query)
+            data['score'] = score
+            results.append(data)
+        return paginator.get_paginated_response(results)
+
+class ChatHistoryExportView(APIView):
+    """Stream the user's conversations and messages as NDJSON or CSV"""
+    permission_classes = (permissions.IsAuthenticated,)
+    throttle_classes = [ExportRateThrottle]
+    
+    CONTENT_TYPES = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+    
+    def get(self, request):
+        language = get_user_language(request)
+        activate(language)
+        
+        export_format = request.query_params.get('type', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'detail': _('Export type must be one of: %(types)s.') % {'types': ', '.join(EXPORT_FORMATS)}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        compress = request.query_params.get('compress') == 'gzip'
+        
+        # Staff (support) may export another user's history
+        user_id = request.user.id
+        if request.query_params.get('user_id') and request.user.is_staff:
+            try:
+                user_id = User.objects.only('id').get(id=request.query_params['user_id']).id
+            except (User.DoesNotExist, ValueError):
+                return Response(
+                    {'detail': _('User not found.')},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+        
+        filename = f'chat-history-{user_id}.{export_format}'
+        if compress:
+            response = StreamingHttpResponse(
+                export_stream(user_id, export_format, compress=True),
+                content_type='application/gzip'
+            )
+            filename += '.gz'
+        else:
+            response = StreamingHttpResponse(
+                export_stream(user_id, export_format),
+                content_type=f'{self.CONTENT_TYPES[export_format]}; charset=utf-8'
+            )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class ChatMessageImportView(APIView):
+    """
+    Import a conversation's history from another chat tool in one request.
+    Valid messages are stored with their original timestamps; invalid ones
+    are skipped and reported by their index in the payload.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    throttle_classes = [BurstSustainedRateThrottle]
+    
+    def post(self, request):
+        language = get_user_language(request)
+        activate(language)
+        
+        serializer = MessageImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        conversation = None
+        if 'conversation_id' in data:
+            conversation = Conversation.objects.filter(
+                user=request.user, pk=data['conversation_id'], deleted_at__isnull=True
+            ).first()
+            if conversation is None:
+                return Response(
+                    {'detail': _('Conversation not found.')},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+        
+        messages, errors = importer.validate_messages(
+            data['messages'], data.get('language', language)
         )
+        if not messages:
+            return Response({
+                'detail': _('No valid messages to import.'),
+                'imported_count': 0,
+                'errors': errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        def write():
+            target = conversation or Conversation.objects.create(
+                user=request.user,
+                title=data['title'],
+                language=data.get('language', language)
+            )
+            return target, importer.import_messages(request.user, target, messages)
+        
+        conversation, imported_count = run_write(write)
+        conversation.refresh_from_db()
+        
+        return Response({
+            'conversation': ConversationListSerializer(conversation).data,
+            'imported_count': imported_count,
+            'error_count': len(errors),
+            'errors': errors
+        }, status=status.HTTP_201_CREATED)
 
 # Conversation views
-class ConversationListCreateView(generics.ListCreateAPIView):
+class ConversationListCreateView(CachedListMixin, generics.ListCreateAPIView):
     permission_classes = (permissions.IsAuthenticated,)
-    serializer_class = ConversationSerializer
-    throttle_classes = [BurstRateThrottle, SustainedRateThrottle]
+    serializer_class = ConversationListSerializer
+    pagination_class = ConversationCursorPagination
+    throttle_classes = [BurstSustainedRateThrottle]
+    cache_endpoint = 'conversations'
     
     def get_queryset(self):
         # Get user's language from profile
@@ -314,7 +491,7 @@ class ConversationListCreateView(generics.ListCreateAPIView):
         activate(language)
         
         # Filter conversations by user and optionally by language
-        queryset = Conversation.objects.filter(user=self.request.user)
+        queryset = Conversation.objects.filter(user=self.request.user, deleted_at__isnull=True)
         lang_filter = self.request.query_params.get('language')
         if lang_filter:
             queryset = queryset.filter(language=lang_filter)
@@ -334,7 +511,13 @@ class ConversationDetailView(generics.RetrieveUpdateDestroyAPIView):
     throttle_classes = [BurstRateThrottle]
     
     def get_queryset(self):
-        return Conversation.objects.filter(user=self.request.user)
+        queryset = Conversation.objects.filter(user=self.request.user, deleted_at__isnull=True)
+        if self.request.method == 'GET':
+            # All messages are loaded with one prefetch query, users joined in
+            queryset = queryset.prefetch_related(
+                Prefetch('messages', queryset=conversation_messages_queryset())
+            )
+        return queryset
     
     def get(self, request, *args, **kwargs):
         # Activate user's language preference
@@ -350,17 +533,15 @@ class ConversationDetailView(generics.RetrieveUpdateDestroyAPIView):
         try:
             conversation = self.get_object()
             
-            # Delete all associated messages first
-            messages_count = ChatMessage.objects.filter(conversation=conversation).count()
-            ChatMessage.objects.filter(conversation=conversation).delete()
-            
-            # Then delete the conversation
-            conversation.delete()
+            # One set-based delete, or a soft delete plus a background purge
+            # for conversations too large to remove in one transaction
+            messages_count, purge_pending = delete_conversation(conversation)
             
             return Response({
                 'success': True,
                 'message': _('Conversation and its messages deleted successfully'),
-                'deleted_messages_count': messages_count
+                'deleted_messages_count': messages_count,
+                'purge_pending': purge_pending
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -372,10 +553,12 @@ class ConversationDetailView(generics.RetrieveUpdateDestroyAPIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 # User Summary views
-class UserSummaryListCreateView(generics.ListCreateAPIView):
+class UserSummaryListCreateView(CachedListMixin, generics.ListCreateAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = UserSummarySerializer
-    throttle_classes = [BurstRateThrottle, SustainedRateThrottle]
+    pagination_class = SummaryCursorPagination
+    throttle_classes = [BurstSustainedRateThrottle]
+    cache_endpoint = 'summaries'
     
     def get_queryset(self):
         # Get user's language from profile
@@ -383,7 +566,7 @@ class UserSummaryListCreateView(generics.ListCreateAPIView):
         activate(language)
         
         # Filter summaries by user and optionally by language
-        queryset = UserSummary.objects.filter(user=self.request.user)
+        queryset = UserSummary.objects.filter(user=self.request.user).select_related('user')
         lang_filter = self.request.query_params.get('language')
         if lang_filter:
             queryset = queryset.filter(language=lang_filter)
@@ -455,387 +638,79 @@ class ChangePasswordView(APIView):
 class AIChatView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     throttle_classes = [AIChatRateThrottle]
+    # Accept: text/event-stream asks for a streamed answer
+    renderer_classes = APIView.renderer_classes + [EventStreamRenderer]
     
     def post(self, request):
         """Generate a response from the selected AI model and save the conversation"""
-        user = request.user
-        message_text = request.data.get('message', '')
-        conversation_id = request.data.get('conversation_id', None)
-        language = request.data.get('language', 'en')
-        model_id = request.data.get('model', 'lamini-t5')  # Default model
-        
-        # Define available models with their Hugging Face paths
-        AVAILABLE_MODELS = {
-            'lamini-t5': {
-                'path': 'MBZUAI/LaMini-Flan-T5-248M',
-                'params': {
-                    'max_length': 100,
-                    'temperature': 0.7,
-                    'top_p': 0.9,
-                    'do_sample': True
-                }
-            },
-            'deepseek': {
-                'path': 'deepseek-ai/deepseek-coder-1.3b-instruct',
-                'params': {
-                    'max_length': 100,
-                    'temperature': 0.7,
-                    'top_p': 0.9,
-                    'do_sample': True
-                }
-            },
-            'blenderbot-400M': {
-                'path': 'facebook/blenderbot-400M-distill',
-                'params': {
-                    'max_length': 100,
-                    'temperature': 0.7,
-                    'top_p': 0.9,
-                    'do_sample': True
-                }
-            }
-        }
-        
-        # Default responses for different languages
-        DEFAULT_RESPONSES = {
-            'en': {
-                'greeting': "Hello! I'm an AI assistant. How can I help you today?",
-                'fallback': "I'm sorry, I couldn't generate a proper response. Could you try asking something else?",
-                'understanding': "I'm sorry, I don't understand. Could you rephrase that?",
-                'error': "Sorry, there was an error processing your request. Please try again."
-            },
-            'ar': {
-                'greeting': "مرحبًا! أنا مساعد ذكاء اصطناعي. كيف يمكنني مساعدتك اليوم؟",
-                'fallback': "آسف، لم أتمكن من إنشاء استجابة مناسبة. هل يمكنك تجربة سؤال آخر؟",
-                'understanding': "آسف، لم أفهم. هل يمكنك إعادة صياغة ذلك؟",
-                'error': "عذرًا، حدث خطأ أثناء معالجة طلبك. يرجى المحاولة مرة أخرى."
-            }
-        }
-        
-        # Simulated responses for when the API is down
-        SIMULATED_RESPONSES = {
-            'en': {
-                'greeting': [
-                    "Hello! How can I assist you today?",
-                    "Hi there! What can I help you with?",
-                    "Greetings! How may I be of service?"
-                ],
-                'about': [
-                    "I'm an AI assistant designed to help answer your questions and provide information.",
-                    "I'm a language model trained to assist with various tasks and answer questions.",
-                    "I'm your AI assistant, ready to help with information and tasks."
-                ],
-                'general': [
-                    "That's an interesting question. Let me think about that...",
-                    "I understand what you're asking. Here's what I know about that topic...",
-                    "Thanks for your question. I'd be happy to help with that.",
-                    "I appreciate your question. Let me provide some information on that.",
-                    "That's a good point. Here's my perspective on that matter."
-                ]
-            },
-            'ar': {
-                'greeting': [
-                    "مرحبًا! كيف يمكنني مساعدتك اليوم؟",
-                    "أهلاً! بماذا يمكنني مساعدتك؟",
-                    "تحياتي! كيف يمكنني خدمتك؟"
-                ],
-                'about': [
-                    "أنا مساعد ذكاء اصطناعي مصمم للمساعدة في الإجابة على أسئلتك وتقديم المعلومات.",
-                    "أنا نموذج لغوي تم تدريبه للمساعدة في مختلف المهام والإجابة على الأسئلة.",
-                    "أنا مساعدك الذكي، جاهز للمساعدة في المعلومات والمهام."
-                ],
-                'general': [
-                    "هذا سؤال مثير للاهتمام. دعني أفكر في ذلك...",
-                    "أفهم ما تسأل عنه. إليك ما أعرفه عن هذا الموضوع...",
-                    "شكرًا على سؤالك. يسعدني المساعدة في ذلك.",
-                    "أقدر سؤالك. دعني أقدم بعض المعلومات حول ذلك.",
-                    "هذه نقطة جيدة. إليك وجهة نظري في هذه المسألة."
-                ]
-            }
-        }
-        
-        # Special handling for Arabic greetings - models often struggle with these
-        def get_simulated_response(message, lang='en'):
-            """Generate a simulated response when the API is down"""
-            import random
-            
-            # Check for greetings
-            greeting_words = {
-                'en': ['hello', 'hi', 'hey', 'greetings', 'good morning', 'good afternoon'],
-                'ar': ['مرحبا', 'أهلا', 'السلام عليكم', 'صباح الخير', 'مساء الخير']
-            }
-            
-            # Check for questions about identity
-            identity_words = {
-                'en': ['who are you', 'what are you', 'tell me about yourself', 'your name'],
-                'ar': ['من أنت', 'ما أنت', 'أخبرني عن نفسك', 'ما هو اسمك']
-            }
-            
-            message_lower = message.lower()
-            
-            # Select response category
-            if any(word in message_lower for word in greeting_words.get(lang, greeting_words['en'])):
-                category = 'greeting'
-            elif any(word in message_lower for word in identity_words.get(lang, identity_words['en'])):
-                category = 'about'
-            else:
-                category = 'general'
-            
-            # Get responses for the selected language and category
-            responses = SIMULATED_RESPONSES.get(lang, SIMULATED_RESPONSES['en']).get(category, SIMULATED_RESPONSES['en']['general'])
-            
-            # Return a random response from the category
-            return random.choice(responses)
-        
-        if not message_text:
-            return Response(
-                {'detail': 'Message text is required.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-            
-        # Check if model is valid
-        if model_id not in AVAILABLE_MODELS:
-            return Response(
-                {'detail': f'Invalid model. Available models: {", ".join(AVAILABLE_MODELS.keys())}'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Get model configuration
-        model_config = AVAILABLE_MODELS[model_id]
-        
-        # Get or create conversation
-        if conversation_id:
-            try:
-                conversation = Conversation.objects.get(id=conversation_id, user=user)
-            except Conversation.DoesNotExist:
-                return Response(
-                    {'detail': 'Conversation not found.'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-        else:
-            # Create a new conversation
-            conversation = Conversation.objects.create(
-                user=user,
-                title=message_text[:50] + '...' if len(message_text) > 50 else message_text,
-                language=language
-            )
-        
-        # Save user message
-        user_message = ChatMessage.objects.create(
-            user=user,
-            content=message_text,
-            language=language,
-            is_user_message=True,
-            conversation=conversation  # Associate with conversation
-        )
-        
-        # Call Hugging Face API
-        import requests
-        import json
-        from django.conf import settings
-            
-        # Prepare headers based on the model
-        if model_id == 'deepseek':
-            API_URL = f"https://api-inference.huggingface.co/models/{model_config['path']}"
-            headers = {
-                "Authorization": f"Bearer {settings.DEEPSEEK_API_KEY}",
-                "Content-Type": "application/json"
-            }
-        else:
-            API_URL = f"https://api-inference.huggingface.co/models/{model_config['path']}"
-            headers = {
-                "Authorization": f"Bearer {settings.HUGGINGFACE_API_KEY}",
-                "Content-Type": "application/json"
-            }
-        
-        # Prepare payload based on model
-        if model_id == 'deepseek':
-            # For deepseek, we need to get conversation history
-            conversation_messages = ChatMessage.objects.filter(
-                user=user, 
-                conversation=conversation
-            ).order_by('created_at')
-            # Take last 5 messages to avoid context length issues
-            recent_messages = conversation_messages.order_by('-created_at')[:5]
-            recent_messages = sorted(recent_messages, key=lambda x: x.created_at)
-            
-            # Use appropriate language markers based on the language
-            user_prefix = "المستخدم" if language == 'ar' else "User"
-            bot_prefix = "الروبوت" if language == 'ar' else "Bot"
-            
-            conversation_history = "\n".join([
-                f"{user_prefix if msg.is_user_message else bot_prefix}: {msg.content}" 
-                for msg in recent_messages
-            ])
-            
-            payload = {
-                "inputs": f"{conversation_history}\n{user_prefix}: {message_text}\n{bot_prefix}:",
-                "parameters": model_config['params']
-            }
-        else:
-            # For other models, just send the message
-            payload = {
-                "inputs": message_text,
-                "parameters": model_config['params']
-            }
-        
+        turn = ChatTurn.start(request.user, request.data)
+        if wants_stream(request):
+            # Sent as server-sent events while the model writes its answer
+            events = upstream.huggingface.stream(turn.model_path, headers=turn.headers, json=turn.stream_payload)
+            return event_stream_response(chat_events(turn, events))
         try:
-            response = requests.post(API_URL, headers=headers, json=payload)
-            
-            if response.status_code != 200:
-                # Log the error
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f"Hugging Face API error: {response.status_code} - {response.text[:200]}")
-                
-                # Return a fallback response instead of an error
-                # This way the chat can continue even if the API is down
-                ai_response = get_simulated_response(message_text, language)
-                
-                # Save the fallback response
-                ai_message = ChatMessage.objects.create(
-                    user=user,
-                    content=ai_response,
-                    language=language,
-                    is_user_message=False,
-                    conversation=conversation
-                )
-                
-                # Update conversation's last_updated
-                conversation.save()
-                
-                return Response({
-                    'conversation_id': conversation.id,
-                    'model': model_id,
-                    'user_message': {
-                        'id': user_message.id,
-                        'content': user_message.content,
-                        'created_at': user_message.created_at
-                    },
-                    'ai_response': {
-                        'id': ai_message.id,
-                        'content': ai_message.content,
-                        'created_at': ai_message.created_at
-                    }
-                })
-            
-            # Check if this is a greeting in Arabic
-            arabic_greetings = ['مرحبا', 'السلام عليكم', 'أهلا', 'صباح الخير', 'مساء الخير', 'كيف حالك', 'من أنت']
-            is_arabic_greeting = language == 'ar' and any(greeting in message_text.lower() for greeting in arabic_greetings)
-            
-            # Extract AI response based on model
-            result = response.json()
-            
-            # Special handling for Arabic greetings - models often struggle with these
-            if is_arabic_greeting:
-                # For greeting messages in Arabic, use our predefined responses
-                if 'من أنت' in message_text.lower():
-                    ai_response = "أنا مساعد ذكاء اصطناعي مصمم للمساعدة في الإجابة على أسئلتك وتقديم المعلومات. كيف يمكنني مساعدتك اليوم؟"
-                elif any(greeting in message_text.lower() for greeting in ['كيف حالك', 'كيفك']):
-                    ai_response = "أنا بخير، شكراً على سؤالك! كيف يمكنني مساعدتك اليوم؟"
-                else:
-                    ai_response = DEFAULT_RESPONSES[language]['greeting']
-            elif model_id == 'lamini-t5':
-                # LaMini-T5 is better at handling different languages
-                ai_response = result[0].get('generated_text', '').strip()
-                # If response is empty, provide a fallback in the appropriate language
-                if not ai_response:
-                    ai_response = DEFAULT_RESPONSES[language]['fallback']
-            elif model_id == 'deepseek':
-                generated_text = result[0].get('generated_text', '').strip()
-                
-                # deepseek tends to return the conversation history
-                # We need to extract only the new response
-                
-                # First, check if our last message is in the response
-                last_message_marker = f"{user_prefix}: {message_text}"
-                if last_message_marker in generated_text:
-                    # Extract everything after the last occurrence of our message
-                    parts = generated_text.split(last_message_marker)
-                    ai_response = parts[-1].strip()
-                    
-                    # If the response is empty or just contains the user message again
-                    if not ai_response or f"{user_prefix}:" in ai_response:
-                        # Fallback to a simple response in the appropriate language
-                        ai_response = DEFAULT_RESPONSES[language]['fallback']
-                else:
-                    # If we can't find our message, just take the last line
-                    lines = [line for line in generated_text.split('\n') if line.strip() and not line.strip().startswith(f"{user_prefix}:")]
-                    if lines:
-                        ai_response = lines[-1]
-                    else:
-                        # Fallback response in the appropriate language
-                        ai_response = DEFAULT_RESPONSES[language]['understanding']
-                
-                # Clean up any remaining "Bot:" prefix
-                ai_response = ai_response.replace(f"{bot_prefix}:", '').strip()
-            else:  # blenderbot (keeping as fallback)
-                ai_response = result[0].get('generated_text', '')
-                # If response is empty, provide a fallback in the appropriate language
-                if not ai_response:
-                    ai_response = DEFAULT_RESPONSES[language]['fallback']
-            
-            # Save AI response
-            ai_message = ChatMessage.objects.create(
-                user=user,
-                content=ai_response,
-                language=language,
-                is_user_message=False,
-                conversation=conversation  # Associate with conversation
-            )
-            
-            # Update conversation's last_updated
-            conversation.save()
-            
-            return Response({
-                'conversation_id': conversation.id,
-                'model': model_id,
-                'user_message': {
-                    'id': user_message.id,
-                    'content': user_message.content,
-                    'created_at': user_message.created_at
-                },
-                'ai_response': {
-                    'id': ai_message.id,
-                    'content': ai_message.content,
-                    'created_at': ai_message.created_at
-                }
-            })
-            
+            # Raises CircuitOpen, without waiting on the model, during an outage
+            turn.admit()
+            response = turn.call()
         except Exception as e:
-            # Log the error
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error calling Hugging Face API: {str(e)}")
-            
-            # Return a simulated response
-            ai_response = get_simulated_response(message_text, language)
-            
-            # Save the simulated response
-            ai_message = ChatMessage.objects.create(
-                user=user,
-                content=ai_response,
-                language=language,
-                is_user_message=False,
-                conversation=conversation
-            )
-            
-            # Update conversation's last_updated
-            conversation.save()
-            
-            return Response({
-                'conversation_id': conversation.id,
-                'model': model_id,
-                'user_message': {
-                    'id': user_message.id,
-                    'content': user_message.content,
-                    'created_at': user_message.created_at
-                },
-                'ai_response': {
-                    'id': ai_message.id,
-                    'content': ai_message.content,
-                    'created_at': ai_message.created_at
-                }
-            })
+            # Return a simulated response, so the chat can continue
+            # even if the API is down
+            return Response(turn.fail(e))
+        return Response(turn.finish(response))
+
+
+class AsyncAIChatView(AIChatView):
+    """
+    AIChatView for ASGI servers, used when CHAT_AI_ASYNC is on. The model
+    call is awaited instead of blocking a thread, so one worker process can
+    hold hundreds of chat turns at once. Authentication, throttling and the
+    database writes still run in sync_to_async.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method != 'POST':
+            # OPTIONS and 405 responses, as APIView gives them
+            return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        self.response = await self.post(request, *args, **kwargs)
+        return self.response
+
+    async def post(self, request, *args, **kwargs):
+        """Generate a response from the selected AI model and save the conversation"""
+        # The sync steps of APIView.dispatch() run in two trips to a
+        # thread: everything before the model call, and everything after
+        turn = await sync_to_async(self._start_turn)(request, *args, **kwargs)
+        if isinstance(turn, Response):
+            return turn
+        if wants_stream(request):
+            # An async iterator, which the ASGI handler sends as it goes
+            events = upstream.huggingface.astream(turn.model_path, headers=turn.headers, json=turn.stream_payload)
+            return self.finalize_response(request, event_stream_response(achat_events(turn, events)), *args, **kwargs)
+        try:
+            await sync_to_async(turn.admit)()
+            outcome = await turn.acall()
+        except Exception as e:
+            outcome = e
+        return await sync_to_async(self._finish_turn)(request, turn, outcome, *args, **kwargs)
+
+    def _start_turn(self, request, *args, **kwargs):
+        try:
+            self.initial(request, *args, **kwargs)
+            return ChatTurn.start(request.user, request.data)
+        except Exception as exc:
+            return self.finalize_response(request, self.handle_exception(exc), *args, **kwargs)
+
+    def _finish_turn(self, request, turn, outcome, *args, **kwargs):
+        try:
+            # A simulated response if the model could not be reached
+            response = Response(turn.fail(outcome) if isinstance(outcome, Exception) else turn.finish(outcome))
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        return self.finalize_response(request, response, *args, **kwargs)
 
 class APIKeyTestView(APIView):
     """Test endpoint to verify API keys are working"""
@@ -876,7 +751,7 @@ class ChatSummaryView(APIView):
         max_messages = int(request.data.get('max_messages', 50))  # Limit number of messages to summarize
         
         # Get user's chat messages
-        messages = ChatMessage.objects.filter(user=user).order_by('-created_at')[:max_messages]
+        messages = visible_messages(ChatMessage.objects.filter(user=user)).order_by('-created_at')[:max_messages]
         
         if not messages:
             return Response({
@@ -914,9 +789,6 @@ class ChatSummaryView(APIView):
                 })
             
             # Call DeepSeek API for intelligent summarization
-            import requests
-            
-            API_URL = "https://api.deepseek.com/v1/chat/completions"
             headers = {
                 "Authorization": f"Bearer {os.environ.get('DEEPSEEK_API_KEY')}",
                 "Content-Type": "application/json"
@@ -978,7 +850,7 @@ Format your response with:
                 "max_tokens": 1000
             }
             
-            response = requests.post(API_URL, headers=headers, json=payload)
+            response = upstream.deepseek.post('v1/chat/completions', headers=headers, json=payload)
             
             if response.status_code == 200:
                 result = response.json()
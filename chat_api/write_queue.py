@@ -0,0 +1,123 @@
+"""
+Optional single-writer queue for SQLite.
+
+SQLite allows one writer at a time. With several threads each committing
+their own tiny transaction, most of the time goes into fighting over the
+write lock and syncing the WAL once per message. When
+settings.CHAT_WRITE_COALESCING is on, chat writes from every thread in the
+process are handed to one writer thread instead. It groups whatever is
+queued into a short transaction, each write in its own savepoint, and
+resolves the callers' futures once the batch has committed. Callers block
+on the future, so the request code and API responses are unchanged.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class WriteCoalescer:
+    """Funnels write callables through one thread in batched transactions"""
+
+    def __init__(self, batch_size=64, max_wait=0.002):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)` and return a Future for its result"""
+        future = Future()
+        self._ensure_started().put((future, fn, args, kwargs))
+        return future
+
+    def _ensure_started(self):
+        # A forked worker inherits the object but not the thread, so the
+        # writer is (re)started lazily in the process that uses it
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return self._queue
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,), name='chat-write-coalescer', daemon=True
+                )
+                self._pid = os.getpid()
+                self._thread.start()
+        return self._queue
+
+    def _run(self, pending):
+        try:
+            while True:
+                batch = [pending.get()]
+                deadline = time.monotonic() + self.max_wait
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(pending.get(timeout=max(deadline - time.monotonic(), 0)))
+                    except queue.Empty:
+                        break
+                close_old_connections()
+                self._write_batch(batch)
+        finally:
+            connections.close_all()
+
+    def _write_batch(self, batch):
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for future, fn, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        outcomes.append(None)
+                        continue
+                    try:
+                        # A failing write only rolls back its own savepoint
+                        with transaction.atomic():
+                            outcomes.append((True, fn(*args, **kwargs)))
+                    except Exception as e:
+                        outcomes.append((False, e))
+        except Exception as e:
+            logger.error(f"Write batch of {len(batch)} failed to commit: {str(e)}")
+            for future, *_ in batch:
+                if future.running():
+                    future.set_exception(e)
+            return
+
+        for (future, *_), outcome in zip(batch, outcomes):
+            if outcome is None:
+                continue
+            succeeded, value = outcome
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+coalescer = WriteCoalescer(
+    batch_size=getattr(settings, 'CHAT_WRITE_BATCH_SIZE', 64),
+    max_wait=getattr(settings, 'CHAT_WRITE_BATCH_WAIT_MS', 2) / 1000,
+)
+
+
+def run_write(fn, *args, **kwargs):
+    """
+    Run a write callable atomically and return its result.
+
+    Goes through the shared writer when coalescing is enabled, otherwise
+    (or when the caller is already inside a transaction, whose atomicity
+    must be preserved) it runs inline in its own transaction.
+    """
+    if not getattr(settings, 'CHAT_WRITE_COALESCING', False) or connection.in_atomic_block:
+        with transaction.atomic():
+            return fn(*args, **kwargs)
+    return coalescer.submit(fn, *args, **kwargs).result(
+        timeout=getattr(settings, 'CHAT_WRITE_TIMEOUT', 30)
+    )
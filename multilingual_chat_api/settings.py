@@ -94,11 +94,53 @@ WSGI_APPLICATION = "multilingual_chat_api.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "ENGINE": os.environ.get('DATABASE_ENGINE', "django.db.backends.sqlite3"),
+        "NAME": os.environ.get('DATABASE_NAME', BASE_DIR / "db.sqlite3"),
+        # Keep connections open between requests; health checks replace
+        # connections that went away instead of failing the request
+        "CONN_MAX_AGE": int(os.environ.get('DATABASE_CONN_MAX_AGE', 600)),
+        "CONN_HEALTH_CHECKS": os.environ.get('DATABASE_CONN_HEALTH_CHECKS', 'True') == 'True',
     }
 }
 
+# SQLite connection tuning, applied by chat_api.db on every new connection.
+# Set a value to an empty string to leave SQLite's default in place.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'),
+    'mmap_size': os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+    'cache_size': os.environ.get('SQLITE_CACHE_SIZE', '-64000'),  # negative means KiB
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
+# Funnel chat message writes from all threads of a process through one
+# writer thread that commits them in small batches (see chat_api.write_queue)
+CHAT_WRITE_COALESCING = os.environ.get('CHAT_WRITE_COALESCING', 'False') == 'True'
+CHAT_WRITE_BATCH_SIZE = int(os.environ.get('CHAT_WRITE_BATCH_SIZE', 64))
+CHAT_WRITE_BATCH_WAIT_MS = float(os.environ.get('CHAT_WRITE_BATCH_WAIT_MS', 2))
+CHAT_WRITE_TIMEOUT = float(os.environ.get('CHAT_WRITE_TIMEOUT', 30))
+
+# Bulk import (POST /api/messages/import/)
+CHAT_IMPORT_MAX_MESSAGES = int(os.environ.get('CHAT_IMPORT_MAX_MESSAGES', 10000))
+CHAT_IMPORT_BATCH_SIZE = int(os.environ.get('CHAT_IMPORT_BATCH_SIZE', 500))
+
+# Conversations with more messages than this are soft-deleted and purged
+# in the background in short batches (see chat_api.deletion)
+CHAT_DELETE_PURGE_THRESHOLD = int(os.environ.get('CHAT_DELETE_PURGE_THRESHOLD', 5000))
+CHAT_PURGE_BATCH_SIZE = int(os.environ.get('CHAT_PURGE_BATCH_SIZE', 500))
+CHAT_PURGE_PAUSE_MS = float(os.environ.get('CHAT_PURGE_PAUSE_MS', 20))
+CHAT_PURGE_IN_BACKGROUND = os.environ.get('CHAT_PURGE_IN_BACKGROUND', 'True') == 'True'
+
+# Rendered conversation and summary lists are cached per user and dropped
+# whenever that user's data changes (see chat_api.response_cache)
+CHAT_RESPONSE_CACHE = os.environ.get('CHAT_RESPONSE_CACHE', 'True') == 'True'
+CHAT_RESPONSE_CACHE_TIMEOUT = int(os.environ.get('CHAT_RESPONSE_CACHE_TIMEOUT', 300))
+
+# Seconds a user's profile language stays in the shared cache; entries are
+# dropped on every profile save (see chat_api.language)
+CHAT_LANGUAGE_CACHE_TIMEOUT = int(os.environ.get('CHAT_LANGUAGE_CACHE_TIMEOUT', 24 * 60 * 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -148,17 +190,60 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Cache shared by all worker processes; it holds the throttling counters.
+# Redis when REDIS_URL is set (as in docker-compose), otherwise a SQLite
+# file next to the project (see chat_api.cache)
+REDIS_URL = os.environ.get('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'chat_api.cache.SQLiteCache',
+            'LOCATION': os.environ.get('CACHE_SQLITE_PATH', os.path.join(BASE_DIR, 'cache.sqlite3')),
+            'OPTIONS': {
+                'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 100000)),
+            },
+        }
+    }
+
+# Revoked token ids are kept in the shared cache until the tokens expire;
+# each process checks them through a Bloom filter synced at this interval
+JWT_REVOCATION_SYNC_INTERVAL = float(os.environ.get('JWT_REVOCATION_SYNC_INTERVAL', 1.0))
+JWT_REVOCATION_BLOOM_CAPACITY = int(os.environ.get('JWT_REVOCATION_BLOOM_CAPACITY', 100000))
+JWT_REVOCATION_BLOOM_ERROR_RATE = float(os.environ.get('JWT_REVOCATION_BLOOM_ERROR_RATE', 0.001))
+
+# Password checks run in a pool of this many threads per process (default:
+# one per CPU); last_login is written in batches at this interval (see
+# chat_api.login)
+LOGIN_HASH_WORKERS = int(os.environ.get('LOGIN_HASH_WORKERS', 0)) or None
+LOGIN_LAST_LOGIN_FLUSH_SECONDS = float(os.environ.get('LOGIN_LAST_LOGIN_FLUSH_SECONDS', 5))
+
+# Build request.user from access token claims instead of loading it on every
+# request; tokens carry the username and language (see chat_api.authentication)
+JWT_STATELESS_USER = os.environ.get('JWT_STATELESS_USER', 'False') == 'True'
+# Seconds a stateless user's "still active" check is cached
+JWT_ACTIVE_CHECK_TIMEOUT = int(os.environ.get('JWT_ACTIVE_CHECK_TIMEOUT', 30))
+
+# Default page size of the cursor-paginated list endpoints
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 50))
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'chat_api.authentication.StatelessJWTAuthentication' if JWT_STATELESS_USER
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'chat_api.throttling.DefaultRateThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/day',  
@@ -168,7 +253,8 @@ REST_FRAMEWORK = {
         'profile_update': '30/day',  
         'chat_summary': '50/day',  
         'burst': '10/minute',  
-        'sustained': '1000/day'  
+        'sustained': '1000/day',
+        'export': '10/hour'
     }
 }
 
@@ -191,7 +277,9 @@ SIMPLE_JWT = {
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
     'USER_AUTHENTICATION_RULE': 'rest_framework_simplejwt.authentication.default_user_authentication_rule',
-    'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
+    # Revocable by jti without the token_blacklist app (see chat_api.revocation)
+    'AUTH_TOKEN_CLASSES': ('chat_api.tokens.AccessToken',),
+    'TOKEN_REFRESH_SERIALIZER': 'chat_api.tokens.RevocableTokenRefreshSerializer',
     'TOKEN_TYPE_CLAIM': 'token_type',
     'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
     'JTI_CLAIM': 'jti',
@@ -230,6 +318,13 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
     'access-control-allow-origin',
 ]
+# Let browser clients read the rate limit headers
+CORS_EXPOSE_HEADERS = [
+    'ratelimit-limit',
+    'ratelimit-remaining',
+    'ratelimit-reset',
+    'retry-after',
+]
 
 # Supported languages
 LANGUAGES = [
@@ -238,3 +333,47 @@ LANGUAGES = [
 ]
 
 # Hugging Face API settings
+HUGGINGFACE_API_URL = os.environ.get('HUGGINGFACE_API_URL', 'https://api-inference.huggingface.co')
+DEEPSEEK_API_URL = os.environ.get('DEEPSEEK_API_URL', 'https://api.deepseek.com')
+
+# Serve /api/chat/ai/ from an async view that awaits the model call, so one
+# worker holds many chat turns at once. Only useful under an ASGI server:
+# gunicorn -k uvicorn.workers.UvicornWorker multilingual_chat_api.asgi:application
+# There, also set CHAT_WRITE_COALESCING=True and DATABASE_CONN_MAX_AGE=0:
+# Django runs each request's sync code in a thread of its own
+CHAT_AI_ASYNC = os.environ.get('CHAT_AI_ASYNC', 'False') == 'True'
+
+# Calls to the inference providers reuse pooled keep-alive connections and
+# are retried with backoff (see chat_api.upstream). The deadline bounds a
+# call with all its retries; keep it below gunicorn's worker timeout (30
+# seconds by default)
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 3.05))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 20))
+UPSTREAM_DEADLINE = float(os.environ.get('UPSTREAM_DEADLINE', 25))
+UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', 2))
+UPSTREAM_BACKOFF = float(os.environ.get('UPSTREAM_BACKOFF', 0.5))
+UPSTREAM_BACKOFF_MAX = float(os.environ.get('UPSTREAM_BACKOFF_MAX', 4))
+UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 10))
+# Connections per event loop for the async view
+UPSTREAM_ASYNC_POOL_SIZE = int(os.environ.get('UPSTREAM_ASYNC_POOL_SIZE', 500))
+
+# Each AI chat model has a circuit breaker in the shared cache (see
+# chat_api.circuit). It opens when CIRCUIT_FAILURE_RATE of the calls in a
+# window fail or are slower than CIRCUIT_SLOW_CALL_SECONDS, then serves
+# the fallback reply at once for CIRCUIT_OPEN_SECONDS before letting
+# CIRCUIT_HALF_OPEN_PROBES calls through to test the model
+CIRCUIT_BREAKER = os.environ.get('CIRCUIT_BREAKER', 'True') == 'True'
+CIRCUIT_WINDOW_SECONDS = int(os.environ.get('CIRCUIT_WINDOW_SECONDS', 60))
+CIRCUIT_MIN_CALLS = int(os.environ.get('CIRCUIT_MIN_CALLS', 5))
+CIRCUIT_FAILURE_RATE = float(os.environ.get('CIRCUIT_FAILURE_RATE', 0.5))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.environ.get('CIRCUIT_SLOW_CALL_SECONDS', 10))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get('CIRCUIT_OPEN_SECONDS', 30))
+CIRCUIT_HALF_OPEN_PROBES = int(os.environ.get('CIRCUIT_HALF_OPEN_PROBES', 1))
+
+# Identical AI chat prompts in flight at once share one model call, unless
+# the model samples (see chat_api.coalesce); CHAT_COALESCE_SHARED also
+# shares them across workers through the shared cache, which followers
+# poll at this interval
+CHAT_COALESCE = os.environ.get('CHAT_COALESCE', 'False') == 'True'
+CHAT_COALESCE_SHARED = os.environ.get('CHAT_COALESCE_SHARED', 'False') == 'True'
+CHAT_COALESCE_POLL_MS = float(os.environ.get('CHAT_COALESCE_POLL_MS', 50))